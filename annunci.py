@@ -0,0 +1,227 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+from tombola_core import NOMI_PREMI, SMORFIA, frase_premio
+
+# --- CATALOGO ANNUNCI VOCALI ---
+# Numeri, titoli della smorfia e frasi dei premi si conoscono tutti prima della partita:
+# testo già ripulito per il JS e lingua risolta una volta sola, all'avvio del processo.
+# Le frasi non previste (es. quota e nomi dei vincitori di un premio) si risolvono al volo e si memorizzano.
+
+# --- LISTA LITFIBA (Per Audio Italiano) ---
+LITFIBA_HITS = [
+    "Eroi nel vento", "El Diablo", "Tex", "Lulù e Marlene",
+    "Gioconda", "Cane", "Fata Morgana", "Maudit",
+    "Il volo", "Re del silenzio", "Cangaceiro", "Spirito",
+    "Regina di Cuori", "Lacio Drom", "La Paura", "Proibito",
+    "Apapaia", "Paname", "Louisiana", "Vivere il mio tempo",
+    "Dimmi il nome", "Sotto il vulcano", "Ritmo 2", "Istanbul"
+]
+_LITFIBA_MINUSCOLO = tuple(hit.lower() for hit in LITFIBA_HITS)
+PAROLE_ITALIANE = ("attenzione", "ambo", "terno", "quaterna", "cinquina", "tombola", "vinto", "totali")
+# Fine partita, numero senza smorfia e l'apertura di ogni premio ("Attenzione! AMBO!"): dei premi
+# resta da sintetizzare al volo solo la parte con quota e vincitori
+FRASI_FISSE = ["Gioco Finito!", "Rock n Roll"] + [frase_premio(target) for target in NOMI_PREMI]
+
+
+def lingua_per(testo):
+    # Stessa regola di sempre: numeri, premi e titoli dei Litfiba in italiano, il resto in inglese
+    minuscolo = testo.lower()
+    if testo.isdigit(): return "it-IT"
+    if any(x in minuscolo for x in PAROLE_ITALIANE): return "it-IT"
+    if any(hit in minuscolo for hit in _LITFIBA_MINUSCOLO): return "it-IT"
+    return "en-GB"
+
+
+class Annuncio:
+    __slots__ = ("testo", "testo_js", "lingua")
+
+    def __init__(self, testo):
+        self.testo = testo
+        self.testo_js = testo.replace("'", "\\'")
+        self.lingua = lingua_per(testo)
+
+
+class CatalogoAnnunci:
+    def __init__(self, max_extra=512):
+        self._annunci = {}
+        for n in range(1, 91): self._aggiungi(str(n))
+        for titolo in SMORFIA.values(): self._aggiungi(titolo)
+        for frase in FRASI_FISSE: self._aggiungi(frase)
+        self.fissi = len(self._annunci)
+        self._extra = OrderedDict()
+        self._max_extra = max_extra
+        self._js = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _aggiungi(self, testo):
+        testo = testo.strip()
+        if testo: self._annunci[testo] = Annuncio(testo)
+
+    def annuncio(self, testo):
+        a = self._annunci.get(testo)
+        if a is not None: return a
+        with self._lock:
+            a = self._extra.get(testo)
+            if a is None:
+                a = Annuncio(testo)
+                self._extra[testo] = a
+                if len(self._extra) > self._max_extra: self._extra.popitem(last=False)
+            return a
+
+    def parti(self, messaggio):
+        # "12 || Smoke on the Water || Attenzione! ..." -> [Annuncio, ...]
+        return [self.annuncio(p.strip()) for p in messaggio.split("||") if p.strip()]
+
+    def js(self, messaggio):
+        # Corpo JS per speechSynthesis, uguale a quello di prima ma costruito una volta per messaggio
+        with self._lock:
+            codice = self._js.get(messaggio)
+            if codice is not None: return codice
+        codice = "window.speechSynthesis.cancel();"
+        for a in self.parti(messaggio):
+            codice += f"""
+        var u = new SpeechSynthesisUtterance('{a.testo_js}');
+        u.lang = '{a.lingua}';
+        u.rate = 1.0;
+        window.speechSynthesis.speak(u);
+        """
+        with self._lock:
+            self._js[messaggio] = codice
+            if len(self._js) > 64: self._js.popitem(last=False)
+        return codice
+
+    def fissi_tutti(self):
+        return list(self._annunci.values())
+
+
+# --- SINTESI VOCALE LATO SERVER (opzionale) ---
+# Un sintetizzatore è un oggetto con sintetizza(testo, lingua) -> bytes (mp3).
+
+class SintetizzatoreGTTS:
+    nome = "gtts"
+    LINGUE = {"it-IT": ("it", "it"), "en-GB": ("en", "co.uk")}
+
+    def __init__(self, lento=False):
+        from gtts import gTTS
+        self._gtts = gTTS
+        self.lento = lento
+
+    def sintetizza(self, testo, lingua):
+        import io
+        lang, tld = self.LINGUE.get(lingua, ("it", "it"))
+        buffer = io.BytesIO()
+        self._gtts(testo, lang=lang, tld=tld, slow=self.lento).write_to_fp(buffer)
+        return buffer.getvalue()
+
+
+class SintetizzatoreFinto:
+    # Offline e deterministico: per test e benchmark, conta quante clip produce davvero
+    nome = "finto"
+
+    def __init__(self):
+        self.chiamate = 0
+        self._lock = threading.Lock()
+
+    def sintetizza(self, testo, lingua):
+        with self._lock: self.chiamate += 1
+        return f"FAKE-MP3|{lingua}|{testo}".encode("utf-8")
+
+
+class CacheAudio:
+    # Una clip per (lingua, testo): in RAM e, se c'è una cartella, anche su disco tra un riavvio e l'altro
+    def __init__(self, sintetizzatore, cartella=None, max_memoria=512):
+        self.sintetizzatore = sintetizzatore
+        self.cartella = cartella
+        if cartella: os.makedirs(cartella, exist_ok=True)
+        self._memoria = OrderedDict()
+        self._max_memoria = max_memoria
+        self._lock = threading.Lock()
+        self._in_corso = {}     # chiave -> Lock: due sessioni non sintetizzano la stessa clip
+        self._stat = {"memoria": 0, "disco": 0, "sintetizzate": 0, "errori": 0}
+
+    @staticmethod
+    def chiave(testo, lingua):
+        return hashlib.sha1(f"{lingua}|{testo}".encode("utf-8")).hexdigest()
+
+    def _percorso(self, chiave):
+        return os.path.join(self.cartella, f"{chiave}.mp3") if self.cartella else None
+
+    def _in_memoria(self, chiave, clip):
+        with self._lock:
+            self._memoria[chiave] = clip
+            self._memoria.move_to_end(chiave)
+            if len(self._memoria) > self._max_memoria: self._memoria.popitem(last=False)
+
+    def clip(self, testo, lingua):
+        chiave = self.chiave(testo, lingua)
+        with self._lock:
+            clip = self._memoria.get(chiave)
+            if clip is not None:
+                self._memoria.move_to_end(chiave)
+                self._stat["memoria"] += 1
+                return clip
+            lock_chiave = self._in_corso.setdefault(chiave, threading.Lock())
+        with lock_chiave:
+            with self._lock:
+                clip = self._memoria.get(chiave)
+            if clip is not None: return clip
+            percorso = self._percorso(chiave)
+            if percorso and os.path.exists(percorso):
+                with open(percorso, "rb") as f: clip = f.read()
+                self._stat["disco"] += 1
+            else:
+                try:
+                    clip = self.sintetizzatore.sintetizza(testo, lingua)
+                except Exception:
+                    self._stat["errori"] += 1
+                    raise
+                self._stat["sintetizzate"] += 1
+                if percorso:
+                    # Scrittura atomica: un lettore non vede mai un mp3 a metà
+                    temporaneo = f"{percorso}.{threading.get_ident()}.tmp"
+                    with open(temporaneo, "wb") as f: f.write(clip)
+                    os.replace(temporaneo, percorso)
+            self._in_memoria(chiave, clip)
+        with self._lock:
+            self._in_corso.pop(chiave, None)
+        return clip
+
+    def clip_annuncio(self, annuncio):
+        return self.clip(annuncio.testo, annuncio.lingua)
+
+    def precarica(self, catalogo):
+        # Facoltativo (es. prima della serata): sintetizza tutto il catalogo fisso
+        for a in catalogo.fissi_tutti(): self.clip_annuncio(a)
+
+    def statistiche(self):
+        with self._lock:
+            s = dict(self._stat)
+            s["in_memoria"] = len(self._memoria)
+        s["sintetizzatore"] = self.sintetizzatore.nome
+        return s
+
+
+# --- ISTANZE DI PROCESSO ---
+SINTETIZZATORI = {"gtts": SintetizzatoreGTTS, "finto": SintetizzatoreFinto}
+
+_CATALOGO = None
+_CACHE_AUDIO = {}
+_LOCK = threading.Lock()
+
+def get_catalogo():
+    global _CATALOGO
+    with _LOCK:
+        if _CATALOGO is None: _CATALOGO = CatalogoAnnunci()
+        return _CATALOGO
+
+def get_cache_audio(sintetizzatore="gtts", cartella=".cache_audio"):
+    with _LOCK:
+        chiave = (sintetizzatore, cartella)
+        cache = _CACHE_AUDIO.get(chiave)
+        if cache is None:
+            cache = CacheAudio(SINTETIZZATORI[sintetizzatore](), cartella)
+            _CACHE_AUDIO[chiave] = cache
+        return cache
@@ -0,0 +1,205 @@
+import argparse
+import json
+import platform
+import random
+import subprocess
+import sys
+import time
+from datetime import datetime
+
+from tombola_core import get_info_economiche, controlla_vincite, get_smorfia_text
+from generatore_cartelle import GeneratoreCartelle
+from motore_vincite import MotoreVincite
+from cartelle import maschera_numeri
+from render_html import RenderTabellone, RenderCartelle
+from storage_tombola import crea_storage
+from formato_stanza import codifica_stanza, decodifica_stanza
+import metriche
+
+# --- BENCHMARK DEL CORE DI GIOCO ---
+# Uso: python benchmark_tombola.py --giocatori 2 40 1000 10000 --output bench.json
+#      python benchmark_tombola.py --confronta vecchio.json nuovo.json
+
+def riassunto(tempi):
+    ordinati = sorted(tempi)
+    if not ordinati: return {"n": 0}
+    def perc(p): return round(ordinati[min(len(ordinati) - 1, int(p * len(ordinati)))] * 1000, 4)
+    return {
+        "n": len(ordinati),
+        "media_ms": round(sum(ordinati) / len(ordinati) * 1000, 4),
+        "p50_ms": perc(0.50), "p95_ms": perc(0.95), "max_ms": round(ordinati[-1] * 1000, 4),
+        "tot_ms": round(sum(ordinati) * 1000, 3),
+    }
+
+def cronometra(funzione, *args):
+    inizio = time.perf_counter()
+    risultato = funzione(*args)
+    return time.perf_counter() - inizio, risultato
+
+
+def nuova_stanza(n_giocatori, rng, seed):
+    # Il primo giocatore ha sempre 6 cartelle: è quello usato per il render
+    conteggi = [6] + [rng.randint(1, 6) for _ in range(n_giocatori - 1)]
+    cartelle = GeneratoreCartelle.genera_lotto(sum(conteggi), seed=seed)
+    giocatori, pos = {}, 0
+    for i, quante in enumerate(conteggi):
+        giocatori[f"G{i:05d}"] = cartelle[pos:pos + quante]
+        pos += quante
+    numeri = list(range(1, 91)); rng.shuffle(numeri)
+    return {
+        "admin_pwd": "bench", "created_at": str(datetime.now()), "stato": "IN_CORSO", "audio_attivo": True,
+        "numeri_tabellone": numeri, "numeri_estratti": [], "ultimo_numero": None,
+        "messaggio_audio": "", "messaggio_toast": "", "giocatori": giocatori,
+        "classifica_vincite": {g: 0 for g in giocatori}, "obbiettivo_corrente": 2, "gioco_finito": False,
+        "totali": {"giocatori": len(giocatori), "cartelle": sum(conteggi)},
+    }
+
+
+# --- SCENARI ---
+def bench_generazione(n_cartelle):
+    t_loop, _ = cronometra(lambda: [GeneratoreCartelle.genera_matrice_3x9() for _ in range(n_cartelle)])
+    t_blocco, _ = cronometra(GeneratoreCartelle.genera_array, n_cartelle)
+    t_serie, _ = cronometra(GeneratoreCartelle.genera_serie_array, max(1, n_cartelle // 6))
+    return {
+        "cartelle": n_cartelle,
+        "genera_matrice_3x9_per_s": round(n_cartelle / t_loop),
+        "genera_array_per_s": round(n_cartelle / t_blocco),
+        "genera_serie_array_per_s": round(max(1, n_cartelle // 6) * 6 / t_serie),
+    }
+
+def bench_partita(n_giocatori, seed):
+    rng = random.Random(seed)
+    dati = nuova_stanza(n_giocatori, rng, seed)
+    # SQLite in memoria, senza cache: si misura il costo pieno di scrittura e lettura
+    db = crea_storage({"backend": "sqlite", "percorso": ":memory:", "cache_ttl": 0})
+    nome = f"BENCH{n_giocatori}"
+    db.salva(nome, dati)
+
+    t_indice, motore = cronometra(MotoreVincite, dati["giocatori"])
+    tabellone, cartelle_html = RenderTabellone(), RenderCartelle()
+    mie = next(iter(dati["giocatori"].values()))
+    tempi = {k: [] for k in ("controlla_vincite", "get_info_economiche", "db_salva", "db_carica",
+                             "render_tabellone", "render_cartelle_estrazione", "render_cartelle_rerun")}
+    premi = {}
+
+    while not dati["gioco_finito"] and dati["numeri_tabellone"]:
+        # Stessi passi di esegui_estrazione, cronometrando separatamente le fasi
+        n = dati["numeri_tabellone"].pop(0)
+        dati["numeri_estratti"].append(n)
+        dati["ultimo_numero"] = n
+        dati["messaggio_audio"] = f"{n} || {get_smorfia_text(n)}"
+        dati["messaggio_toast"] = ""
+        obbiettivo = dati["obbiettivo_corrente"]
+        t, _ = cronometra(controlla_vincite, dati, motore); tempi["controlla_vincite"].append(t)
+        if dati["obbiettivo_corrente"] != obbiettivo or dati["gioco_finito"]:
+            premi[str(obbiettivo)] = {"estrazione": len(dati["numeri_estratti"]), "vincitori": len(motore.vincitori(obbiettivo))}
+        t, _ = cronometra(get_info_economiche, dati); tempi["get_info_economiche"].append(t)
+        t, _ = cronometra(db.salva, nome, dati); tempi["db_salva"].append(t)
+        t, _ = cronometra(db.carica, nome); tempi["db_carica"].append(t)
+
+        maschera = maschera_numeri(dati["numeri_estratti"])
+        t, _ = cronometra(tabellone.html, maschera); tempi["render_tabellone"].append(t)
+        for chiave in ("render_cartelle_estrazione", "render_cartelle_rerun"):
+            t, _ = cronometra(lambda: [cartelle_html.html(m, i, maschera) for i, m in enumerate(mie)])
+            tempi[chiave].append(t)
+
+    t_enc, testo = cronometra(json.dumps, dati)
+    t_dec, _ = cronometra(json.loads, testo)
+    t_enc_b, binario = cronometra(codifica_stanza, dati)
+    t_dec_b, _ = cronometra(decodifica_stanza, binario)
+    return {
+        "giocatori": n_giocatori,
+        "cartelle": sum(len(c) for c in dati["giocatori"].values()),
+        "estrazioni": len(dati["numeri_estratti"]),
+        "premi": premi,
+        "indice_ms": round(t_indice * 1000, 3),
+        "per_estrazione": {k: riassunto(v) for k, v in tempi.items()},
+        "json": {"byte": len(testo.encode()), "encode_ms": round(t_enc * 1000, 3), "decode_ms": round(t_dec * 1000, 3)},
+        "binario": {"byte": len(binario), "encode_ms": round(t_enc_b * 1000, 3), "decode_ms": round(t_dec_b * 1000, 3)},
+    }
+
+
+MODULI_HEADLESS = ("tombola_core", "generatore_cartelle", "motore_vincite", "partita", "storage_tombola")
+MODULI_PESANTI = ("streamlit", "mysql", "numpy", "gtts", "sqlite3")
+
+def bench_import(ripetizioni=5):
+    # Avvio a freddo in un processo nuovo: tempo di import e dipendenze pesanti caricate per sbaglio
+    codice = (
+        "import sys, time, json; t = time.perf_counter(); import {m}; t = time.perf_counter() - t; "
+        "print(json.dumps([t, [p for p in %r if p in sys.modules]]))" % (MODULI_PESANTI,)
+    )
+    risultati = {}
+    for modulo in MODULI_HEADLESS:
+        tempi, pesanti = [], []
+        for _ in range(ripetizioni):
+            uscita = subprocess.run([sys.executable, "-c", codice.format(m=modulo)], capture_output=True, text=True, timeout=60)
+            t, pesanti = json.loads(uscita.stdout)
+            tempi.append(t)
+        risultati[modulo] = {"import_ms": round(sorted(tempi)[len(tempi) // 2] * 1000, 3), "pesanti": pesanti}
+    return risultati
+
+
+# --- CONFRONTO TRA DUE ESECUZIONI ---
+def metriche_piatte(risultati):
+    piatte = {}
+    for g, v in risultati.get("generazione", {}).items():
+        if g.endswith("_per_s"): piatte[f"generazione.{g}"] = v
+    for modulo, v in risultati.get("import", {}).items(): piatte[f"import.{modulo}.ms"] = v["import_ms"]
+    for scenario in risultati.get("scenari", []):
+        prefisso = f"{scenario['giocatori']}g"
+        for fase, stat in scenario["per_estrazione"].items():
+            if "media_ms" in stat: piatte[f"{prefisso}.{fase}.media_ms"] = stat["media_ms"]
+        for formato in ("json", "binario"):
+            for k in ("encode_ms", "decode_ms", "byte"):
+                if formato in scenario: piatte[f"{prefisso}.{formato}.{k}"] = scenario[formato][k]
+    return piatte
+
+def confronta(vecchio, nuovo):
+    a, b = metriche_piatte(vecchio), metriche_piatte(nuovo)
+    for chiave in sorted(set(a) & set(b)):
+        rapporto = b[chiave] / a[chiave] if a[chiave] else float("inf")
+        print(f"{chiave:60s} {a[chiave]:>12} -> {b[chiave]:>12}  x{rapporto:.2f}")
+
+
+def commit_corrente():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, timeout=5).stdout.strip() or None
+    except Exception:
+        return None
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark headless del core della Tombola")
+    parser.add_argument("--giocatori", type=int, nargs="+", default=[2, 40, 1000, 10000])
+    parser.add_argument("--cartelle-generazione", type=int, default=20000)
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="file JSON di output (default: stdout)")
+    parser.add_argument("--confronta", nargs=2, metavar=("VECCHIO", "NUOVO"), help="confronta due output JSON")
+    args = parser.parse_args()
+
+    if args.confronta:
+        with open(args.confronta[0]) as f1, open(args.confronta[1]) as f2:
+            confronta(json.load(f1), json.load(f2))
+        return
+
+    risultati = {
+        "meta": {
+            "commit": commit_corrente(), "quando": datetime.now().isoformat(timespec="seconds"),
+            "python": platform.python_version(), "piattaforma": platform.platform(), "seed": args.seed,
+            "metriche": metriche.attive(),
+        },
+        "import": bench_import(),
+        "generazione": bench_generazione(args.cartelle_generazione),
+        "scenari": [],
+    }
+    for n in args.giocatori:
+        print(f"Partita con {n} giocatori...", file=sys.stderr)
+        risultati["scenari"].append(bench_partita(n, args.seed))
+
+    testo = json.dumps(risultati, indent=2)
+    if args.output:
+        with open(args.output, "w") as f: f.write(testo)
+    else:
+        print(testo)
+
+if __name__ == "__main__":
+    main()
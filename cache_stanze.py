@@ -0,0 +1,118 @@
+import pickle
+import threading
+import time
+from collections import OrderedDict
+
+from formato_stanza import proietta_dati, proietta_vista
+
+# --- CACHE STANZE CONDIVISA DAL PROCESSO ---
+# Tutte le sessioni Streamlit dello stesso processo leggono la stessa stanza:
+# la si decodifica una volta e si tiene in memoria per pochi istanti.
+# I dati sono conservati serializzati con pickle: ogni lettore riceve una copia
+# privata (più economica di un json.loads) e può modificarla senza sporcare la cache.
+# Per le viste dei giocatori la parte comune si proietta una volta per versione: ogni giocatore
+# scompatta solo quella più le proprie cartelle, non la stanza intera. Se la versione arriva come blob
+# (niente eventi da rigiocare) i dati interi si decodificano solo se qualcuno li chiede (admin, regia).
+
+class VoceCache:
+    __slots__ = ("versione", "dati", "scadenza", "_vista", "_blob", "_decodifica")
+
+    def __init__(self, versione, dati, scadenza, blob=None, decodifica=None):
+        self.versione = versione
+        self.dati = dati         # dati serializzati; con il blob si fanno alla prima copia chiesta
+        self.scadenza = scadenza
+        self._vista = None       # (parte comune serializzata, cartelle_di), alla prima vista chiesta
+        self._blob = blob        # blob dello storage, se non c'erano eventi da rigiocare
+        self._decodifica = decodifica
+
+    @property
+    def fresca(self):
+        return time.monotonic() < self.scadenza
+
+    def copia(self):
+        if self.dati is None and self._blob is not None:
+            # Il primo che chiede i dati interi si tiene quelli appena decodificati
+            dati = self._decodifica(self._blob)
+            self.dati = pickle.dumps(dati, pickle.HIGHEST_PROTOCOL)
+            return dati
+        return pickle.loads(self.dati) if self.dati is not None else None
+
+    def vista(self, nome_giocatore):
+        proiezione = self._vista
+        if proiezione is None:
+            # Due lettori insieme possono rifarla entrambi: stesso risultato, l'ultimo vince.
+            # Dal blob non si decodificano le cartelle di tutti: solo quelle di chi chiede la vista
+            if self._blob is not None: comune, cartelle_di = proietta_vista(self._blob)
+            elif self.dati is not None: comune, cartelle_di = proietta_dati(self.copia())
+            else: return None
+            proiezione = (pickle.dumps(comune, pickle.HIGHEST_PROTOCOL), cartelle_di)
+            self._vista = proiezione
+        vista = pickle.loads(proiezione[0])
+        vista["mie_cartelle"] = proiezione[1](nome_giocatore)
+        vista["vista"] = nome_giocatore
+        return vista
+
+
+class CacheStanze:
+    def __init__(self, ttl=1.0, max_stanze=256):
+        self.ttl = float(ttl)
+        self.max_stanze = max(1, int(max_stanze))
+        self._voci = OrderedDict()
+        self._lock = threading.Lock()
+        self._stat = {"hit": 0, "miss": 0, "rivalidate": 0, "invalidate": 0, "espulse": 0}
+
+    def cerca(self, nome_stanza):
+        # Ritorna anche le voci scadute: la versione serve per rivalidarle con una lettura condizionale
+        with self._lock:
+            voce = self._voci.get(nome_stanza)
+            if voce is not None and voce.fresca:
+                self._voci.move_to_end(nome_stanza)
+                self._stat["hit"] += 1
+            else:
+                self._stat["miss"] += 1
+            return voce
+
+    def scrivi(self, nome_stanza, versione, dati):
+        payload = pickle.dumps(dati, pickle.HIGHEST_PROTOCOL) if dati is not None else None
+        return self._metti(nome_stanza, VoceCache(versione, payload, time.monotonic() + self.ttl))
+
+    def scrivi_blob(self, nome_stanza, versione, blob, decodifica):
+        # Il blob così come sta nello storage: decodifica(blob) -> dati solo se qualcuno chiede i dati interi
+        return self._metti(nome_stanza, VoceCache(versione, None, time.monotonic() + self.ttl, blob, decodifica))
+
+    def _metti(self, nome_stanza, voce):
+        with self._lock:
+            self._voci[nome_stanza] = voce
+            self._voci.move_to_end(nome_stanza)
+            while len(self._voci) > self.max_stanze:
+                self._voci.popitem(last=False)
+                self._stat["espulse"] += 1
+        return voce
+
+    def rinnova(self, nome_stanza):
+        # Il DB ha confermato che la versione in cache è ancora quella buona
+        with self._lock:
+            voce = self._voci.get(nome_stanza)
+            if voce is not None:
+                voce.scadenza = time.monotonic() + self.ttl
+                self._stat["rivalidate"] += 1
+
+    def invalida(self, nome_stanza):
+        with self._lock:
+            if self._voci.pop(nome_stanza, None) is not None: self._stat["invalidate"] += 1
+
+    def invalida_se_vecchia(self, nome_stanza, versione):
+        with self._lock:
+            voce = self._voci.get(nome_stanza)
+            if voce is not None and voce.versione != versione:
+                del self._voci[nome_stanza]
+                self._stat["invalidate"] += 1
+
+    def statistiche(self):
+        with self._lock:
+            s = dict(self._stat)
+            s["stanze"] = len(self._voci)
+        letture = s["hit"] + s["miss"]
+        s["hit_ratio"] = round(s["hit"] / letture, 3) if letture else 0.0
+        return s
+
@@ -0,0 +1,247 @@
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import sys
+import tempfile
+import threading
+import time
+from datetime import datetime
+
+from storage_tombola import crea_storage, ErroreStorage
+from tombola_core import MossaNonValida, conta_giocatori
+import partita
+import metriche
+
+# --- GENERATORE DI CARICO END-TO-END ---
+# Tante sessioni concorrenti (un thread l'una) che fanno quello che fa la pagina web sullo stesso storage:
+# il giocatore entra e poi rilegge la sua vista a ogni rerun (carica_vista con la versione nota, poi long-poll di 3 s
+# con attendi_cambio, o la vecchia pausa fissa con --modo pausa); l'admin dà il via ed estrae a intervalli,
+# rileggendo tutta la stanza a ogni giro. Con --admin 2 due admin estraggono insieme (regia + bottone).
+# Alla fine si confrontano le scritture confermate con quello che c'è nello storage: ingressi ed estrazioni
+# persi, tabelloni corrotti. Uno storage per esecuzione, come un nodo: pool, cache e contatori condivisi.
+# Uso: python carico_tombola.py --stanze 1 10 50 --giocatori 40 --durata 60 --output carico.json
+#      python carico_tombola.py --backend memoria --persistenza eventi --stanze 100 --giocatori 20
+#      python carico_tombola.py --sala --stanze 2 --giocatori 2000 --cartelle 1
+
+MODI = ("attesa", "pausa")
+
+
+def percentili(tempi):
+    ordinati = sorted(tempi)
+    if not ordinati: return {"n": 0}
+    def perc(p): return round(ordinati[min(len(ordinati) - 1, int(p * len(ordinati)))] * 1000, 3)
+    return {
+        "n": len(ordinati), "media_ms": round(sum(ordinati) / len(ordinati) * 1000, 3),
+        "p50_ms": perc(0.50), "p95_ms": perc(0.95), "p99_ms": perc(0.99), "max_ms": round(ordinati[-1] * 1000, 3),
+    }
+
+
+class Carico:
+    # Stato condiviso dalle sessioni di un'esecuzione: tempi, conferme e fine della prova
+    def __init__(self, storage, args, n_stanze):
+        self.storage, self.args = storage, args
+        self.stanze = [f"CARICO{i:04d}" for i in range(n_stanze)]
+        self.fine = threading.Event()
+        self._lock = threading.Lock()
+        self.tempi = {k: [] for k in ("lettura", "propagazione", "ingresso", "estrazione", "vista_admin")}
+        self.ingressi = {s: 0 for s in self.stanze}          # ingressi confermati ("ok")
+        self.estrazioni = {s: [] for s in self.stanze}       # istante di ogni estrazione confermata
+        self.pronte = {s: threading.Event() for s in self.stanze}
+        self.errori = {}
+        self.rifiutati = 0      # ingressi arrivati a partita iniziata: comportamento voluto, non un errore
+
+    def tempo(self, tipo, secondi):
+        with self._lock: self.tempi[tipo].append(secondi)
+
+    def errore(self, tipo, e):
+        chiave = f"{tipo}: {type(e).__name__}"
+        with self._lock: self.errori[chiave] = self.errori.get(chiave, 0) + 1
+
+    # --- SESSIONI ---
+    def giocatore(self, stanza, nome, ritardo):
+        time.sleep(ritardo)
+        storage = self.storage
+        try:
+            inizio = time.perf_counter()
+            esito = partita.entra_in_stanza(storage, stanza, nome, self.args.cartelle)
+            self.tempo("ingresso", time.perf_counter() - inizio)
+            if esito == "ok":
+                with self._lock:
+                    self.ingressi[stanza] += 1
+                    if self.ingressi[stanza] == self.args.giocatori: self.pronte[stanza].set()
+            if self.args.sala: storage.cartelle_giocatore(stanza, nome)
+        except MossaNonValida:
+            with self._lock: self.rifiutati += 1
+            return
+        except ErroreStorage as e:
+            self.errore("ingresso", e)
+            return
+        versione_nota, visti = -1, 0
+        while not self.fine.is_set():
+            try:
+                inizio = time.perf_counter()
+                versione, dati = storage.carica_vista(stanza, nome, versione_nota)
+                self.tempo("lettura", time.perf_counter() - inizio)
+                if versione is None: return
+                if dati is not None:
+                    versione_nota = versione
+                    estratti = len(dati["numeri_estratti"])
+                    if estratti > visti:
+                        # Ritardo tra l'estrazione confermata all'admin e il giocatore che la vede
+                        with self._lock: confermate = self.estrazioni[stanza]
+                        if len(confermate) >= estratti: self.tempo("propagazione", time.time() - confermate[estratti - 1])
+                        visti = estratti
+                    if dati.get("gioco_finito"): return
+                if self.args.modo == "pausa": self.fine.wait(3)
+                else: storage.attendi_cambio(stanza, versione_nota, timeout=3)
+            except ErroreStorage as e:
+                self.errore("lettura", e)
+                self.fine.wait(1)
+
+    def admin(self, stanza, primo):
+        storage = self.storage
+        if primo:
+            # Si parte quando sono entrati tutti o allo scadere della rampa di ingresso
+            self.pronte[stanza].wait(self.args.rampa + 5)
+            try:
+                dati = storage.carica(stanza)[1]
+                partita.avvia_partita(storage, stanza, dati)
+            except ErroreStorage as e:
+                self.errore("avvio", e)
+        while not self.fine.is_set():
+            try:
+                inizio = time.perf_counter()
+                dati = storage.carica(stanza)[1]
+                self.tempo("vista_admin", time.perf_counter() - inizio)
+                if dati is None or dati.get("gioco_finito") or not dati["numeri_tabellone"]: return
+                if dati.get("stato") == "IN_CORSO":
+                    inizio = time.perf_counter()
+                    estratto, _ = partita.estrai_numero(storage, stanza)
+                    self.tempo("estrazione", time.perf_counter() - inizio)
+                    if estratto:
+                        with self._lock: self.estrazioni[stanza].append(time.time())
+            except ErroreStorage as e:
+                self.errore("estrazione", e)
+            self.fine.wait(self.args.intervallo * random.uniform(0.8, 1.2))
+
+    # --- CONTROLLI FINALI ---
+    def perdite(self):
+        # Confermato ma assente dallo storage = aggiornamento perso
+        esito = {"ingressi_persi": 0, "estrazioni_perse": 0, "estrazioni_fantasma": 0, "tabelloni_corrotti": 0}
+        for stanza in self.stanze:
+            dati = self.storage.carica_fresca(stanza)[1]
+            if dati is None: continue
+            presenti = self.storage.totali_sala(stanza)["giocatori"] if self.args.sala else conta_giocatori(dati)
+            esito["ingressi_persi"] += max(0, self.ingressi[stanza] - presenti)
+            differenza = len(self.estrazioni[stanza]) - len(dati["numeri_estratti"])
+            esito["estrazioni_perse"] += max(0, differenza)
+            esito["estrazioni_fantasma"] += max(0, -differenza)
+            if sorted(dati["numeri_estratti"] + dati["numeri_tabellone"]) != list(range(1, 91)): esito["tabelloni_corrotti"] += 1
+        return esito
+
+
+def query_per_operazione():
+    per_op = {}
+    for etichette, n in metriche.conteggi("db_query_secondi").items():
+        op = dict(etichette).get("op", "?")
+        per_op[op] = per_op.get(op, 0) + n
+    return per_op
+
+
+def esegui(args, n_stanze, config):
+    storage = crea_storage(config)
+    carico = Carico(storage, args, n_stanze)
+    for stanza in carico.stanze:
+        partita.crea_stanza(storage, stanza, "carico", args.sala, max(args.giocatori, 1) if args.sala else None)
+    metriche.REGISTRO.azzera()
+    sessioni = []
+    for stanza in carico.stanze:
+        for i in range(args.giocatori):
+            sessioni.append(threading.Thread(target=carico.giocatore, args=(stanza, f"G{i:05d}", random.uniform(0, args.rampa)), daemon=True))
+        for i in range(args.admin):
+            sessioni.append(threading.Thread(target=carico.admin, args=(stanza, i == 0), daemon=True))
+    print(f"{n_stanze} stanze, {len(sessioni)} sessioni...", file=sys.stderr)
+    inizio = time.perf_counter()
+    for sessione in sessioni: sessione.start()
+    carico.fine.wait(args.durata)
+    carico.fine.set()
+    for sessione in sessioni: sessione.join(timeout=10)
+    durata = time.perf_counter() - inizio
+    query = query_per_operazione()
+    totale_query = sum(query.values())
+    risultato = {
+        "stanze": n_stanze, "sessioni": len(sessioni), "durata_s": round(durata, 2),
+        "latenze": {k: percentili(v) for k, v in carico.tempi.items()},
+        "query": {"totale": totale_query, "per_s": round(totale_query / durata, 1),
+                  "per_s_per_stanza": round(totale_query / durata / n_stanze, 1), "per_operazione": query},
+        "estrazioni": sum(len(v) for v in carico.estrazioni.values()),
+        "ingressi_rifiutati": carico.rifiutati,
+        "perdite": carico.perdite(),
+        "errori": carico.errori,
+        "storage": storage.statistiche(),
+    }
+    return risultato
+
+
+def capacita(risultati, soglia_ms):
+    # Il numero di stanze più alto in cui il p95 della lettura resta sotto soglia, senza perdite né errori
+    buone = [r["stanze"] for r in risultati
+             if r["latenze"]["lettura"].get("p95_ms", 0) <= soglia_ms and not any(r["perdite"].values()) and not r["errori"]]
+    return max(buone) if buone else 0
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Generatore di carico: giocatori e admin concorrenti su uno storage locale")
+    parser.add_argument("--stanze", type=int, nargs="+", default=[1, 10, 50])
+    parser.add_argument("--giocatori", type=int, default=40, help="giocatori per stanza")
+    parser.add_argument("--cartelle", type=int, default=3)
+    parser.add_argument("--admin", type=int, default=1, choices=(1, 2), help="admin che estraggono insieme per stanza")
+    parser.add_argument("--intervallo", type=float, default=3.0, help="secondi tra due estrazioni")
+    parser.add_argument("--durata", type=float, default=60.0, help="secondi di prova per ogni numero di stanze")
+    parser.add_argument("--rampa", type=float, default=5.0, help="secondi in cui si distribuiscono gli ingressi")
+    parser.add_argument("--modo", choices=MODI, default="attesa", help="attesa: long-poll attendi_cambio; pausa: sleep(3) fisso")
+    parser.add_argument("--sala", action="store_true", help="stanze in modalità sala grande")
+    parser.add_argument("--backend", choices=("sqlite", "memoria"), default="sqlite")
+    parser.add_argument("--persistenza", choices=("blob", "eventi"), default="blob")
+    parser.add_argument("--formato", default="binario")
+    parser.add_argument("--soglia-p95", type=float, default=250.0, help="ms di p95 della lettura oltre cui una prova non regge")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--output", help="file JSON di output (default: stdout)")
+    args = parser.parse_args()
+
+    random.seed(args.seed)
+    metriche.attiva()
+    # Migliaia di thread quasi sempre fermi in attesa: stack piccolo
+    threading.stack_size(512 * 1024)
+    cartella = tempfile.mkdtemp(prefix="carico_tombola_")
+    risultati = []
+    try:
+        for n_stanze in args.stanze:
+            config = {"backend": args.backend, "persistenza": args.persistenza, "formato": args.formato}
+            if args.backend == "sqlite": config["percorso"] = os.path.join(cartella, f"carico_{n_stanze}.db")
+            risultati.append(esegui(args, n_stanze, config))
+            r = risultati[-1]
+            print(f"  lettura p95 {r['latenze']['lettura'].get('p95_ms')} ms · propagazione p95 {r['latenze']['propagazione'].get('p95_ms')} ms"
+                  f" · {r['query']['per_s']} query/s · perdite {sum(r['perdite'].values())} · errori {sum(r['errori'].values())}", file=sys.stderr)
+    finally:
+        shutil.rmtree(cartella, ignore_errors=True)
+
+    uscita = {
+        "meta": {
+            "quando": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+            "piattaforma": platform.platform(), "cpu": os.cpu_count(), "parametri": vars(args),
+        },
+        "risultati": risultati,
+        "capacita_stanze": capacita(risultati, args.soglia_p95),
+    }
+    testo = json.dumps(uscita, indent=2)
+    if args.output:
+        with open(args.output, "w") as f: f.write(testo)
+    else:
+        print(testo)
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,70 @@
+# --- CARTELLA COMPATTA ---
+# Ogni riga è una maschera di bit (bit n acceso = numero n presente sulla riga).
+# Anche gli estratti diventano una maschera, così i punti di una riga sono
+# popcount(riga & estratti). Il formato JSON resta la vecchia matrice 3x9.
+
+def colonna_di(n):
+    return min(n // 10, 8)
+
+def maschera_numeri(numeri):
+    maschera = 0
+    for n in numeri:
+        if n > 0: maschera |= 1 << n
+    return maschera
+
+def numeri_da_maschera(maschera):
+    numeri = []
+    while maschera:
+        basso = maschera & -maschera
+        numeri.append(basso.bit_length() - 1)
+        maschera ^= basso
+    return numeri
+
+def estratto(maschera_estratti, n):
+    return (maschera_estratti >> n) & 1 == 1
+
+def distanza_dal_premio(matrici, maschera_estratti, target):
+    # Quanti numeri mancano alla migliore di queste cartelle (righe per ambo..cinquina, tutta per la tombola)
+    migliore = 0
+    for matrice in matrici:
+        cartella = Cartella.da_matrice(matrice)
+        punti = max(cartella.punti_righe(maschera_estratti)) if target <= 5 else cartella.punti(maschera_estratti)
+        if punti > migliore: migliore = punti
+    return max(0, target - migliore) if matrici else None
+
+
+class Cartella:
+    __slots__ = ("righe", "maschera")
+
+    def __init__(self, righe):
+        self.righe = tuple(righe)
+        self.maschera = self.righe[0] | self.righe[1] | self.righe[2]
+
+    @classmethod
+    def da_matrice(cls, matrice):
+        return cls(maschera_numeri(riga) for riga in matrice)
+
+    def a_matrice(self):
+        # Dentro una colonna i numeri sono già ordinati dall'alto verso il basso
+        matrice = [[0] * 9 for _ in range(3)]
+        for r, riga in enumerate(self.righe):
+            for n in numeri_da_maschera(riga): matrice[r][colonna_di(n)] = n
+        return matrice
+
+    def numeri(self):
+        return numeri_da_maschera(self.maschera)
+
+    def punti_righe(self, maschera_estratti):
+        return [(riga & maschera_estratti).bit_count() for riga in self.righe]
+
+    def punti(self, maschera_estratti):
+        return (self.maschera & maschera_estratti).bit_count()
+
+    def __eq__(self, altra):
+        return isinstance(altra, Cartella) and self.righe == altra.righe
+
+    def __hash__(self):
+        return hash(self.righe)
+
+    def __repr__(self):
+        return f"Cartella({self.a_matrice()})"
@@ -0,0 +1,140 @@
+import json
+import logging
+import threading
+import time
+
+from storage_tombola import ErroreStorage
+from tombola_core import riassunto_partita
+
+# --- CICLO DI VITA DELLE STANZE ---
+# Un job di processo, in background, che tiene pulita stanze_tombola:
+#   partite finite  -> dopo `finite_dopo` secondi senza attività vanno in archivio_tombola (solo il riassunto)
+#   stanze inattive -> dopo `ttl` secondi senza attività si cancellano
+# Si lavora a lotti, e ogni cancellazione è condizionata alla versione letta:
+# se nel frattempo qualcuno rientra o estrae, la stanza resta. Più processi possono girare insieme.
+# Una riga che non si legge (formato sconosciuto, blob vecchio...) si conta tra gli errori e può solo scadere;
+# nessuna eccezione ferma il thread, che vive quanto il processo.
+
+_log = logging.getLogger("tombola.ciclo_vita")
+
+class CicloVitaStanze:
+    def __init__(self, storage, ttl=24 * 3600, finite_dopo=3600, intervallo=600, lotto=50, max_lotti=20, alla_rimozione=None):
+        self.storage = storage
+        self.ttl = int(ttl)
+        self.finite_dopo = int(finite_dopo)
+        self.intervallo = float(intervallo)
+        self.lotto = int(lotto)
+        self.max_lotti = int(max_lotti)
+        self.alla_rimozione = alla_rimozione    # es. per liberare motore vincite e regia della stanza
+        self._ferma = threading.Event()
+        self._thread = None
+        self._lock = threading.Lock()
+        self.ultimo_giro = None
+        self.ultimo_errore = None
+        self._dopo = None    # chiave di pagina dove si è fermato il giro precedente (None = dall'inizio)
+        self.totali = {"giri": 0, "esaminate": 0, "archiviate": 0, "scadute": 0, "errori": 0}
+
+    def esegui_giro(self):
+        esito = {"inizio": time.time(), "esaminate": 0, "archiviate": 0, "scadute": 0, "rimaste": 0, "errori": 0}
+        soglia = min(self.ttl, self.finite_dopo)
+        # Un giro guarda al più max_lotti lotti: il successivo riparte da lì, non dalle stesse righe più vecchie
+        # (quelle che restano, es. partite in corso, altrimenti coprirebbero per sempre le stanze dopo di loro)
+        dopo, finite = self._dopo, False
+        esito["ripreso"] = dopo is not None
+        for _ in range(self.max_lotti):
+            righe = self.storage.stanze_inattive(soglia, dopo, self.lotto)
+            if not righe:
+                finite = True
+                break
+            dopo = righe[-1][3]
+            voci, tipo = [], {}
+            for nome_stanza, versione, inattiva, _ in righe:
+                esito["esaminate"] += 1
+                try:
+                    versione_letta, dati = self.storage.carica_fresca(nome_stanza)
+                    if dati is None or versione_letta != versione: continue
+                    riassunto = None
+                    if dati.get("gioco_finito") and inattiva >= self.finite_dopo:
+                        riassunto = json.dumps(riassunto_partita(dati), separators=(",", ":"))
+                except ErroreStorage:
+                    raise
+                except Exception as e:
+                    # Riga illeggibile: non si archivia, ma scade col TTL come le altre; il lotto va avanti
+                    esito["errori"] += 1
+                    self._errore(f"{nome_stanza}: {type(e).__name__}: {e}")
+                    if inattiva >= self.ttl:
+                        voci.append((nome_stanza, versione, "", None))
+                        tipo[nome_stanza] = "scadute"
+                    continue
+                if riassunto is not None:
+                    voci.append((nome_stanza, versione, str(dati.get("created_at", "")), riassunto))
+                    tipo[nome_stanza] = "archiviate"
+                elif inattiva >= self.ttl:
+                    voci.append((nome_stanza, versione, str(dati.get("created_at", "")), None))
+                    tipo[nome_stanza] = "scadute"
+            rimosse = self.storage.archivia(voci) if voci else []
+            for nome_stanza in rimosse:
+                esito[tipo[nome_stanza]] += 1
+                if self.alla_rimozione is None: continue
+                try:
+                    self.alla_rimozione(nome_stanza)
+                except Exception as e:
+                    esito["errori"] += 1
+                    self._errore(f"{nome_stanza}: alla_rimozione: {type(e).__name__}: {e}")
+            esito["rimaste"] += len(voci) - len(rimosse)
+            if len(righe) < self.lotto:
+                finite = True
+                break
+        self._dopo = None if finite else dopo
+        esito["durata_s"] = round(time.time() - esito["inizio"], 3)
+        with self._lock:
+            self.ultimo_giro = esito
+            self.totali["giri"] += 1
+            for k in ("esaminate", "archiviate", "scadute", "errori"): self.totali[k] += esito[k]
+        return esito
+
+    def _errore(self, testo):
+        _log.warning("ciclo di vita stanze: %s", testo)
+        with self._lock: self.ultimo_errore = {"quando": time.time(), "errore": testo}
+
+    # --- JOB IN BACKGROUND ---
+    def avvia(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive(): return
+            self._ferma.clear()
+            self._thread = threading.Thread(target=self._ciclo, name="ciclo-vita-stanze", daemon=True)
+            self._thread.start()
+
+    def ferma(self):
+        self._ferma.set()
+
+    def _ciclo(self):
+        # Primo giro subito dopo l'avvio, poi a intervalli: mai dentro un rerun di Streamlit
+        while not self._ferma.wait(0 if self.ultimo_giro is None else self.intervallo):
+            try:
+                self.esegui_giro()
+            except Exception as e:
+                # Anche errori non di storage (un bug, un callback alla_rimozione...): si conta e si riprova
+                with self._lock: self.totali["errori"] += 1
+                self._errore(f"{type(e).__name__}: {e}")
+                if self._ferma.wait(min(self.intervallo, 60)): break
+
+    def stato(self):
+        with self._lock:
+            return {"attivo": self._thread is not None and self._thread.is_alive(), "ultimo_giro": self.ultimo_giro,
+                    "totali": dict(self.totali), "ultimo_errore": self.ultimo_errore}
+
+
+# --- ISTANZA DI PROCESSO ---
+_CICLI = {}
+_CICLI_LOCK = threading.Lock()
+
+def get_ciclo_vita(storage, **opzioni):
+    # Uno per storage: il job parte al primo rerun e sopravvive ai successivi
+    with _CICLI_LOCK:
+        ciclo = _CICLI.get(id(storage))
+        if ciclo is None:
+            ciclo = CicloVitaStanze(storage, **opzioni)
+            _CICLI[id(storage)] = ciclo
+            ciclo.avvia()
+        return ciclo
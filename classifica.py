@@ -0,0 +1,120 @@
+import threading
+from bisect import bisect_left, insort
+
+from tombola_core import conta_giocatori
+from formato_stanza import cartelle_per_giocatore
+
+# --- CLASSIFICA INCREMENTALE ---
+# Lista ordinata di chiavi (-vinto, ordine d'ingresso, nome): la stessa classifica del vecchio
+# sorted(giocatori, key=vincite, reverse=True), ma aggiornata solo quando controlla_vincite paga.
+# Posizione di un giocatore con una bisect, top-K con uno slice, righe HTML già pronte per tutti i client.
+
+class Classifica:
+    def __init__(self):
+        self._chiavi = {}       # nome -> chiave nella lista
+        self._lista = []        # chiavi in ordine di classifica
+        self._cartelle = {}     # nome -> numero di cartelle (per le righe HTML)
+        self._prossimo = 0
+        self.versione = 0       # pagamenti applicati (dati_stanza["pagamenti"])
+        self._righe = None      # (righe HTML, nome -> indice), ricalcolate al primo render dopo un cambio
+        self._lock = threading.RLock()
+
+    @classmethod
+    def da_stanza(cls, dati_stanza):
+        c = cls()
+        vincite = dati_stanza.get("classifica_vincite", {})
+        for nome, quante in cartelle_per_giocatore(dati_stanza).items():
+            c._nuova_chiave(nome, vincite.get(nome, 0))
+            c._cartelle[nome] = quante
+        # Sala grande: nel blob ci sono solo i vincitori
+        for nome, vinto in vincite.items():
+            if vinto and nome not in c._chiavi: c._nuova_chiave(nome, vinto)
+        c._lista = sorted(c._chiavi.values())
+        c.versione = dati_stanza.get("pagamenti", 0)
+        return c
+
+    def _nuova_chiave(self, nome, vinto):
+        chiave = (-vinto, self._prossimo, nome)
+        self._prossimo += 1
+        self._chiavi[nome] = chiave
+        return chiave
+
+    def accredita(self, nome, importo):
+        with self._lock:
+            chiave = self._chiavi.get(nome)
+            if chiave is None:
+                chiave = self._nuova_chiave(nome, importo)
+            else:
+                del self._lista[bisect_left(self._lista, chiave)]
+                chiave = (chiave[0] - importo, chiave[1], nome)
+                self._chiavi[nome] = chiave
+            insort(self._lista, chiave)
+            self._righe = None
+
+    def applica_pagamento(self, pagamento):
+        # pagamento = dati_stanza["ultimo_pagamento"]: {"n": numero pagamento, "g": vincitori, "q": quota}
+        with self._lock:
+            for nome in pagamento["g"]: self.accredita(nome, pagamento["q"])
+            self.versione = pagamento["n"]
+
+    def posizione(self, nome):
+        # -> (posizione, vinto): a pari vincita stessa posizione; chi non è in lista è dopo tutti i vincitori
+        with self._lock:
+            chiave = self._chiavi.get(nome)
+            if chiave is None: return bisect_left(self._lista, (0,)) + 1, 0
+            return bisect_left(self._lista, (chiave[0],)) + 1, -chiave[0]
+
+    def top(self, k=10, solo_vincitori=True):
+        with self._lock:
+            voci = [(nome, -neg) for neg, _, nome in self._lista[:k]]
+        return [v for v in voci if v[1] > 0] if solo_vincitori else voci
+
+    def __len__(self):
+        return len(self._lista)
+
+    # --- RENDER ---
+    def _riga(self, nome, vinto, mia):
+        icona = "🏆" if vinto > 0 else "👤"
+        badge = f" <span class='winner-badge'>+💰{vinto}</span>" if vinto > 0 else ""
+        style_nome = "font-weight: bold; color: #d63031;" if mia else ""
+        return f"<div class='player-row'>{icona} <span style='{style_nome}'>{nome}</span> ({self._cartelle.get(nome, 0)}) {badge}</div>"
+
+    def html(self, mio_nome=None):
+        # Righe comuni a tutti i client; per chi guarda si rifà solo la propria (evidenziata)
+        with self._lock:
+            if self._righe is None:
+                righe = [self._riga(nome, -neg, False) for neg, _, nome in self._lista]
+                self._righe = (righe, {nome: i for i, (_, _, nome) in enumerate(self._lista)})
+            righe, indice = self._righe
+            i = indice.get(mio_nome)
+            if i is not None: righe = righe[:i] + [self._riga(mio_nome, -self._chiavi[mio_nome][0], True)] + righe[i + 1:]
+        return "<div style='max-height: 400px; overflow-y: auto;'>" + "".join(righe) + "</div>"
+
+
+# --- REGISTRO CLASSIFICHE PER STANZA (condiviso dal processo) ---
+_CLASSIFICHE = {}
+_CLASSIFICHE_LOCK = threading.Lock()
+
+def _firma(dati_stanza):
+    return (dati_stanza.get("created_at"), conta_giocatori(dati_stanza))
+
+def classifica_per_stanza(nome_stanza, dati_stanza):
+    firma = _firma(dati_stanza)
+    pagamenti = dati_stanza.get("pagamenti", 0)
+    with _CLASSIFICHE_LOCK:
+        voce = _CLASSIFICHE.get(nome_stanza)
+        if voce is not None and voce[0] == firma:
+            classifica = voce[1]
+            if pagamenti <= classifica.versione: return classifica   # aggiornata (o client con dati più vecchi)
+            pagamento = dati_stanza.get("ultimo_pagamento")
+            if pagamento and pagamento["n"] == classifica.versione + 1 == pagamenti:
+                classifica.applica_pagamento(pagamento)
+                return classifica
+        # Prima lettura, nuovi ingressi o pagamenti persi per strada: si ricostruisce dal blob
+        classifica = Classifica.da_stanza(dati_stanza)
+        _CLASSIFICHE[nome_stanza] = (firma, classifica)
+        return classifica
+
+def dimentica_classifica(nome_stanza):
+    with _CLASSIFICHE_LOCK:
+        _CLASSIFICHE.pop(nome_stanza, None)
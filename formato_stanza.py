@@ -0,0 +1,166 @@
+import json
+import struct
+import zlib
+
+# --- FORMATO BINARIO DELLE STANZE ---
+# Il blob di una stanza è quasi tutto cartelle: in JSON ogni cartella sono 27 interi in decimale, zeri compresi.
+# Qui le cartelle diventano 27 byte l'una (una riga = 9 byte, zlib schiaccia gli zeri: ~15 byte a cartella),
+# tabellone ed estratti una sequenza di byte (l'ordine serve: è l'ordine di estrazione), i nomi una tabella
+# di stringhe e le vincite un array allineato ai giocatori. Il resto (password, stato, messaggi...) è un
+# piccolo JSON. In lettura le matrici 3x9 si rifanno tutte con un solo memoryview.cast(...).tolist().
+#
+#   MAGIA(3) VERSIONE(1) zlib( TESTA | meta JSON | nomi \0-separati | n. cartelle per giocatore |
+#                              estratti | tabellone | vincite uint32 (opzionali) | cartelle 27 byte )
+#
+# Le righe scritte in JSON (stanze create prima, o dati che il formato binario non sa rappresentare)
+# si riconoscono dal primo byte e si leggono come sempre: si riscrivono in binario al primo salvataggio.
+#
+# VISTA GIOCATORE: la pagina di un giocatore non usa le cartelle degli altri, il tabellone rimasto né la
+# password admin. vista_giocatore() è quella fetta (più il numero di cartelle di ognuno, per classifica e
+# motore); decodifica_vista() la tira fuori dal binario senza costruire le cartelle degli altri.
+# proietta_vista() scompatta una volta e dà le cartelle di ciascuno quando le chiede: la cache la usa per
+# servire tutte le viste di una versione senza mai decodificare le cartelle della stanza intera.
+
+MAGIA = b"\x00TB"
+VERSIONE_FORMATO = 1
+FORMATI = ("binario", "json")
+
+_INTESTAZIONE = struct.Struct("<3sB")
+_TESTA = struct.Struct("<IIIHHB")   # byte meta, byte nomi, giocatori, estratti, tabellone, flag
+_CON_VINCITE = 1
+_CAMPI_BINARI = ("giocatori", "numeri_estratti", "numeri_tabellone")
+
+
+def codifica_stanza(dati, formato="binario"):
+    if formato == "binario":
+        dato = _codifica_binaria(dati)
+        if dato is not None: return dato
+    return json.dumps(dati)
+
+def decodifica_stanza(dato):
+    if isinstance(dato, (bytes, bytearray)) and dato[:3] == MAGIA:
+        return _decodifica_binaria(dato)
+    return json.loads(dato)
+
+def decodifica_vista(dato, nome_giocatore):
+    comune, cartelle_di = proietta_vista(dato)
+    comune["mie_cartelle"] = cartelle_di(nome_giocatore)
+    comune["vista"] = nome_giocatore
+    return comune
+
+def proietta_vista(dato):
+    # -> (parte comune delle viste, cartelle_di(nome) -> cartelle del giocatore, in liste nuove).
+    # Chi serve tante viste della stessa versione (cache_stanze) scompatta il blob una volta sola:
+    # le cartelle diventano liste solo per chi le chiede, non tutte quelle della stanza
+    if isinstance(dato, (bytes, bytearray)) and dato[:3] == MAGIA:
+        return _proiezione_binaria(dato)
+    return proietta_dati(json.loads(dato))
+
+def proietta_dati(dati):
+    # Come proietta_vista, per dati già decodificati
+    giocatori = dati.get("giocatori", {})
+    return vista_giocatore(dati, None), lambda nome: [[list(riga) for riga in c] for c in giocatori.get(nome, [])]
+
+_ESCLUSI_VISTA = ("giocatori", "numeri_tabellone", "admin_pwd")
+
+def vista_giocatore(dati, nome_giocatore):
+    # Con nome_giocatore=None solo la parte comune a tutti i giocatori
+    vista = {k: v for k, v in dati.items() if k not in _ESCLUSI_VISTA}
+    giocatori = dati.get("giocatori", {})
+    vista["conteggi_cartelle"] = {nome: len(cartelle) for nome, cartelle in giocatori.items()}
+    if "totali" not in vista:
+        vista["totali"] = {"giocatori": len(giocatori), "cartelle": sum(vista["conteggi_cartelle"].values())}
+    vista["mie_cartelle"] = giocatori.get(nome_giocatore, [])
+    vista["vista"] = nome_giocatore
+    return vista
+
+def cartelle_per_giocatore(dati):
+    # {nome: numero di cartelle} sia dai dati pieni sia da una vista
+    conteggi = dati.get("conteggi_cartelle")
+    if conteggi is not None: return conteggi
+    return {nome: len(cartelle) for nome, cartelle in dati["giocatori"].items()}
+
+def formato_di(dato):
+    return "binario" if isinstance(dato, (bytes, bytearray)) and dato[:3] == MAGIA else "json"
+
+
+def _codifica_binaria(dati):
+    # None se i dati escono dallo schema (cartelle non 3x9, numeri fuori da 0..255, nomi con \0...): si resta in JSON
+    giocatori = dati.get("giocatori")
+    estratti, tabellone = dati.get("numeri_estratti"), dati.get("numeri_tabellone")
+    if not isinstance(giocatori, dict) or not isinstance(estratti, list) or not isinstance(tabellone, list): return None
+    nomi = list(giocatori)
+    if any(not isinstance(n, str) or "\x00" in n for n in nomi): return None
+    try:
+        conteggi = bytes(len(c) for c in giocatori.values())
+        carte = bytearray()
+        for cartelle in giocatori.values():
+            for cartella in cartelle:
+                if len(cartella) != 3: return None
+                for riga in cartella:
+                    riga = bytes(riga)
+                    if len(riga) != 9: return None
+                    carte += riga
+        numeri = bytes(estratti) + bytes(tabellone)
+    except (TypeError, ValueError):
+        return None
+    meta = {k: v for k, v in dati.items() if k not in _CAMPI_BINARI}
+    vincite, flag = b"", 0
+    classifica = dati.get("classifica_vincite")
+    if isinstance(classifica, dict) and list(classifica) == nomi and all(type(v) is int and 0 <= v < 2 ** 32 for v in classifica.values()):
+        vincite, flag = struct.pack(f"<{len(nomi)}I", *classifica.values()), _CON_VINCITE
+        del meta["classifica_vincite"]
+    meta = json.dumps(meta, separators=(",", ":")).encode("utf-8")
+    tabella_nomi = "\x00".join(nomi).encode("utf-8")
+    corpo = b"".join((
+        _TESTA.pack(len(meta), len(tabella_nomi), len(nomi), len(estratti), len(tabellone), flag),
+        meta, tabella_nomi, conteggi, numeri, vincite, carte,
+    ))
+    return _INTESTAZIONE.pack(MAGIA, VERSIONE_FORMATO) + zlib.compress(corpo, 1)
+
+def _apri_binario(dato, tabellone=True):
+    # -> (dati senza cartelle, corpo scompattato, inizio delle cartelle, nomi, cartelle per giocatore)
+    _, versione = _INTESTAZIONE.unpack_from(dato)
+    if versione != VERSIONE_FORMATO: raise ValueError(f"Formato stanza sconosciuto: versione {versione}")
+    corpo = zlib.decompress(memoryview(dato)[_INTESTAZIONE.size:])
+    n_meta, n_tabella, n_giocatori, n_estratti, n_tabellone, flag = _TESTA.unpack_from(corpo)
+    pos = _TESTA.size
+    dati = json.loads(corpo[pos:pos + n_meta]); pos += n_meta
+    nomi = corpo[pos:pos + n_tabella].decode("utf-8").split("\x00") if n_giocatori else []; pos += n_tabella
+    conteggi = corpo[pos:pos + n_giocatori]; pos += n_giocatori
+    dati["numeri_estratti"] = list(corpo[pos:pos + n_estratti]); pos += n_estratti
+    if tabellone: dati["numeri_tabellone"] = list(corpo[pos:pos + n_tabellone])
+    pos += n_tabellone
+    if flag & _CON_VINCITE:
+        dati["classifica_vincite"] = dict(zip(nomi, struct.unpack_from(f"<{n_giocatori}I", corpo, pos)))
+        pos += 4 * n_giocatori
+    return dati, corpo, pos, nomi, conteggi
+
+def _decodifica_binaria(dato):
+    dati, corpo, pos, nomi, conteggi = _apri_binario(dato)
+    n_carte = sum(conteggi)
+    carte = memoryview(corpo)[pos:pos + 27 * n_carte].cast("B", (n_carte, 3, 9)).tolist() if n_carte else []
+    giocatori, i = {}, 0
+    for nome, quante in zip(nomi, conteggi):
+        giocatori[nome] = carte[i:i + quante]
+        i += quante
+    dati["giocatori"] = giocatori
+    return dati
+
+def _proiezione_binaria(dato):
+    # Si salta il tabellone; delle cartelle si tiene il corpo e dove comincia la fetta di ogni giocatore
+    dati, corpo, pos, nomi, conteggi = _apri_binario(dato, tabellone=False)
+    dati.pop("admin_pwd", None)
+    per_giocatore = dict(zip(nomi, conteggi))
+    dati["conteggi_cartelle"] = dict(per_giocatore)
+    if "totali" not in dati: dati["totali"] = {"giocatori": len(nomi), "cartelle": sum(conteggi)}
+    dati["mie_cartelle"], dati["vista"] = [], None
+    carte, inizi, i = memoryview(corpo)[pos:], {}, 0
+    for nome, quante in zip(nomi, conteggi):
+        inizi[nome] = i
+        i += 27 * quante
+    def cartelle_di(nome):
+        quante = per_giocatore.get(nome)
+        if not quante: return []
+        return carte[inizi[nome]:inizi[nome] + 27 * quante].cast("B", (quante, 3, 9)).tolist()
+    return dati, cartelle_di
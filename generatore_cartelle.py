@@ -0,0 +1,172 @@
+import random
+
+# --- GENERATORE CARTELLE ---
+RANGE_COLONNE = [(1, 10), (10, 20), (20, 30), (30, 40), (40, 50), (50, 60), (60, 70), (70, 80), (80, 91)]
+
+# --- IMPRONTA DI UNA CARTELLA ---
+# I 27 numeri della matrice riga per riga, in 27 byte (lo stesso layout del formato binario delle stanze).
+# È canonica perché una cartella ha già una sola forma (colonne ordinate dall'alto): due cartelle uguali
+# hanno la stessa impronta, e un set di impronte trova un doppione con un lookup.
+def impronta(cartella):
+    return bytes(n for riga in cartella for n in riga)
+
+def impronte_array(carte):
+    # Le impronte di un array (n, 3, 9) con una sola conversione a byte
+    dato = carte.astype("uint8").tobytes()
+    return [dato[i:i + 27] for i in range(0, len(dato), 27)]
+
+class GeneratoreCartelle:
+    @staticmethod
+    def genera_matrice_3x9():
+        matrice = [[0] * 9 for _ in range(3)]
+        numeri_usati = set()
+        range_colonne = RANGE_COLONNE
+        for r in range(3):
+            colonne_scelte = random.sample(range(9), 5)
+            colonne_scelte.sort()
+            for c in colonne_scelte:
+                start, end = range_colonne[c]
+                while True:
+                    num = random.randint(start, end - 1)
+                    if num not in numeri_usati:
+                        matrice[r][c] = num
+                        numeri_usati.add(num)
+                        break
+        for c in range(9):
+            col_nums, row_indices = [], []
+            for r in range(3):
+                if matrice[r][c] != 0:
+                    col_nums.append(matrice[r][c])
+                    row_indices.append(r)
+            col_nums.sort()
+            for i, r_idx in enumerate(row_indices):
+                matrice[r_idx][c] = col_nums[i]
+        return matrice
+
+    # --- GENERAZIONE IN BLOCCO (NumPy) ---
+    @staticmethod
+    def genera_array(n, seed=None):
+        # Stesse regole di genera_matrice_3x9 ma per n cartelle in un colpo solo: array (n, 3, 9)
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        inizi = np.array([s for s, _ in RANGE_COLONNE])
+        ampiezze = np.array([e - s for s, e in RANGE_COLONNE])
+        # 5 colonne casuali per riga
+        scelte = np.argsort(rng.random((n, 3, 9)), axis=2)[:, :, :5]
+        occupate = np.zeros((n, 3, 9), dtype=bool)
+        np.put_along_axis(occupate, scelte, True, axis=2)
+        # Fino a 3 valori distinti per colonna (chiavi casuali, fuori range in coda), poi ordinati
+        chiavi = rng.random((n, 9, 11))
+        chiavi[:, np.arange(11)[None, :] >= ampiezze[:, None]] = 2.0
+        valori = np.argsort(chiavi, axis=2)[:, :, :3] + inizi[None, :, None]
+        quanti = occupate.sum(axis=1)
+        valori = np.where(np.arange(3)[None, None, :] < quanti[:, :, None], valori, 99)
+        valori.sort(axis=2)
+        # Il k-esimo numero della colonna va nella k-esima riga occupata dall'alto
+        posizioni = np.clip(np.cumsum(occupate, axis=1) - 1, 0, 2)
+        cartelle = np.take_along_axis(valori, posizioni.transpose(0, 2, 1), axis=2).transpose(0, 2, 1)
+        return np.where(occupate, cartelle, 0).astype(np.int16)
+
+    @staticmethod
+    def genera_serie_array(n_serie, seed=None):
+        # Serie tradizionale: 6 cartelle che coprono 1-90 una volta sola, array (n_serie * 6, 3, 9).
+        # Tutte le serie insieme: i cicli Python sono sulle colonne e sulle unità da distribuire, non sulle serie
+        import numpy as np
+        rng = np.random.default_rng(seed)
+        inizi = np.array([s for s, _ in RANGE_COLONNE])
+        ampiezze = np.array([e - s for s, e in RANGE_COLONNE])
+        conteggi = GeneratoreCartelle._conteggi_serie(rng, n_serie)          # (n_serie, 6, 9)
+        # Ogni colonna della serie è una permutazione del suo range, tagliata a pezzi consecutivi per cartella
+        chiavi = rng.random((n_serie, 9, 11))
+        chiavi[:, np.arange(11)[None, :] >= ampiezze[:, None]] = 2.0
+        numeri = np.argsort(chiavi, axis=2) + inizi[None, :, None]
+        primi = np.cumsum(conteggi, axis=1) - conteggi
+        occupati = np.arange(3) < conteggi[..., None]                         # (n_serie, 6, 9, 3)
+        posti = np.where(occupati, primi[..., None] + np.arange(3), 0)
+        valori = np.take_along_axis(np.broadcast_to(numeri[:, None], (n_serie, 6, 9, 11)), posti, axis=3)
+        valori = np.where(occupati, valori, 99)
+        valori.sort(axis=3)
+        conteggi, valori = conteggi.reshape(-1, 9), valori.reshape(-1, 9, 3)
+        occupate = GeneratoreCartelle._disponi_righe(rng, conteggi)
+        # Come in genera_array: il k-esimo numero della colonna nella k-esima riga occupata dall'alto
+        posizioni = np.clip(np.cumsum(occupate, axis=1) - 1, 0, 2)
+        cartelle = np.take_along_axis(valori, posizioni.transpose(0, 2, 1), axis=2).transpose(0, 2, 1)
+        return np.where(occupate, cartelle, 0).astype(np.int16)
+
+    @staticmethod
+    def _conteggi_serie(rng, n_serie):
+        # Quanti numeri per colonna ha ciascuna delle 6 cartelle: somma di colonna = ampiezza del range,
+        # 15 per cartella, al massimo 3 per casella. Le unità oltre la prima per casella si danno una alla volta
+        # (in ordine casuale) alla cartella che ne manca di più; le serie rimaste senza candidate si rifanno
+        import numpy as np
+        ampiezze = np.array([e - s for s, e in RANGE_COLONNE])
+        unita = np.repeat(np.arange(9), ampiezze - 6)
+        conteggi = np.ones((n_serie, 6, 9), dtype=np.int64)
+        da_fare = np.arange(n_serie)
+        while da_fare.size:
+            m = da_fare.size
+            righe = np.arange(m)
+            parziali = np.ones((m, 6, 9), dtype=np.int64)
+            mancanti = np.full((m, 6), 6)
+            ordine = unita[np.argsort(rng.random((m, unita.size)), axis=1)]
+            ok = np.ones(m, dtype=bool)
+            for u in range(unita.size):
+                c = ordine[:, u]
+                candidate = (mancanti > 0) & (parziali[righe, :, c] < 3)
+                ok &= candidate.any(axis=1)
+                k = np.where(candidate, mancanti + 2 * rng.random((m, 6)), -1.0).argmax(axis=1)
+                parziali[righe[ok], k[ok], c[ok]] += 1
+                mancanti[righe[ok], k[ok]] -= 1
+            conteggi[da_fare[ok]] = parziali[ok]
+            da_fare = da_fare[~ok]
+        return conteggi
+
+    @staticmethod
+    def _disponi_righe(rng, conteggi):
+        # Colonne con più numeri per prime, ciascuna nelle righe con più posti liberi (5 per riga):
+        # conteggi (m, 9) -> caselle occupate (m, 3, 9)
+        import numpy as np
+        m = len(conteggi)
+        righe = np.arange(m)
+        liberi = np.full((m, 3), 5)
+        occupate = np.zeros((m, 3, 9), dtype=bool)
+        ordine = np.argsort(-conteggi + rng.random((m, 9)) / 2, axis=1)
+        for j in range(9):
+            c = ordine[:, j]
+            rango = np.argsort(np.argsort(-liberi + rng.random((m, 3)) / 2, axis=1), axis=1)
+            scelte = rango < conteggi[righe, c][:, None]
+            occupate[righe, :, c] = scelte
+            liberi -= scelte
+        return occupate
+
+    @staticmethod
+    def genera_array_uniche(n, seed=None, serie=False, escludi=()):
+        # Come genera_array / genera_serie_array ma senza doppioni nel lotto né impronte già in `escludi`
+        # (un set o un dict di impronte). Si rigenerano solo i blocchi con un doppione: la cartella, o la sua
+        # serie intera perché resti una serie. Con migliaia di cartelle il controllo è un set di bytes.
+        import numpy as np
+        if serie and n % 6: raise ValueError(f"Le serie sono di 6 cartelle: {n} non è un multiplo di 6")
+        blocco = 6 if serie else 1
+        genera = GeneratoreCartelle.genera_serie_array if serie else GeneratoreCartelle.genera_array
+        n_blocchi = n // blocco
+        carte = genera(n_blocchi, seed)
+        # I rifacimenti non ripartono dal seed dato (rifarebbero gli stessi doppioni), ma restano riproducibili
+        rng = np.random.default_rng(seed)
+        viste, da_rifare = set(), range(n_blocchi)
+        while True:
+            impronte = impronte_array(carte)
+            doppioni = []
+            for b in da_rifare:
+                gruppo = impronte[b * blocco:(b + 1) * blocco]
+                if any(i in viste or i in escludi for i in gruppo): doppioni.append(b)
+                else: viste.update(gruppo)
+            if not doppioni: return carte
+            nuove = genera(len(doppioni), int(rng.integers(2 ** 32)))
+            for k, b in enumerate(doppioni):
+                carte[b * blocco:(b + 1) * blocco] = nuove[k * blocco:(k + 1) * blocco]
+            da_rifare = doppioni
+
+    @staticmethod
+    def genera_lotto(n, seed=None, serie=False, escludi=()):
+        # Liste 3x9 come genera_matrice_3x9, pronte per il JSON della stanza; mai due cartelle uguali
+        return GeneratoreCartelle.genera_array_uniche(n, seed, serie, escludi).tolist()
@@ -0,0 +1,197 @@
+import threading
+import time
+
+from formato_stanza import cartelle_per_giocatore
+from generatore_cartelle import GeneratoreCartelle, impronta
+from tombola_core import MossaNonValida
+
+# --- INDICE DELLE CARTELLE EMESSE ---
+# Due giocatori con la stessa cartella si dividono ogni premio che fa: con migliaia di cartelle per evento
+# succede, e nessuno se ne accorge finché non esce la tombola. L'indice tiene le impronte (generatore_cartelle)
+# di tutte le cartelle emesse in un ambito: la stanza, o il torneo a cui è collegata (ogni stanza del torneo
+# gioca la stessa sequenza di numeri). All'emissione un doppione si trova con un lookup e si rigenera solo lui.
+# Come motore e classifica è stato di processo, rifatto dai dati della stanza quando non li rispecchia più:
+# le impronte stanno divise per stanza con una firma (created_at + cartelle per giocatore, come il motore).
+# Le stanze normali controllano dentro la scrittura condizionata, sui dati appena riletti: un ingresso
+# concorrente nella stessa stanza, anche da un altro processo, fa ripetere il controllo. In sala grande
+# l'indice si rilegge dallo storage quando le cartelle iscritte sono più di quelle che conosce.
+# Nel torneo le altre stanze non si rileggono a ogni ingresso: torneo.allinea_indice_torneo le carica tutte
+# quando l'indice è freddo (processo appena partito) e poi al più ogni pochi secondi, così anche gli ingressi
+# fatti da altri processi nelle altre stanze entrano nell'indice entro quel ritardo.
+
+class IndiceCartelle:
+    def __init__(self):
+        self._stanze = {}      # stanza -> [firma, {impronta: quante}]
+        self._impronte = {}    # impronta -> quante cartelle emesse nell'ambito
+        self._rinfrescato = None   # ultimo caricamento di tutte le stanze dell'ambito (torneo)
+        self._lock = threading.RLock()
+
+    def __contains__(self, impronta):
+        return impronta in self._impronte
+
+    def __len__(self):
+        return sum(self._impronte.values())
+
+    def firma(self, nome_stanza):
+        voce = self._stanze.get(nome_stanza)
+        return voce[0] if voce else None
+
+    def da_rinfrescare(self, secondi):
+        return self._rinfrescato is None or time.monotonic() - self._rinfrescato >= secondi
+
+    def rinfrescato(self):
+        self._rinfrescato = time.monotonic()
+
+    def cartelle_di(self, nome_stanza):
+        voce = self._stanze.get(nome_stanza)
+        return sum(voce[1].values()) if voce else 0
+
+    def aggiungi(self, nome_stanza, firma, cartelle):
+        with self._lock:
+            voce = self._stanze.setdefault(nome_stanza, [firma, {}])
+            voce[0] = firma
+            for cartella in cartelle:
+                i = impronta(cartella)
+                voce[1][i] = voce[1].get(i, 0) + 1
+                self._impronte[i] = self._impronte.get(i, 0) + 1
+
+    def togli(self, nome_stanza, cartelle):
+        with self._lock:
+            voce = self._stanze.get(nome_stanza)
+            if voce is None: return
+            for cartella in cartelle:
+                i = impronta(cartella)
+                if voce[1].get(i): self._scala(voce[1], i)
+                if self._impronte.get(i): self._scala(self._impronte, i)
+
+    def togli_stanza(self, nome_stanza):
+        with self._lock:
+            voce = self._stanze.pop(nome_stanza, None)
+            if voce is None: return
+            for i, quante in voce[1].items():
+                rimaste = self._impronte.get(i, 0) - quante
+                if rimaste > 0: self._impronte[i] = rimaste
+                else: self._impronte.pop(i, None)
+
+    def ricarica(self, nome_stanza, firma, cartelle):
+        with self._lock:
+            self.togli_stanza(nome_stanza)
+            self.aggiungi(nome_stanza, firma, cartelle)
+
+    def rendi_uniche(self, cartelle):
+        # Le cartelle già emesse nell'ambito, o ripetute nel lotto, sostituite da cartelle nuove: -> lista
+        with self._lock:
+            viste, uniche, doppioni = set(), [], 0
+            for cartella in cartelle:
+                i = impronta(cartella)
+                if i in self._impronte or i in viste: doppioni += 1
+                else: viste.add(i); uniche.append(cartella)
+            if not doppioni: return list(cartelle)
+            escludi = viste | self._impronte.keys()
+            return uniche + GeneratoreCartelle.genera_lotto(doppioni, escludi=escludi)
+
+    def emetti(self, nome_stanza, n_cartelle):
+        # Genera e prenota n cartelle nuove per la stanza (da togliere se poi l'iscrizione non va)
+        with self._lock:
+            cartelle = GeneratoreCartelle.genera_lotto(n_cartelle, escludi=self._impronte)
+            self.aggiungi(nome_stanza, self.firma(nome_stanza), cartelle)
+            return cartelle
+
+    @staticmethod
+    def _scala(conteggi, i):
+        if conteggi[i] > 1: conteggi[i] -= 1
+        else: del conteggi[i]
+
+
+# --- REGISTRO DEGLI INDICI ---
+_INDICI = {}    # ambito -> IndiceCartelle
+_LOCK = threading.Lock()
+
+def ambito_di(nome_stanza, dati_stanza):
+    return ("torneo", dati_stanza["torneo"]) if dati_stanza.get("torneo") else ("stanza", nome_stanza)
+
+def indice_per(ambito):
+    with _LOCK:
+        indice = _INDICI.get(ambito)
+        if indice is None: indice = _INDICI[ambito] = IndiceCartelle()
+        return indice
+
+def firma_stanza(dati_stanza):
+    return (dati_stanza.get("created_at"), tuple(cartelle_per_giocatore(dati_stanza).items()))
+
+def firma_sala(dati_stanza):
+    # In sala grande le cartelle non stanno nei dati: conta la partita, e il numero di cartelle iscritte
+    return (dati_stanza.get("created_at"), "sala")
+
+def allinea_stanza(nome_stanza, dati_stanza, indice=None):
+    # -> l'indice dell'ambito con dentro esattamente le cartelle attuali della stanza (stanze normali)
+    if indice is None: indice = indice_per(ambito_di(nome_stanza, dati_stanza))
+    firma = firma_stanza(dati_stanza)
+    with indice._lock:
+        if indice.firma(nome_stanza) != firma:
+            indice.ricarica(nome_stanza, firma, (c for cartelle in dati_stanza["giocatori"].values() for c in cartelle))
+    return indice
+
+def cartelle_uniche(nome_stanza, dati_stanza, cartelle):
+    # Prima di un ingresso, sui dati appena riletti: -> cartelle senza doppioni nell'ambito
+    return allinea_stanza(nome_stanza, dati_stanza).rendi_uniche(cartelle)
+
+def registra_ingresso(nome_stanza, dati_stanza, cartelle):
+    # Dopo applica_evento: la firma nuova comprende il giocatore appena entrato. Se la scrittura poi
+    # non passa, la firma non torna coi dati riletti e la stanza si ricarica al prossimo controllo
+    indice_per(ambito_di(nome_stanza, dati_stanza)).aggiungi(nome_stanza, firma_stanza(dati_stanza), cartelle)
+
+def allinea_sala(storage, nome_stanza, dati_stanza, indice=None):
+    # Sala grande: le cartelle sono righe dello storage. -> l'indice dell'ambito con dentro le cartelle iscritte
+    if indice is None: indice = indice_per(ambito_di(nome_stanza, dati_stanza))
+    totali = storage.totali_sala(nome_stanza)
+    if totali is None: raise MossaNonValida("Sala non trovata.")
+    firma = firma_sala(dati_stanza)
+    with indice._lock:
+        # Più cartelle iscritte di quelle note (prenotate comprese) = qualcuno è entrato da un altro processo
+        if indice.firma(nome_stanza) != firma or totali["cartelle"] > indice.cartelle_di(nome_stanza):
+            cartelle = storage.giocatori_sala(nome_stanza).values()
+            indice.ricarica(nome_stanza, firma, (c for lotto in cartelle for c in lotto))
+    return indice
+
+def emetti_sala(storage, nome_stanza, dati_stanza, n_cartelle):
+    # -> (indice, cartelle prenotate), da togliere dall'indice se poi l'iscrizione non va
+    indice = allinea_sala(storage, nome_stanza, dati_stanza)
+    with indice._lock:
+        return indice, indice.emetti(nome_stanza, n_cartelle)
+
+def unisci_al_torneo(nome_torneo, nome_stanza, dati_stanza, storage=None):
+    # Collegamento di una stanza a un torneo, dentro la sua scrittura condizionata: le cartelle
+    # che un'altra stanza del torneo ha già vengono riemesse. -> eventi "ingresso" per chi cambia cartelle
+    # (le cartelle per giocatore non cambiano di numero: la firma resta quella dei dati riletti).
+    # Una sala grande non riscrive le righe dei suoi iscritti: entra con le sue cartelle, se nessuna è già
+    # del torneo (storage serve a leggerle)
+    indice = indice_per(("torneo", nome_torneo))
+    firma, eventi = firma_stanza(dati_stanza), []
+    with indice._lock:
+        indice.togli_stanza(nome_stanza)
+        if dati_stanza.get("sala"):
+            cartelle = [c for lotto in storage.giocatori_sala(nome_stanza).values() for c in lotto]
+            impronte = [impronta(c) for c in cartelle]
+            if len(set(impronte)) != len(impronte) or any(i in indice for i in impronte):
+                raise MossaNonValida("La sala ha cartelle già emesse nel torneo: collegala prima delle iscrizioni.")
+            indice.aggiungi(nome_stanza, firma_sala(dati_stanza), cartelle)
+        else:
+            for nome, cartelle in dati_stanza["giocatori"].items():
+                nuove = indice.rendi_uniche(cartelle)
+                if nuove != cartelle: eventi.append({"t": "ingresso", "g": nome, "c": nuove})
+                indice.aggiungi(nome_stanza, firma, nuove)
+    with _LOCK:
+        _INDICI.pop(("stanza", nome_stanza), None)
+    return eventi
+
+def dimentica_ambito(ambito):
+    with _LOCK:
+        _INDICI.pop(ambito, None)
+
+def dimentica_indice(nome_stanza):
+    # La stanza esce da ogni ambito (è stata ricreata, archiviata o è passata a un torneo)
+    with _LOCK:
+        indici = list(_INDICI.items())
+        _INDICI.pop(("stanza", nome_stanza), None)
+    for _, indice in indici: indice.togli_stanza(nome_stanza)
@@ -0,0 +1,199 @@
+import os
+import threading
+import time
+from bisect import bisect_left
+
+# --- METRICHE DI PROCESSO ---
+# Tempi delle fasi calde (connessione DB, query, decode JSON, controllo vincite, HTML),
+# contatori (rerun, estrazioni, salvataggi) e dimensioni dei payload, per stanza e per processo.
+# Spente di default: misura() restituisce un context manager vuoto già pronto e conta()/osserva()
+# escono al primo if. Si accendono con TOMBOLA_METRICHE=1 o con attiva().
+# json e logging si importano solo col log strutturato acceso: il modulo resta leggero da importare.
+
+BUCKET_SECONDI = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0)
+BUCKET_BYTE = (256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216)
+
+
+class Istogramma:
+    __slots__ = ("limiti", "conteggi", "somma", "totale")
+
+    def __init__(self, limiti):
+        self.limiti = limiti
+        self.conteggi = [0] * (len(limiti) + 1)   # l'ultimo è +Inf
+        self.somma = 0.0
+        self.totale = 0
+
+    def osserva(self, valore):
+        self.conteggi[bisect_left(self.limiti, valore)] += 1
+        self.somma += valore
+        self.totale += 1
+
+
+class Registro:
+    def __init__(self):
+        self.attive = os.environ.get("TOMBOLA_METRICHE", "") not in ("", "0")
+        self.log_strutturato = os.environ.get("TOMBOLA_METRICHE_LOG", "") not in ("", "0")
+        self._contatori = {}     # (nome, etichette) -> valore
+        self._istogrammi = {}    # (nome, etichette) -> Istogramma
+        self._lock = threading.Lock()
+        self.avvio = time.time()
+
+    def conta(self, nome, valore=1, **etichette):
+        if not self.attive: return
+        chiave = (nome, tuple(sorted(etichette.items())))
+        with self._lock:
+            self._contatori[chiave] = self._contatori.get(chiave, 0) + valore
+        if self.log_strutturato: self._scrivi_log("contatore", nome, valore, etichette)
+
+    def osserva(self, nome, valore, limiti=BUCKET_SECONDI, **etichette):
+        if not self.attive: return
+        chiave = (nome, tuple(sorted(etichette.items())))
+        with self._lock:
+            ist = self._istogrammi.get(chiave)
+            if ist is None:
+                ist = Istogramma(limiti)
+                self._istogrammi[chiave] = ist
+            ist.osserva(valore)
+        if self.log_strutturato: self._scrivi_log("osservazione", nome, valore, etichette)
+
+    def misura(self, nome, **etichette):
+        if not self.attive: return _NULLA
+        return _Misura(self, nome, etichette)
+
+    def azzera(self):
+        with self._lock:
+            self._contatori.clear()
+            self._istogrammi.clear()
+
+    def _scrivi_log(self, tipo, nome, valore, etichette):
+        import json
+        import logging
+        logging.getLogger("tombola.metriche").info(json.dumps({"tipo": tipo, "metrica": nome, "valore": valore, **etichette}, default=str))
+
+    # --- ESPOSIZIONE ---
+    def testo_prometheus(self):
+        with self._lock:
+            contatori = sorted(self._contatori.items())
+            istogrammi = sorted(self._istogrammi.items(), key=lambda v: v[0])
+            istogrammi = [(k, list(i.limiti), list(i.conteggi), i.somma, i.totale) for k, i in istogrammi]
+        righe, dichiarate = [], set()
+        for (nome, etichette), valore in contatori:
+            nome = f"tombola_{nome}_total"
+            if nome not in dichiarate:
+                righe.append(f"# TYPE {nome} counter"); dichiarate.add(nome)
+            righe.append(f"{nome}{_etichette(etichette)} {valore}")
+        for (nome, etichette), limiti, conteggi, somma, totale in istogrammi:
+            nome = f"tombola_{nome}"
+            if nome not in dichiarate:
+                righe.append(f"# TYPE {nome} histogram"); dichiarate.add(nome)
+            cumulato = 0
+            for limite, conteggio in zip(list(limiti) + ["+Inf"], conteggi):
+                cumulato += conteggio
+                righe.append(f"{nome}_bucket{_etichette(etichette, le=limite)} {cumulato}")
+            righe.append(f"{nome}_sum{_etichette(etichette)} {somma:.6f}")
+            righe.append(f"{nome}_count{_etichette(etichette)} {totale}")
+        righe.append("# TYPE tombola_avvio_processo_secondi gauge")
+        righe.append(f"tombola_avvio_processo_secondi {self.avvio:.0f}")
+        return "\n".join(righe) + "\n"
+
+    def conteggi(self, nome):
+        # Osservazioni di un istogramma per combinazione di etichette: {(("op", "leggi"), ...): n}
+        with self._lock:
+            return {e: ist.totale for (n, e), ist in self._istogrammi.items() if n == nome}
+
+    def riassunto(self):
+        # Per il pannello admin: media e conteggio di ogni istogramma, valore dei contatori
+        with self._lock:
+            s = {f"{n}{_etichette(e)}": v for (n, e), v in self._contatori.items()}
+            for (n, e), ist in self._istogrammi.items():
+                s[f"{n}{_etichette(e)}"] = {"n": ist.totale, "media": ist.somma / ist.totale if ist.totale else 0.0}
+        return s
+
+
+def _valore_etichetta(v):
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def _etichette(etichette, le=None):
+    coppie = [f'{k}="{_valore_etichetta(v)}"' for k, v in etichette]
+    if le is not None: coppie.append(f'le="{le}"')
+    return "{" + ",".join(coppie) + "}" if coppie else ""
+
+
+class _Misura:
+    __slots__ = ("registro", "nome", "etichette", "inizio")
+
+    def __init__(self, registro, nome, etichette):
+        self.registro = registro
+        self.nome = nome
+        self.etichette = etichette
+
+    def __enter__(self):
+        self.inizio = time.perf_counter()
+        return self
+
+    def __exit__(self, *errore):
+        self.registro.osserva(f"{self.nome}_secondi", time.perf_counter() - self.inizio, **self.etichette)
+        return False
+
+
+class _Nulla:
+    __slots__ = ()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *errore):
+        return False
+
+_NULLA = _Nulla()
+
+
+# --- ISTANZA DI PROCESSO ---
+REGISTRO = Registro()
+conta = REGISTRO.conta
+osserva = REGISTRO.osserva
+misura = REGISTRO.misura
+conteggi = REGISTRO.conteggi
+
+def attiva(log_strutturato=False):
+    REGISTRO.attive = True
+    REGISTRO.log_strutturato = log_strutturato
+
+def disattiva():
+    REGISTRO.attive = False
+
+def attive():
+    return REGISTRO.attive
+
+def testo_prometheus():
+    return REGISTRO.testo_prometheus()
+
+
+# --- ENDPOINT HTTP (per lo scraping di Prometheus) ---
+_SERVER = None
+_SERVER_LOCK = threading.Lock()
+
+def avvia_endpoint(porta=9464, host="0.0.0.0"):
+    # Un solo server per processo, in un thread daemon: GET /metrics
+    global _SERVER
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+    class Gestore(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in ("/metrics", "/"):
+                self.send_error(404); return
+            corpo = testo_prometheus().encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(corpo)))
+            self.end_headers()
+            self.wfile.write(corpo)
+
+        def log_message(self, *args):
+            pass
+
+    with _SERVER_LOCK:
+        if _SERVER is None:
+            _SERVER = ThreadingHTTPServer((host, int(porta)), Gestore)
+            threading.Thread(target=_SERVER.serve_forever, name="metriche-http", daemon=True).start()
+        return _SERVER.server_address
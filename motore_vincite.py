@@ -0,0 +1,184 @@
+import threading
+from cartelle import Cartella, maschera_numeri
+from formato_stanza import cartelle_per_giocatore
+
+# --- MOTORE VINCITE INCREMENTALE ---
+# Indice invertito numero -> righe (giocatore, cartella, riga) costruito una volta
+# a inizio partita, con contatori di punti per riga e per cartella.
+# Ogni estrazione tocca solo le righe che contengono il numero uscito.
+# Per ogni cartella si tiene anche la riga migliore, con i conteggi per bucket
+# (quante cartelle hanno la riga migliore a 0..5 punti, quante hanno 0..15 numeri):
+# "quante cartelle sono a un numero dal premio" costa una lettura di lista.
+# Lo stesso motore lo usano regia, admin e viste dei giocatori: ogni motore ha il suo lock (rientrante),
+# preso da chi lo fa avanzare e da chi lo legge.
+
+class MotoreVincite:
+    def __init__(self, giocatori):
+        self.nomi = list(giocatori.keys())
+        self.indice_nomi = {nome_g: g_idx for g_idx, nome_g in enumerate(self.nomi)}
+        self.indice = {}            # numero -> [id riga, ...]
+        self.riga_cartella = []     # id riga -> id cartella
+        self.cartella_giocatore = []  # id cartella -> indice giocatore
+        self.cartelle = []          # id cartella -> Cartella (maschere di riga)
+        for g_idx, nome_g in enumerate(self.nomi):
+            for matrice in giocatori[nome_g]:
+                cartella = Cartella.da_matrice(matrice)
+                c_id = len(self.cartelle)
+                self.cartelle.append(cartella)
+                self.cartella_giocatore.append(g_idx)
+                for riga in matrice:
+                    r_id = len(self.riga_cartella)
+                    self.riga_cartella.append(c_id)
+                    for n in riga:
+                        if n > 0: self.indice.setdefault(n, []).append(r_id)
+        self.punti_riga = [0] * len(self.riga_cartella)
+        self.punti_cartella = [0] * len(self.cartelle)
+        self.max_riga = [0] * len(self.nomi)        # miglior riga di ogni giocatore
+        self.max_cartella = [0] * len(self.nomi)    # cartella più piena di ogni giocatore
+        self.migliore_riga = [0] * len(self.cartelle)   # id cartella -> punti della riga migliore
+        self.carte_per_riga = [len(self.cartelle)] + [0] * 5     # punti riga migliore -> n. cartelle
+        self.carte_per_punti = [len(self.cartelle)] + [0] * 15   # punti cartella -> n. cartelle
+        self.soglie = {k: set() for k in range(1, 6)}  # k -> giocatori con una riga da almeno k punti
+        self.tombole = set()                        # giocatori con una cartella piena
+        self.applicati = []
+        self.maschera_estratti = 0
+        self.lock = threading.RLock()
+
+    @classmethod
+    def da_stanza(cls, dati_stanza, giocatori=None):
+        # giocatori: in sala grande le cartelle non stanno nel blob e arrivano dallo storage per giocatore
+        motore = cls(giocatori if giocatori is not None else dati_stanza["giocatori"])
+        motore.sincronizza(dati_stanza["numeri_estratti"])
+        return motore
+
+    def applica(self, numero):
+        with self.lock: self._applica(numero)
+
+    def _applica(self, numero):
+        self.applicati.append(numero)
+        self.maschera_estratti |= 1 << numero
+        for r_id in self.indice.get(numero, ()):
+            self.punti_riga[r_id] += 1
+            c_id = self.riga_cartella[r_id]
+            self.punti_cartella[c_id] += 1
+            punti_c = self.punti_cartella[c_id]
+            self.carte_per_punti[punti_c - 1] -= 1
+            self.carte_per_punti[punti_c] += 1
+            g_idx = self.cartella_giocatore[c_id]
+            punti = self.punti_riga[r_id]
+            if punti > self.migliore_riga[c_id]:
+                # La riga sale di un punto alla volta: la migliore della cartella era punti - 1
+                self.carte_per_riga[punti - 1] -= 1
+                self.carte_per_riga[punti] += 1
+                self.migliore_riga[c_id] = punti
+            if punti > self.max_riga[g_idx]:
+                for k in range(self.max_riga[g_idx] + 1, punti + 1): self.soglie[k].add(g_idx)
+                self.max_riga[g_idx] = punti
+            if punti_c > self.max_cartella[g_idx]: self.max_cartella[g_idx] = punti_c
+            if punti_c == 15: self.tombole.add(g_idx)
+
+    def sincronizza(self, numeri_estratti):
+        with self.lock:
+            # Motore nuovo su partita avviata: conteggi in blocco via popcount
+            if not self.applicati and len(numeri_estratti) > 1:
+                self._ricalcola(numeri_estratti)
+                return
+            # Altrimenti applica solo i numeri non ancora visti (di norma: l'ultimo estratto)
+            for n in numeri_estratti[len(self.applicati):]: self._applica(n)
+
+    def _ricalcola(self, numeri_estratti):
+        self.applicati = list(numeri_estratti)
+        self.maschera_estratti = maschera_numeri(numeri_estratti)
+        self.carte_per_riga = [0] * 6
+        self.carte_per_punti = [0] * 16
+        r_id = 0
+        for c_id, cartella in enumerate(self.cartelle):
+            g_idx = self.cartella_giocatore[c_id]
+            for punti in cartella.punti_righe(self.maschera_estratti):
+                self.punti_riga[r_id] = punti
+                r_id += 1
+                if punti > self.migliore_riga[c_id]: self.migliore_riga[c_id] = punti
+            if self.migliore_riga[c_id] > self.max_riga[g_idx]: self.max_riga[g_idx] = self.migliore_riga[c_id]
+            punti_c = cartella.punti(self.maschera_estratti)
+            self.punti_cartella[c_id] = punti_c
+            self.carte_per_riga[self.migliore_riga[c_id]] += 1
+            self.carte_per_punti[punti_c] += 1
+            if punti_c > self.max_cartella[g_idx]: self.max_cartella[g_idx] = punti_c
+            if punti_c == 15: self.tombole.add(g_idx)
+        for g_idx, migliore in enumerate(self.max_riga):
+            for k in range(1, migliore + 1): self.soglie[k].add(g_idx)
+
+    def allineato(self, numeri_estratti):
+        n = len(self.applicati)
+        return len(numeri_estratti) >= n and (n == 0 or numeri_estratti[n - 1] == self.applicati[-1])
+
+    def vincitori(self, target):
+        with self.lock:
+            if target <= 5: gruppo = self.soglie.get(target, ())
+            elif target == 15: gruppo = self.tombole
+            else: gruppo = ()
+            # Stesso ordine del vecchio scan: ordine di ingresso dei giocatori
+            return [self.nomi[g_idx] for g_idx in sorted(gruppo)]
+
+    # --- DISTANZA DAL PREMIO ---
+    def distanza_cartella(self, c_id, target):
+        migliore = self.migliore_riga[c_id] if target <= 5 else self.punti_cartella[c_id]
+        return max(0, target - migliore)
+
+    def distanza_giocatore(self, nome_g, target):
+        # Quanti numeri mancano alla cartella migliore del giocatore (None se non gioca)
+        g_idx = self.indice_nomi.get(nome_g)
+        if g_idx is None: return None
+        with self.lock: migliore = self.max_riga[g_idx] if target <= 5 else self.max_cartella[g_idx]
+        return max(0, target - migliore)
+
+    def in_attesa(self, target, distanza=1):
+        # Cartelle a esattamente `distanza` numeri dal premio
+        if target <= 5: bucket = self.carte_per_riga
+        elif target == 15: bucket = self.carte_per_punti
+        else: return 0
+        punti = target - distanza
+        with self.lock: return bucket[punti] if distanza >= 1 and punti >= 0 else 0
+
+    def distribuzione(self, target, fino_a=3):
+        # Sotto un solo lock: i tre conteggi vengono dalla stessa estrazione
+        with self.lock: return [self.in_attesa(target, d) for d in range(1, fino_a + 1)]
+
+    def estrai(self, numero, target):
+        with self.lock:
+            self._applica(numero)
+            return self.vincitori(target)
+
+
+# --- REGISTRO MOTORI PER STANZA (condiviso dal processo) ---
+_MOTORI = {}
+_MOTORI_LOCK = threading.Lock()
+
+def _firma(dati_stanza):
+    if dati_stanza.get("sala"):
+        # Sala grande: gli iscritti sono congelati all'avvio, bastano gli aggregati
+        totali = dati_stanza["totali"]
+        return (dati_stanza.get("created_at"), "sala", totali["giocatori"], totali["cartelle"])
+    return (dati_stanza.get("created_at"), tuple(cartelle_per_giocatore(dati_stanza).items()))
+
+def motore_per_stanza(nome_stanza, dati_stanza, carica_giocatori=None, lettura=False):
+    # carica_giocatori() -> {nome: cartelle}: chiamata solo quando il motore va (ri)costruito.
+    # lettura=True (viste dei client): se il motore è già più avanti di questi dati si restituisce None
+    # invece di ricostruirlo, il client ha solo letto una versione vecchia
+    firma = _firma(dati_stanza)
+    with _MOTORI_LOCK:
+        voce = _MOTORI.get(nome_stanza)
+        if lettura and voce is not None and voce[0] == firma and len(voce[1].applicati) > len(dati_stanza["numeri_estratti"]):
+            return None
+        if voce is None or voce[0] != firma or not voce[1].allineato(dati_stanza["numeri_estratti"]):
+            giocatori = carica_giocatori() if carica_giocatori is not None else dati_stanza["giocatori"]
+            voce = (firma, MotoreVincite(giocatori))
+            _MOTORI[nome_stanza] = voce
+        motore = voce[1]
+        # Controllo di allineamento e avanzamento insieme; sotto c'è anche il lock del motore (sempre dopo questo)
+        motore.sincronizza(dati_stanza["numeri_estratti"])
+    return motore
+
+def dimentica_motore(nome_stanza):
+    with _MOTORI_LOCK:
+        _MOTORI.pop(nome_stanza, None)
@@ -0,0 +1,139 @@
+import random
+from datetime import datetime
+
+from tombola_core import MAX_GIOCATORI, MossaNonValida, applica_evento, evento_ingresso, nuovi_totali
+from motore_vincite import motore_per_stanza, dimentica_motore
+from classifica import dimentica_classifica
+from generatore_cartelle import GeneratoreCartelle
+from indice_cartelle import cartelle_uniche, registra_ingresso, emetti_sala, dimentica_indice
+import metriche
+
+# --- OPERAZIONI DI PARTITA (SENZA INTERFACCIA) ---
+# Tutto quello che si fa su una stanza, fuori da Streamlit: la pagina web, la regia, i worker,
+# i simulatori e i benchmark chiamano le stesse funzioni. Ognuna riceve lo storage (storage_tombola)
+# e lascia risalire ErroreStorage / MossaNonValida: il messaggio per l'utente lo decide chi chiama.
+# Niente import di UI o driver DB qui: numpy e i driver si caricano solo quando servono.
+
+def nuova_stanza(admin_pwd, sala=False, max_giocatori=None):
+    numeri = list(range(1, 91)); random.shuffle(numeri)
+    dati = {
+        "admin_pwd": admin_pwd, "created_at": str(datetime.now()),
+        "stato": "LOBBY",
+        "audio_attivo": True, # DEFAULT AUDIO ON
+        "numeri_tabellone": numeri, "numeri_estratti": [],
+        "ultimo_numero": None, "messaggio_audio": "", "messaggio_toast": "",
+        "giocatori": {}, "classifica_vincite": {}, "totali": nuovi_totali(),
+        "obbiettivo_corrente": 2, "gioco_finito": False
+    }
+    if sala: dati.update(sala=True, max_giocatori=int(max_giocatori))
+    return dati
+
+def crea_stanza(storage, nome_stanza, admin_pwd, sala=False, max_giocatori=None):
+    # -> (dati, esisteva): una stanza con lo stesso nome viene azzerata
+    esisteva = storage.carica(nome_stanza)[1] is not None
+    dati = nuova_stanza(admin_pwd, sala, max_giocatori)
+    storage.prepara_sala(nome_stanza, dati.get("max_giocatori"))
+    if storage.persistenza_eventi:
+        storage.registra(nome_stanza, dati, {"t": "creazione", "created_at": dati["created_at"], "tabellone": dati["numeri_tabellone"]})
+    storage.salva(nome_stanza, dati)
+    return dati, esisteva
+
+def entra_in_stanza(storage, nome_stanza, nome_giocatore, n_cartelle):
+    # -> "ok" (nuovo ingresso) | "presente" (rientro); MossaNonValida se non si può entrare
+    dati = storage.carica(nome_stanza)[1]
+    if not dati or dati.get("tipo") == "torneo": raise MossaNonValida("Stanza non trovata.")
+    sala = dati.get("sala", False)
+    gia_presente = storage.cartelle_giocatore(nome_stanza, nome_giocatore) is not None if sala else nome_giocatore in dati["giocatori"]
+    if gia_presente: return "presente"
+    if dati.get("stato", "LOBBY") != "LOBBY":
+        raise MossaNonValida("🚫 Concerto già iniziato! La biglietteria è chiusa.")
+    if dati.get("torneo"):
+        # Le cartelle delle altre stanze del torneo, se questo processo non le ha (o le ha vecchie).
+        # Import qui: torneo importa partita
+        from torneo import allinea_indice_torneo
+        allinea_indice_torneo(storage, dati["torneo"])
+    if sala:
+        # Sala grande: una riga per giocatore e un contatore di posti, niente riscrittura del blob.
+        # Le cartelle si prenotano nell'indice (della stanza o del torneo) prima dell'iscrizione e si liberano se non va
+        indice, cartelle = emetti_sala(storage, nome_stanza, dati, n_cartelle)
+        try:
+            esito = storage.iscrivi_giocatore(nome_stanza, nome_giocatore, cartelle)
+        except Exception:
+            indice.togli(nome_stanza, cartelle)
+            raise
+        if esito != "ok": indice.togli(nome_stanza, cartelle)
+        if esito == "piena": raise MossaNonValida("Sala piena o biglietteria chiusa.")
+        return esito
+    if len(dati["giocatori"]) >= MAX_GIOCATORI: raise MossaNonValida("Stanza piena.")
+    # Posto e stato LOBBY si ricontrollano sulla versione che si va a scrivere
+    cartelle = GeneratoreCartelle.genera_lotto(n_cartelle)
+    esito = ["presente"]
+    def ingresso(dati_freschi):
+        evento = evento_ingresso(dati_freschi, nome_giocatore, cartelle)
+        if evento is None: return []
+        # Nessuna cartella uguale a una già emessa nella stanza (o nel suo torneo)
+        evento["c"] = cartelle_uniche(nome_stanza, dati_freschi, cartelle)
+        applica_evento(dati_freschi, evento)
+        registra_ingresso(nome_stanza, dati_freschi, evento["c"])
+        esito[0] = "ok"
+        return [evento]
+    versione, _ = storage.aggiorna(nome_stanza, ingresso)
+    if versione is None: raise MossaNonValida("Stanza non trovata.")
+    return esito[0]
+
+def applica_a_stanza(storage, nome_stanza, *eventi):
+    # Toggle e cambi di stato: rilettura + scrittura condizionata, non si sovrascrivono estrazioni o ingressi altrui
+    def modifica(dati):
+        for evento in eventi: applica_evento(dati, evento)
+        return list(eventi)
+    return storage.aggiorna(nome_stanza, modifica)
+
+def avvia_partita(storage, nome_stanza, dati_stanza):
+    eventi = [{"t": "set", "k": "stato", "v": "IN_CORSO"}]
+    if dati_stanza.get("sala"):
+        # Si chiude la biglietteria e si congelano i totali nel blob: da qui il motore li usa come firma
+        totali = storage.chiudi_iscrizioni(nome_stanza)
+        eventi.insert(0, {"t": "set", "k": "totali", "v": {"giocatori": totali["giocatori"], "cartelle": totali["cartelle"]}})
+    return applica_a_stanza(storage, nome_stanza, *eventi)
+
+# --- ESTRAZIONE ---
+def carica_giocatori_di(storage, nome_stanza, dati_stanza):
+    # In sala grande il motore prende le cartelle dallo storage, solo quando va (ri)costruito da chi estrae.
+    # Letture e viste giocatore il motore non lo usano: vincite e "in_attesa" arrivano dagli eventi
+    if dati_stanza.get("sala"): return lambda: storage.giocatori_sala(nome_stanza)
+    return None
+
+def estrazione_stanza(storage, nome_stanza, dati_stanza, numero):
+    # Un numero applicato alla stanza col motore condiviso: -> (eventi da registrare, vincita)
+    evento = {"t": "estrazione", "n": numero}
+    obbiettivo = dati_stanza.get("obbiettivo_corrente", 2)
+    # Il registro riallinea da solo il motore se un tentativo precedente è andato a vuoto
+    motore = motore_per_stanza(nome_stanza, dati_stanza, carica_giocatori_di(storage, nome_stanza, dati_stanza))
+    win = applica_evento(dati_stanza, evento, motore)
+    # Chi rilegge dal log non ricalcola le vincite (storage_tombola.ricostruisci): gliele dà il log
+    if "in_attesa" in dati_stanza: evento["a"] = dati_stanza["in_attesa"]
+    eventi = [evento]
+    if dati_stanza.get("obbiettivo_corrente", 2) != obbiettivo or dati_stanza.get("gioco_finito"):
+        eventi.append({"t": "vincita", "p": obbiettivo, "v": motore.vincitori(obbiettivo)})
+    return eventi, win
+
+def estrai_numero(storage, nome_stanza):
+    # Regia e admin possono premere insieme: l'estrazione si rifà sui dati riletti se qualcuno ha scritto prima.
+    # -> (estratto, vincita)
+    esito = [False, False]
+    def estrazione(dati_stanza):
+        esito[:] = [False, False]
+        if dati_stanza.get("stato") != "IN_CORSO" or not dati_stanza["numeri_tabellone"] or dati_stanza.get("gioco_finito"):
+            return []
+        eventi, win = estrazione_stanza(storage, nome_stanza, dati_stanza, dati_stanza["numeri_tabellone"][0])
+        esito[:] = [True, win]
+        return eventi
+    storage.aggiorna(nome_stanza, estrazione)
+    if esito[0]: metriche.conta("estrazioni", stanza=nome_stanza)
+    return esito[0], esito[1]
+
+def dimentica_stanza(nome_stanza):
+    # Stato di processo derivato dalla stanza (motore vincite, classifica, indice delle cartelle)
+    dimentica_motore(nome_stanza)
+    dimentica_classifica(nome_stanza)
+    dimentica_indice(nome_stanza)
@@ -0,0 +1,176 @@
+import threading
+import time
+from collections import deque
+
+import metriche
+
+# --- POOL DI CONNESSIONI (condiviso da tutto il processo) ---
+# Streamlit riesegue tombola_web.py a ogni rerun, quindi il pool vive qui:
+# i moduli importati restano in sys.modules e sopravvivono ai rerun.
+
+class PoolEsaurito(Exception):
+    pass
+
+
+class ConnessionePool:
+    # Proxy della connessione reale: close() la restituisce al pool invece di chiuderla.
+    def __init__(self, pool, conn):
+        self._pool = pool
+        self._conn = conn
+        self._rilasciata = False
+
+    def __getattr__(self, nome):
+        return getattr(self._conn, nome)
+
+    def close(self):
+        if not self._rilasciata:
+            self._rilasciata = True
+            self._pool.rilascia(self._conn)
+
+    def scarta(self):
+        # Da usare quando la connessione è in uno stato non riutilizzabile
+        if not self._rilasciata:
+            self._rilasciata = True
+            self._pool.rilascia(self._conn, scarta=True)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class PoolConnessioni:
+    def __init__(self, crea_connessione, dimensione=5, timeout_checkout=10.0, intervallo_verifica=30.0, verifica=None):
+        self.crea_connessione = crea_connessione
+        self.dimensione = max(1, int(dimensione))
+        self.timeout_checkout = float(timeout_checkout)
+        self.intervallo_verifica = float(intervallo_verifica)
+        self.verifica = verifica or (lambda conn: conn.is_connected())
+        self._libere = deque()  # (connessione, istante ultimo uso)
+        self._aperte = 0
+        self._chiuso = False
+        self._cond = threading.Condition()
+        self._stat = {
+            "checkout": 0, "attese": 0, "timeout": 0, "riconnessioni": 0,
+            "create": 0, "scartate": 0, "in_uso": 0, "picco_in_uso": 0,
+            "tempo_attesa_tot": 0.0,
+        }
+
+    def acquisisci(self):
+        inizio = time.monotonic()
+        scadenza = inizio + self.timeout_checkout
+        ha_atteso = False
+        with self._cond:
+            while True:
+                if self._chiuso: raise PoolEsaurito("Pool chiuso")
+                if self._libere:
+                    conn, ultimo_uso = self._libere.pop()
+                    break
+                if self._aperte < self.dimensione:
+                    self._aperte += 1
+                    conn, ultimo_uso = None, None
+                    break
+                restante = scadenza - time.monotonic()
+                if restante <= 0:
+                    self._stat["timeout"] += 1
+                    raise PoolEsaurito(f"Nessuna connessione libera entro {self.timeout_checkout}s (pool da {self.dimensione})")
+                if not ha_atteso:
+                    ha_atteso = True
+                    self._stat["attese"] += 1
+                self._cond.wait(restante)
+            self._stat["checkout"] += 1
+            self._stat["in_uso"] += 1
+            self._stat["picco_in_uso"] = max(self._stat["picco_in_uso"], self._stat["in_uso"])
+            if ha_atteso: self._stat["tempo_attesa_tot"] += time.monotonic() - inizio
+
+        # Connessione e health check fuori dal lock: sono round trip di rete
+        try:
+            if conn is None:
+                conn = self._nuova()
+            elif time.monotonic() - ultimo_uso >= self.intervallo_verifica and not self._sana(conn):
+                self._chiudi(conn)
+                conn = self._nuova()
+                with self._cond: self._stat["riconnessioni"] += 1
+        except Exception:
+            with self._cond:
+                self._aperte -= 1
+                self._stat["in_uso"] -= 1
+                self._cond.notify()
+            raise
+        return ConnessionePool(self, conn)
+
+    def rilascia(self, conn, scarta=False):
+        # A pool chiuso le connessioni che rientrano si chiudono
+        with self._cond: scarta = scarta or self._chiuso
+        if scarta:
+            self._chiudi(conn)
+        with self._cond:
+            self._stat["in_uso"] -= 1
+            if scarta:
+                self._aperte -= 1
+                self._stat["scartate"] += 1
+            else:
+                self._libere.append((conn, time.monotonic()))
+            self._cond.notify()
+
+    def statistiche(self):
+        with self._cond:
+            s = dict(self._stat)
+            s["aperte"] = self._aperte
+            s["libere"] = len(self._libere)
+            s["dimensione"] = self.dimensione
+        s["attesa_media_ms"] = round(1000 * s["tempo_attesa_tot"] / s["attese"], 2) if s["attese"] else 0.0
+        return s
+
+    @property
+    def chiuso(self):
+        return self._chiuso
+
+    def chiudi_tutte(self):
+        # Chi è in attesa si sveglia subito con PoolEsaurito invece di aspettare il timeout
+        with self._cond:
+            self._chiuso = True
+            libere = list(self._libere)
+            self._libere.clear()
+            self._aperte -= len(libere)
+            self._cond.notify_all()
+        for conn, _ in libere:
+            self._chiudi(conn)
+
+    def _nuova(self):
+        with metriche.misura("db_connessione"):
+            conn = self.crea_connessione()
+        with self._cond: self._stat["create"] += 1
+        return conn
+
+    def _sana(self, conn):
+        try:
+            return bool(self.verifica(conn))
+        except Exception:
+            return False
+
+    @staticmethod
+    def _chiudi(conn):
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+
+# --- REGISTRO DEI POOL DI PROCESSO ---
+_POOLS = {}
+_POOLS_LOCK = threading.Lock()
+
+def get_pool(chiave, crea_connessione, **opzioni):
+    with _POOLS_LOCK:
+        pool = _POOLS.get(chiave)
+        if pool is None or pool.chiuso:
+            pool = PoolConnessioni(crea_connessione, **opzioni)
+            _POOLS[chiave] = pool
+        return pool
+
+def statistiche_pool():
+    with _POOLS_LOCK:
+        pools = dict(_POOLS)
+    return {chiave: pool.statistiche() for chiave, pool in pools.items()}
@@ -0,0 +1,133 @@
+import heapq
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+# --- REGIA AUTO-PLAY LATO SERVER ---
+# Un unico thread di processo tiene il calendario delle estrazioni di tutte le stanze.
+# La pagina admin manda solo comandi (avvia / pausa / intervallo): se la scheda
+# rallenta o si chiude, la partita continua; al rientro l'admin ritrova lo stato qui.
+
+MAX_ERRORI_CONSECUTIVI = 5
+
+class RegiaAutoplay:
+    def __init__(self, max_thread=4):
+        self._stanze = {}
+        self._coda = []          # (istante, generazione, nome)
+        self._cond = threading.Condition()
+        self._esecutore = ThreadPoolExecutor(max_workers=max_thread, thread_name_prefix="regia-estrazione")
+        self._thread = None
+
+    # --- COMANDI ---
+    def avvia(self, nome_stanza, intervallo, estrai):
+        # estrai(nome_stanza) -> (estratto, vincita); viene sostituita a ogni avvio
+        with self._cond:
+            voce = self._stanze.setdefault(nome_stanza, {"estrazioni": 0, "errori": 0, "generazione": 0, "in_corso": False})
+            voce.update(attivo=True, intervallo=float(intervallo), estrai=estrai, motivo="", errori=0)
+            self._pianifica(nome_stanza, voce, time.monotonic() + voce["intervallo"])
+            self._assicura_thread()
+            self._cond.notify()
+
+    def pausa(self, nome_stanza, motivo="pausa"):
+        with self._cond:
+            voce = self._stanze.get(nome_stanza)
+            if voce is not None and voce["attivo"]:
+                voce.update(attivo=False, motivo=motivo, prossima=None)
+                voce["generazione"] += 1
+                self._cond.notify()
+
+    def imposta_intervallo(self, nome_stanza, intervallo):
+        with self._cond:
+            voce = self._stanze.get(nome_stanza)
+            if voce is None: return
+            voce["intervallo"] = float(intervallo)
+            if voce["attivo"] and not voce["in_corso"]:
+                self._pianifica(nome_stanza, voce, time.monotonic() + voce["intervallo"])
+                self._cond.notify()
+
+    def rimuovi(self, nome_stanza):
+        with self._cond:
+            voce = self._stanze.pop(nome_stanza, None)
+            if voce is not None: voce["generazione"] += 1
+            self._cond.notify()
+
+    def stato(self, nome_stanza):
+        with self._cond:
+            voce = self._stanze.get(nome_stanza)
+            if voce is None:
+                return {"attivo": False, "intervallo": None, "restante": None, "motivo": "", "estrazioni": 0}
+            restante = max(0.0, voce["prossima"] - time.monotonic()) if voce.get("prossima") else None
+            return {
+                "attivo": voce["attivo"], "intervallo": voce["intervallo"], "restante": restante,
+                "motivo": voce["motivo"], "estrazioni": voce["estrazioni"],
+            }
+
+    # --- CICLO ---
+    def _pianifica(self, nome_stanza, voce, istante):
+        voce["generazione"] += 1
+        voce["prossima"] = istante
+        heapq.heappush(self._coda, (istante, voce["generazione"], nome_stanza))
+
+    def _assicura_thread(self):
+        if self._thread is None or not self._thread.is_alive():
+            self._thread = threading.Thread(target=self._ciclo, name="regia-autoplay", daemon=True)
+            self._thread.start()
+
+    def _ciclo(self):
+        while True:
+            with self._cond:
+                while True:
+                    # Scarta le voci superate (pausa, nuovo intervallo, stanza rimossa)
+                    while self._coda:
+                        istante, generazione, nome = self._coda[0]
+                        voce = self._stanze.get(nome)
+                        if voce is not None and voce["attivo"] and voce["generazione"] == generazione: break
+                        heapq.heappop(self._coda)
+                    attesa = self._coda[0][0] - time.monotonic() if self._coda else None
+                    if attesa is not None and attesa <= 0: break
+                    self._cond.wait(attesa)
+                _, _, nome = heapq.heappop(self._coda)
+                voce = self._stanze[nome]
+                voce["in_corso"] = True
+                voce["prossima"] = None
+                estrai = voce["estrai"]
+            self._esecutore.submit(self._esegui, nome, estrai)
+
+    def _esegui(self, nome_stanza, estrai):
+        try:
+            esito, vinta = estrai(nome_stanza)
+            errore = None
+        except Exception as e:
+            esito, vinta, errore = True, False, e
+        with self._cond:
+            voce = self._stanze.get(nome_stanza)
+            if voce is None: return
+            voce["in_corso"] = False
+            if errore is not None:
+                voce["errori"] += 1
+                voce["motivo"] = f"errore: {errore}"
+                if voce["errori"] >= MAX_ERRORI_CONSECUTIVI:
+                    voce["attivo"] = False
+                    return
+            else:
+                voce["errori"] = 0
+                if esito: voce["estrazioni"] += 1
+            if not esito:
+                voce.update(attivo=False, motivo="fine")
+            elif vinta:
+                # Come prima: dopo una vincita l'auto-play si ferma e l'admin riparte a mano
+                voce.update(attivo=False, motivo="vincita")
+            elif voce["attivo"]:
+                self._pianifica(nome_stanza, voce, time.monotonic() + voce["intervallo"])
+                self._cond.notify()
+
+
+# --- ISTANZA DI PROCESSO ---
+_REGIA = None
+_REGIA_LOCK = threading.Lock()
+
+def get_regia():
+    global _REGIA
+    with _REGIA_LOCK:
+        if _REGIA is None: _REGIA = RegiaAutoplay()
+        return _REGIA
@@ -0,0 +1,84 @@
+import threading
+from collections import OrderedDict
+from cartelle import maschera_numeri, numeri_da_maschera, estratto
+import metriche
+
+# --- RENDER HTML MEMOIZZATO ---
+# Tabellone e cartelle cambiano solo quando esce un numero: tra un rerun e l'altro
+# l'HTML si riprende dalla cache invece di ricostruirlo cella per cella.
+
+class RenderTabellone:
+    def __init__(self, max_voci=64):
+        # Template precalcolato: per ogni numero la cella spenta e quella estratta
+        self._celle = [None] + [(f'<div class="c ">{i}</div>', f'<div class="c Ex">{i}</div>') for i in range(1, 91)]
+        self._ultima = (0, [self._celle[i][0] for i in range(1, 91)])
+        self._cache = OrderedDict()
+        self._max_voci = max_voci
+        self._lock = threading.Lock()
+
+    def html(self, maschera_estratti):
+        with self._lock:
+            h = self._cache.get(maschera_estratti)
+            if h is not None:
+                self._cache.move_to_end(maschera_estratti)
+                metriche.conta("render_cache", tipo="tabellone", esito="hit")
+                return h
+            metriche.conta("render_cache", tipo="tabellone", esito="miss")
+            # Si parte dall'ultimo tabellone e si cambiano solo le celle diverse
+            with metriche.misura("render_html", tipo="tabellone"):
+                ultima_maschera, celle = self._ultima
+                celle = list(celle)
+                for n in numeri_da_maschera(ultima_maschera ^ maschera_estratti):
+                    celle[n - 1] = self._celle[n][estratto(maschera_estratti, n)]
+                h = '<div class="g">' + "".join(celle) + '</div>'
+            self._ultima = (maschera_estratti, celle)
+            self._cache[maschera_estratti] = h
+            if len(self._cache) > self._max_voci: self._cache.popitem(last=False)
+            return h
+
+
+class RenderCartelle:
+    def __init__(self, max_voci=4096):
+        self._cache = OrderedDict()
+        self._maschere = OrderedDict()
+        self._max_voci = max_voci
+        self._lock = threading.Lock()
+
+    def html(self, matrice, indice, maschera_estratti):
+        # Chiave: identità della cartella + soli estratti che la toccano
+        cartella = tuple(map(tuple, matrice))
+        with self._lock:
+            maschera = self._maschere.get(cartella)
+            if maschera is None:
+                maschera = maschera_numeri(n for riga in cartella for n in riga)
+                self._maschere[cartella] = maschera
+                if len(self._maschere) > self._max_voci: self._maschere.popitem(last=False)
+            chiave = (cartella, indice, maschera_estratti & maschera)
+            h = self._cache.get(chiave)
+            if h is not None:
+                self._cache.move_to_end(chiave)
+                metriche.conta("render_cache", tipo="cartella", esito="hit")
+                return h
+        metriche.conta("render_cache", tipo="cartella", esito="miss")
+        with metriche.misura("render_html", tipo="cartella"):
+            h = f"<b>C. {indice+1}</b><table class='ct'>"
+            for r in cartella:
+                h += "<tr>"
+                for v in r: h += f"<td class='cc {'ce' if v==0 else ('ch' if estratto(maschera_estratti, v) else '')}'>{v if v!=0 else ''}</td>"
+                h += "</tr>"
+            h += "</table>"
+        with self._lock:
+            self._cache[chiave] = h
+            if len(self._cache) > self._max_voci: self._cache.popitem(last=False)
+        return h
+
+
+# --- ISTANZE DI PROCESSO ---
+_TABELLONE = RenderTabellone()
+_CARTELLE = RenderCartelle()
+
+def html_tabellone(maschera_estratti):
+    return _TABELLONE.html(maschera_estratti)
+
+def html_cartella(matrice, indice, maschera_estratti):
+    return _CARTELLE.html(matrice, indice, maschera_estratti)
@@ -0,0 +1,225 @@
+import argparse
+import json
+import os
+import platform
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+
+from tombola_core import COSTO_CARTELLA, QUOTE
+from generatore_cartelle import GeneratoreCartelle
+
+# --- SIMULATORE MONTE CARLO DEI PREMI ---
+# Stesse cartelle (genera_array) e stesse regole di controlla_vincite, ma a lotti di partite in array NumPy:
+# per ogni partita si calcola il rango di estrazione di ogni numero, da lì il momento in cui ogni riga fa
+# 2..5 punti e ogni cartella è piena. I premi si assegnano in ordine, uno per estrazione, a tutti i
+# giocatori che in quel momento ce l'hanno (quota divisa come nel gioco). I lotti girano su più processi.
+# Uso: python simulatore_tombola.py --giocatori 10 40 --cartelle 1 6 --partite 1000000 --output sim.json
+#      python simulatore_tombola.py --quote 2=0.10 3=0.15 4=0.20 5=0.20 15=0.35
+#      python simulatore_tombola.py --verifica 200   (confronto col motore vero, partita per partita)
+
+PREMI = (2, 3, 4, 5, 15)
+NOMI_PREMI = {2: "AMBO", 3: "TERNO", 4: "QUATERNA", 5: "CINQUINA", 15: "TOMBOLA"}
+CARTELLE_PER_LOTTO = 50000     # tiene i temporanei di genera_array sotto i 200 MB per processo
+
+
+def _esiti(carte, ordine, giocatori, cartelle):
+    # carte: (partite * giocatori * cartelle, 3, 9), ordine: (partite, 90) numeri nell'ordine di estrazione
+    # -> estrazione (0-based, 90 = mai) e numero di vincitori di ogni premio, array (partite, 5)
+    import numpy as np
+    partite = ordine.shape[0]
+    rango = np.zeros((partite, 91), dtype=np.int8)
+    np.put_along_axis(rango, ordine.astype(np.intp), np.arange(90, dtype=np.int8)[None, :], axis=1)
+    righe = np.sort(carte, axis=2)[:, :, 4:]                       # i 5 numeri di ogni riga
+    tempi_riga = np.take_along_axis(rango, righe.reshape(partite, -1).astype(np.intp), axis=1)
+    tempi_riga = np.sort(tempi_riga.reshape(partite, giocatori, cartelle * 3, 5), axis=3)
+    # Per giocatore: quando una sua riga arriva a k punti (k = 2..5) e quando una sua cartella è piena
+    per_riga = tempi_riga.min(axis=2)[:, :, 1:]
+    piena = tempi_riga[:, :, :, 4].reshape(partite, giocatori, cartelle, 3).max(axis=3).min(axis=2)
+    arrivi = np.concatenate([per_riga, piena[:, :, None]], axis=2).astype(np.int16)
+    estrazione = np.empty((partite, len(PREMI)), dtype=np.int16)
+    vincitori = np.zeros((partite, len(PREMI)), dtype=np.int32)
+    precedente = np.full(partite, -1, dtype=np.int16)
+    for i in range(len(PREMI)):
+        # Un premio per estrazione: se il precedente è uscito adesso, questo si controlla alla prossima
+        t = np.maximum(arrivi[:, :, i].min(axis=1), precedente + 1)
+        assegnato = t < 90
+        estrazione[:, i] = np.where(assegnato, t, 90)
+        vincitori[:, i] = np.where(assegnato, (arrivi[:, :, i] <= t[:, None]).sum(axis=1), 0)
+        precedente = t
+    return estrazione, vincitori
+
+
+def _simula_lotto(giocatori, cartelle, partite, seme):
+    import numpy as np
+    rng = np.random.default_rng(seme)
+    carte = GeneratoreCartelle.genera_array(partite * giocatori * cartelle, rng)
+    ordine = rng.permuted(np.tile(np.arange(1, 91, dtype=np.int8), (partite, 1)), axis=1)
+    estrazione, vincitori = _esiti(carte, ordine, giocatori, cartelle)
+    return {
+        "partite": partite,
+        "estrazione": np.stack([np.bincount(estrazione[:, i], minlength=91) for i in range(len(PREMI))]),
+        "vincitori": np.stack([np.bincount(vincitori[:, i], minlength=giocatori + 1) for i in range(len(PREMI))]),
+    }
+
+
+def _somma(totale, lotto):
+    if totale is None: return lotto
+    return {k: totale[k] + lotto[k] for k in totale}
+
+
+def _percentile(istogramma, p):
+    soglia = p * istogramma.sum()
+    return int((istogramma.cumsum() >= soglia).argmax()) + 1
+
+
+def riassumi(giocatori, cartelle, conteggi, quote=QUOTE, costo=COSTO_CARTELLA):
+    # Economia come get_info_economiche / controlla_vincite: valore arrotondato, quota intera per vincitore
+    import numpy as np
+    partite = conteggi["partite"]
+    carte_totali = giocatori * cartelle
+    montepremi = carte_totali * costo
+    premi, pagato_totale = {}, 0.0
+    for i, p in enumerate(PREMI):
+        ist = conteggi["estrazione"][i][:90]
+        ist_v = conteggi["vincitori"][i]
+        assegnati = int(ist.sum())
+        valore = round(montepremi * quote[p])
+        n_vinc = np.arange(len(ist_v))
+        pagato = float((ist_v[1:] * (valore // n_vinc[1:]) * n_vinc[1:]).sum()) / partite
+        pagato_totale += pagato
+        premi[NOMI_PREMI[p]] = {
+            "valore": valore,
+            "estrazione": {
+                "media": round(float((ist * np.arange(1, 91)).sum()) / assegnati, 2) if assegnati else None,
+                "p10": _percentile(ist, 0.10) if assegnati else None,
+                "p50": _percentile(ist, 0.50) if assegnati else None,
+                "p90": _percentile(ist, 0.90) if assegnati else None,
+            },
+            "non_assegnato": round(1 - assegnati / partite, 6),
+            "diviso": round(float(ist_v[2:].sum()) / assegnati, 4) if assegnati else 0.0,
+            "vincitori_medi": round(float((ist_v * n_vinc).sum()) / assegnati, 3) if assegnati else 0.0,
+            "pagato_per_cartella": round(pagato / carte_totali, 4),
+        }
+    return {
+        "giocatori": giocatori, "cartelle_per_giocatore": cartelle, "partite": partite,
+        "montepremi": montepremi, "premi": premi,
+        "pagato_per_cartella": round(pagato_totale / carte_totali, 4),
+        "ritorno": round(pagato_totale / carte_totali / costo, 4),   # resto degli arrotondamenti al banco
+    }
+
+
+def simula(giocatori, cartelle, partite, seed=None, processi=None, esecutore=None):
+    # esecutore: pool già aperto (più scenari di fila); altrimenti se ne apre uno con `processi` processi
+    import numpy as np
+    processi = processi or os.cpu_count() or 1
+    per_lotto = max(1, min(partite, CARTELLE_PER_LOTTO // (giocatori * cartelle)))
+    lotti = [per_lotto] * (partite // per_lotto) + ([partite % per_lotto] if partite % per_lotto else [])
+    semi = np.random.SeedSequence(seed).spawn(len(lotti))
+    argomenti = ([giocatori] * len(lotti), [cartelle] * len(lotti), lotti, semi)
+    blocco = max(1, len(lotti) // (8 * processi))
+    totale = None
+    if esecutore is None and processi > 1:
+        with ProcessPoolExecutor(max_workers=processi) as pool:
+            for lotto in pool.map(_simula_lotto, *argomenti, chunksize=blocco): totale = _somma(totale, lotto)
+    elif esecutore is not None:
+        for lotto in esecutore.map(_simula_lotto, *argomenti, chunksize=blocco): totale = _somma(totale, lotto)
+    else:
+        for lotto in map(_simula_lotto, *argomenti): totale = _somma(totale, lotto)
+    return totale
+
+
+# --- VERIFICA CONTRO IL MOTORE DI GIOCO ---
+def verifica(giocatori, cartelle, partite, seed=None):
+    # Stesse cartelle e stesso ordine di estrazione giocati con tombola_core: premi, estrazione e vincitori uguali
+    import numpy as np
+    from tombola_core import esegui_estrazione
+    from motore_vincite import MotoreVincite
+    rng = np.random.default_rng(seed)
+    carte = GeneratoreCartelle.genera_array(partite * giocatori * cartelle, rng)
+    ordine = rng.permuted(np.tile(np.arange(1, 91, dtype=np.int8), (partite, 1)), axis=1)
+    estrazione, vincitori = _esiti(carte, ordine, giocatori, cartelle)
+    lista = carte.tolist()
+    for g in range(partite):
+        base = g * giocatori * cartelle
+        dati = {
+            "giocatori": {f"G{i}": lista[base + i * cartelle: base + (i + 1) * cartelle] for i in range(giocatori)},
+            "numeri_tabellone": [int(n) for n in ordine[g]], "numeri_estratti": [], "classifica_vincite": {},
+            "messaggio_audio": "", "obbiettivo_corrente": 2, "gioco_finito": False,
+            "totali": {"giocatori": giocatori, "cartelle": giocatori * cartelle},
+        }
+        motore = MotoreVincite(dati["giocatori"])
+        attesi = {}
+        while dati["numeri_tabellone"] and not dati["gioco_finito"]:
+            obiettivo = dati["obbiettivo_corrente"]
+            esegui_estrazione(dati, dati["numeri_tabellone"][0], motore)
+            if dati["obbiettivo_corrente"] != obiettivo or dati["gioco_finito"]:
+                attesi[obiettivo] = (len(dati["numeri_estratti"]) - 1, len(motore.vincitori(obiettivo)))
+        for i, p in enumerate(PREMI):
+            if p in attesi and attesi[p] != (int(estrazione[g, i]), int(vincitori[g, i])):
+                raise AssertionError(f"Partita {g}, {NOMI_PREMI[p]}: motore {attesi[p]}, simulatore {(int(estrazione[g, i]), int(vincitori[g, i]))}")
+            if p not in attesi and estrazione[g, i] != 90:
+                raise AssertionError(f"Partita {g}, {NOMI_PREMI[p]}: non assegnato dal motore")
+    return partite
+
+
+def leggi_quote(voci):
+    quote = dict(QUOTE)
+    for voce in voci or ():
+        premio, valore = voce.split("=")
+        quote[int(premio)] = float(valore)
+    return quote
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Simulatore Monte Carlo di premi e quote della Tombola")
+    parser.add_argument("--giocatori", type=int, nargs="+", default=[10, 40])
+    parser.add_argument("--cartelle", type=int, nargs="+", default=[1, 3, 6], help="cartelle per giocatore")
+    parser.add_argument("--partite", type=int, default=100000)
+    parser.add_argument("--processi", type=int, default=None, help="default: tutti i core")
+    parser.add_argument("--seed", type=int, default=1234)
+    parser.add_argument("--costo", type=int, default=COSTO_CARTELLA)
+    parser.add_argument("--quote", nargs="+", metavar="PREMIO=QUOTA", help="es. 2=0.10 15=0.35 (default: QUOTE del gioco)")
+    parser.add_argument("--verifica", type=int, metavar="PARTITE", help="confronta il simulatore col motore vero e esce")
+    parser.add_argument("--output", help="file JSON di output (default: stdout)")
+    args = parser.parse_args()
+
+    if args.verifica:
+        for g in args.giocatori:
+            for c in args.cartelle:
+                verifica(g, c, args.verifica, args.seed)
+                print(f"{g} giocatori x {c} cartelle: {args.verifica} partite identiche al motore", file=sys.stderr)
+        return
+
+    quote = leggi_quote(args.quote)
+    risultati = {
+        "meta": {
+            "quando": datetime.now().isoformat(timespec="seconds"), "python": platform.python_version(),
+            "processi": args.processi or os.cpu_count() or 1, "seed": args.seed, "costo": args.costo,
+            "quote": {str(k): v for k, v in quote.items()},
+        },
+        "scenari": [],
+    }
+    processi = args.processi or os.cpu_count() or 1
+    pool = ProcessPoolExecutor(max_workers=processi) if processi > 1 else None
+    try:
+        for g in args.giocatori:
+            for c in args.cartelle:
+                print(f"{g} giocatori x {c} cartelle, {args.partite} partite...", file=sys.stderr)
+                inizio = time.perf_counter()
+                conteggi = simula(g, c, args.partite, args.seed, processi, pool)
+                scenario = riassumi(g, c, conteggi, quote, args.costo)
+                scenario["secondi"] = round(time.perf_counter() - inizio, 2)
+                risultati["scenari"].append(scenario)
+    finally:
+        if pool is not None: pool.shutdown()
+
+    testo = json.dumps(risultati, indent=2)
+    if args.output:
+        with open(args.output, "w") as f: f.write(testo)
+    else:
+        print(testo)
+
+if __name__ == "__main__":
+    main()
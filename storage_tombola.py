@@ -0,0 +1,1054 @@
+import json
+import random
+import threading
+import time
+from contextlib import contextmanager
+
+from tombola_core import rigioca_evento
+from cache_stanze import CacheStanze
+from formato_stanza import codifica_stanza, decodifica_stanza, decodifica_vista, vista_giocatore, formato_di, FORMATI
+from pool_connessioni import get_pool, PoolEsaurito
+import metriche
+
+# --- STORAGE STANZE ---
+# Interfaccia unica per load/save/delete delle stanze con tre motori:
+#   mysql   -> server MySQL condiviso (pool di connessioni)
+#   sqlite  -> file locale in WAL, letture sotto il millisecondo per le serate su un solo PC
+#   memoria -> tutto in RAM, per test, benchmark e simulazioni
+# Le eccezioni dei driver escono sempre come ErroreStorage.
+# Le modifiche concorrenti (ingressi, estrazioni, toggle) passano da aggiorna():
+# rilettura + scrittura condizionata alla versione letta, con retry sui conflitti.
+# Il blob si scrive nel formato binario compatto (formato_stanza); le righe JSON si leggono ancora
+# e passano al binario alla prima scrittura. formato="json" resta per chi vuole leggere il DB a mano.
+
+class ErroreStorage(Exception):
+    pass
+
+class ConflittoVersione(ErroreStorage):
+    pass
+
+
+def ricostruisci(dati, eventi):
+    # Snapshot + eventi successivi (testi JSON) col reducer della ricostruzione: le vincite stanno già nel log,
+    # quindi niente motore né cartelle da caricare (in sala grande sarebbe tutta la sala a ogni lettura)
+    for testo in eventi: rigioca_evento(dati, json.loads(testo))
+    return dati
+
+def _testo_evento(evento):
+    return json.dumps(evento, separators=(",", ":"))
+
+
+class StorageStanze:
+    nome = "base"
+
+    def __init__(self, persistenza="blob", compatta_ogni=20, cache=None, tentativi=12, formato="binario"):
+        if formato not in FORMATI: raise ErroreStorage(f"Formato stanze sconosciuto: {formato}")
+        self.persistenza_eventi = persistenza == "eventi"
+        self.formato = formato
+        self.compatta_ogni = int(compatta_ogni)
+        self.cache = cache
+        self.tentativi = int(tentativi)
+        self._stat_conflitti = {"aggiornamenti": 0, "conflitti": 0, "esauriti": 0}
+        self._stat_lock = threading.Lock()    # aggiorna() gira in tanti thread insieme
+        self._cambi = threading.Condition()   # svegliata a ogni scrittura fatta da questo processo
+        self._scritture = {}                  # stanza -> contatore delle scritture di questo processo
+
+    # --- PRIMITIVE DEI MOTORI ---
+    def _leggi(self, nome_stanza, versione_nota):
+        # -> None se la stanza non esiste, altrimenti (versione, testo | None se non più nuova, ultimo_evento, eventi_pendenti)
+        raise NotImplementedError
+
+    def _eventi(self, nome_stanza, dopo_id):
+        raise NotImplementedError
+
+    def _salva(self, nome_stanza, testo, versione_attesa=None):
+        # Con versione_attesa scrive solo se la stanza è ancora a quella versione -> False se no
+        raise NotImplementedError
+
+    def _append(self, nome_stanza, testi, versione_attesa=None):
+        # -> eventi pendenti dopo l'append; None se la versione non è più quella attesa
+        raise NotImplementedError
+
+    def _compatta(self, nome_stanza):
+        raise NotImplementedError
+
+    def _elimina(self, nome_stanza):
+        raise NotImplementedError
+
+    def _inattive(self, secondi, dopo, limite):
+        # -> [(nome, versione, secondi di inattività, chiave di pagina)] dalle più vecchie
+        raise NotImplementedError
+
+    def _archivia(self, voci):
+        # voci: [(nome, versione, created_at, riassunto | None)] -> nomi rimossi davvero
+        raise NotImplementedError
+
+    def leggi_versione(self, nome_stanza):
+        raise NotImplementedError
+
+    def _prepara_sala(self, nome_stanza, max_giocatori):
+        raise NotImplementedError
+
+    def _iscrivi(self, nome_stanza, nome_giocatore, testo_cartelle, n_cartelle):
+        # -> "ok" | "presente" | "piena" (posti finiti o iscrizioni chiuse)
+        raise NotImplementedError
+
+    def _chiudi_iscrizioni(self, nome_stanza):
+        raise NotImplementedError
+
+    def totali_sala(self, nome_stanza):
+        # -> {"giocatori", "cartelle", "posti_liberi"} | None se la stanza non è in modalità sala
+        raise NotImplementedError
+
+    def _cartelle_giocatore(self, nome_stanza, nome_giocatore):
+        raise NotImplementedError
+
+    def _elenco_giocatori(self, nome_stanza, prefisso, da, quanti):
+        # -> ([(nome, n_cartelle)], totale) in ordine di iscrizione
+        raise NotImplementedError
+
+    def _giocatori_sala(self, nome_stanza):
+        # -> [(nome, testo_cartelle)] in ordine di iscrizione
+        raise NotImplementedError
+
+    # --- API ---
+    def carica(self, nome_stanza, versione_nota=-1):
+        # (versione, dati | None se non più nuovi di versione_nota); (None, None) se la stanza non esiste.
+        if self.cache is None:
+            riga = self._leggi_riga(nome_stanza, versione_nota)
+            if riga is None: return None, None
+            return riga[0], (self._dati_da_riga(nome_stanza, riga) if riga[1] is not None else None)
+        voce, dati = self._voce_cache(nome_stanza)
+        if voce.versione is None: return None, None
+        if voce.versione <= versione_nota: return voce.versione, None
+        return voce.versione, (dati if dati is not None else voce.copia())
+
+    def carica_vista(self, nome_stanza, nome_giocatore, versione_nota=-1):
+        # Come carica, ma solo la fetta che serve alla pagina di un giocatore (formato_stanza.vista_giocatore):
+        # niente cartelle altrui, tabellone rimasto o password. Senza cache si proietta direttamente dal blob.
+        # In sala grande le cartelle del giocatore le legge la pagina una volta (cartelle_giocatore) e i numeri
+        # li segna lei: rigiocare gli eventi pendenti non tocca le righe della sala
+        if self.cache is None:
+            riga = self._leggi_riga(nome_stanza, versione_nota)
+            if riga is None: return None, None
+            versione, testo, _, pendenti = riga
+            if testo is None: return versione, None
+            if pendenti: return versione, vista_giocatore(self._dati_da_riga(nome_stanza, riga), nome_giocatore)
+            metriche.osserva("payload_byte", len(testo), metriche.BUCKET_BYTE, stanza=nome_stanza, op="vista")
+            with metriche.misura("decodifica", stanza=nome_stanza, formato=formato_di(testo), vista=True):
+                return versione, decodifica_vista(testo, nome_giocatore)
+        voce, _ = self._voce_cache(nome_stanza)
+        if voce.versione is None: return None, None
+        return voce.versione, (voce.vista(nome_giocatore) if voce.versione > versione_nota else None)
+
+    def _voce_cache(self, nome_stanza):
+        # -> (voce, dati appena decodificati | None). Una voce scaduta si rivalida con una lettura
+        # condizionale che riporta il blob solo se cambiato
+        voce = self.cache.cerca(nome_stanza)
+        if voce is not None and voce.fresca: return voce, None
+        versione_cache = voce.versione if voce is not None and voce.versione is not None else -1
+        riga = self._leggi_riga(nome_stanza, versione_cache)
+        if riga is None: return self.cache.scrivi(nome_stanza, None, None), None
+        if riga[1] is None and voce is not None:
+            self.cache.rinnova(nome_stanza)
+            return voce, None
+        if not riga[3]:
+            # Niente eventi da rigiocare: il blob va in cache com'è, le viste ne leggono solo le loro cartelle
+            return self.cache.scrivi_blob(nome_stanza, riga[0], riga[1], lambda testo: self._decodifica(nome_stanza, testo)), None
+        dati = self._dati_da_riga(nome_stanza, riga)
+        return self.cache.scrivi(nome_stanza, riga[0], dati), dati
+
+    def _leggi_riga(self, nome_stanza, versione_nota):
+        with metriche.misura("db_query", motore=self.nome, op="leggi"):
+            return self._leggi(nome_stanza, versione_nota)
+
+    def _dati_da_riga(self, nome_stanza, riga):
+        _, testo, ultimo_evento, pendenti = riga
+        dati = self._decodifica(nome_stanza, testo)
+        if pendenti: dati = ricostruisci(dati, self._eventi(nome_stanza, ultimo_evento))
+        return dati
+
+    def carica_fresca(self, nome_stanza):
+        # Salta la cache: chi deve scrivere parte dall'ultima versione vera
+        riga = self._leggi_riga(nome_stanza, -1)
+        if riga is None: return None, None
+        return riga[0], self._dati_da_riga(nome_stanza, riga)
+
+    def _decodifica(self, nome_stanza, testo):
+        metriche.osserva("payload_byte", len(testo), metriche.BUCKET_BYTE, stanza=nome_stanza, op="leggi")
+        with metriche.misura("decodifica", stanza=nome_stanza, formato=formato_di(testo)):
+            return decodifica_stanza(testo)
+
+    def _codifica(self, nome_stanza, dati):
+        testo = codifica_stanza(dati, self.formato)
+        metriche.osserva("payload_byte", len(testo), metriche.BUCKET_BYTE, stanza=nome_stanza, op="scrivi")
+        return testo
+
+    def salva(self, nome_stanza, dati):
+        testo = self._codifica(nome_stanza, dati)
+        with metriche.misura("db_query", motore=self.nome, op="scrivi"):
+            self._salva(nome_stanza, testo)
+        metriche.conta("salvataggi", stanza=nome_stanza, modo="blob")
+        self._invalida(nome_stanza)
+
+    def append_eventi(self, nome_stanza, eventi):
+        with metriche.misura("db_query", motore=self.nome, op="append"):
+            pendenti = self._append(nome_stanza, [_testo_evento(ev) for ev in eventi])
+        metriche.conta("salvataggi", stanza=nome_stanza, modo="eventi")
+        self._invalida(nome_stanza)
+        return pendenti
+
+    def compatta(self, nome_stanza):
+        self._compatta(nome_stanza)
+
+    def registra(self, nome_stanza, dati, *eventi):
+        # dati è già stato aggiornato con applica_evento: in modalità blob si riscrive tutto come prima
+        if not self.persistenza_eventi:
+            self.salva(nome_stanza, dati)
+            return
+        if self.append_eventi(nome_stanza, eventi) >= self.compatta_ogni:
+            self.compatta(nome_stanza)
+
+    def registra_se(self, nome_stanza, versione, dati, *eventi):
+        # Come registra, ma solo se nessuno ha scritto dopo la lettura a `versione`
+        if not self.persistenza_eventi:
+            testo = self._codifica(nome_stanza, dati)
+            with metriche.misura("db_query", motore=self.nome, op="scrivi"):
+                ok = self._salva(nome_stanza, testo, versione)
+            pendenti = 0
+        else:
+            with metriche.misura("db_query", motore=self.nome, op="append"):
+                pendenti = self._append(nome_stanza, [_testo_evento(ev) for ev in eventi], versione)
+            ok = pendenti is not None
+        metriche.conta("salvataggi", stanza=nome_stanza, modo="eventi" if self.persistenza_eventi else "blob", esito="ok" if ok else "conflitto")
+        if not ok: raise ConflittoVersione(f"La stanza {nome_stanza} è cambiata dopo la lettura (versione {versione})")
+        # La nuova versione è nota: la cache riparte già dallo stato appena scritto
+        if self.cache is not None: self.cache.scrivi(nome_stanza, versione + 1, dati)
+        self._segnala(nome_stanza)
+        if pendenti >= self.compatta_ogni: self.compatta(nome_stanza)
+        return versione + 1
+
+    def aggiorna(self, nome_stanza, modifica):
+        # modifica(dati) aggiorna i dati e ritorna gli eventi da registrare ([] = niente da scrivere).
+        # Viene richiamata su dati riletti a ogni conflitto, quindi i controlli (es. stanza piena) restano atomici.
+        # -> (versione, dati) dopo la scrittura; (None, None) se la stanza non esiste
+        for tentativo in range(self.tentativi):
+            versione, dati = self.carica_fresca(nome_stanza)
+            if versione is None: return None, None
+            eventi = modifica(dati)
+            if not eventi: return versione, dati
+            try:
+                versione = self.registra_se(nome_stanza, versione, dati, *eventi)
+            except ConflittoVersione:
+                self._conta("conflitti")
+                # Backoff casuale: tanti ingressi nello stesso istante non ricollidono in fila
+                time.sleep(random.uniform(0, 0.002 * (2 ** min(tentativo, 6))))
+                continue
+            self._conta("aggiornamenti")
+            return versione, dati
+        self._conta("esauriti")
+        raise ErroreStorage(f"Troppe modifiche concorrenti sulla stanza {nome_stanza}, riprova")
+
+    def elimina(self, nome_stanza):
+        self._elimina(nome_stanza)
+        self._invalida(nome_stanza, rimossa=True)
+
+    # --- SALA GRANDE ---
+    # Migliaia di giocatori: le cartelle stanno in una riga per giocatore (giocatori_tombola) e i posti
+    # in un contatore a parte (sale_tombola). Un ingresso è un UPDATE condizionato sul contatore + un INSERT:
+    # nessuno riscrive il blob della stanza, che porta solo aggregati e vincitori.
+    def prepara_sala(self, nome_stanza, max_giocatori=None):
+        # Alla (ri)creazione della stanza: via gli iscritti precedenti; senza max_giocatori la stanza è normale
+        self._prepara_sala(nome_stanza, int(max_giocatori) if max_giocatori else None)
+
+    def iscrivi_giocatore(self, nome_stanza, nome_giocatore, cartelle):
+        with metriche.misura("db_query", motore=self.nome, op="iscrivi"):
+            esito = self._iscrivi(nome_stanza, nome_giocatore, json.dumps(cartelle, separators=(",", ":")), len(cartelle))
+        metriche.conta("iscrizioni", stanza=nome_stanza, esito=esito)
+        return esito
+
+    def chiudi_iscrizioni(self, nome_stanza):
+        # Azzera i posti liberi e restituisce i totali definitivi (da copiare nel blob all'avvio)
+        return self._chiudi_iscrizioni(nome_stanza)
+
+    def cartelle_giocatore(self, nome_stanza, nome_giocatore):
+        testo = self._cartelle_giocatore(nome_stanza, nome_giocatore)
+        return json.loads(testo) if testo is not None else None
+
+    def elenco_giocatori(self, nome_stanza, cerca="", pagina=0, per_pagina=20):
+        return self._elenco_giocatori(nome_stanza, cerca.strip().upper(), max(0, int(pagina)) * per_pagina, int(per_pagina))
+
+    def giocatori_sala(self, nome_stanza):
+        # Tutte le cartelle, nell'ordine di iscrizione: per costruire il motore vincite e l'indice delle cartelle
+        with metriche.misura("db_query", motore=self.nome, op="giocatori_sala"):
+            righe = self._giocatori_sala(nome_stanza)
+        return {nome: json.loads(testo) for nome, testo in righe}
+
+    def stanze_inattive(self, secondi, dopo=None, limite=100):
+        # Paginazione a chiave: dopo = chiave di pagina dell'ultima riga del lotto precedente
+        return self._inattive(int(secondi), dopo, int(limite))
+
+    def archivia(self, voci):
+        # Rimozione condizionata alla versione letta: una stanza tornata attiva nel frattempo resta dov'è.
+        # Con il riassunto la partita finisce in archivio_tombola, senza si cancella e basta
+        rimosse = self._archivia(voci)
+        for nome_stanza in rimosse: self._invalida(nome_stanza, rimossa=True)
+        return rimosse
+
+    def attendi_cambio(self, nome_stanza, versione_nota, timeout=3.0, intervallo=None):
+        # Long-poll: ritorna appena la versione cambia o allo scadere del timeout. Le scritture di questo
+        # processo svegliano subito chi aspetta; il DB si interroga all'inizio e alla fine dell'attesa
+        # (2 query per ciclo da fermi), più, con `intervallo`, a intervalli che raddoppiano: serve solo
+        # per vedere prima le scritture di altri processi
+        scadenza = time.monotonic() + timeout
+        with self._cambi: scritture = self._scritture.get(nome_stanza, 0)
+        while True:
+            try:
+                versione = self.leggi_versione(nome_stanza)
+            except ErroreStorage:
+                versione = versione_nota
+            if versione != versione_nota:
+                if self.cache is not None: self.cache.invalida_se_vecchia(nome_stanza, versione)
+                return versione
+            restante = scadenza - time.monotonic()
+            if restante <= 0: return versione
+            attesa = restante if intervallo is None else min(intervallo, restante)
+            with self._cambi:
+                self._cambi.wait_for(lambda: self._scritture.get(nome_stanza, 0) != scritture, attesa)
+                scritture = self._scritture.get(nome_stanza, 0)
+            if intervallo is not None: intervallo *= 2
+
+    def _conta(self, chiave):
+        with self._stat_lock: self._stat_conflitti[chiave] += 1
+
+    def statistiche(self):
+        with self._stat_lock: concorrenza = dict(self._stat_conflitti)
+        s = {"motore": self.nome, "formato": self.formato, "concorrenza": concorrenza}
+        if self.cache is not None: s["cache"] = self.cache.statistiche()
+        return s
+
+    def _invalida(self, nome_stanza, rimossa=False):
+        if self.cache is not None: self.cache.invalida(nome_stanza)
+        self._segnala(nome_stanza, rimossa)
+
+    def _segnala(self, nome_stanza, rimossa=False):
+        # Sveglia gli attendi_cambio di questo processo; una stanza rimossa esce dal contatore
+        with self._cambi:
+            if rimossa: self._scritture.pop(nome_stanza, None)
+            else: self._scritture[nome_stanza] = self._scritture.get(nome_stanza, 0) + 1
+            self._cambi.notify_all()
+
+
+# --- MOTORI SQL ---
+class _StorageSQL(StorageStanze):
+    SQL = {}
+
+    @contextmanager
+    def _connessione(self):
+        raise NotImplementedError
+
+    def _inizia(self, conn):
+        raise NotImplementedError
+
+    def _leggi(self, nome_stanza, versione_nota):
+        with self._connessione() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.SQL["leggi"], (versione_nota, nome_stanza))
+            return cursor.fetchone()
+
+    def _eventi(self, nome_stanza, dopo_id):
+        with self._connessione() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.SQL["eventi"], (nome_stanza, dopo_id))
+            return [riga[0] for riga in cursor.fetchall()]
+
+    def leggi_versione(self, nome_stanza):
+        # La query più frequente: ogni client in long-poll la ripete ogni mezzo secondo
+        with metriche.misura("db_query", motore=self.nome, op="versione"), self._connessione() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.SQL["versione"], (nome_stanza,))
+            riga = cursor.fetchone()
+            return riga[0] if riga else None
+
+    def _salva(self, nome_stanza, testo, versione_attesa=None):
+        with self._connessione() as conn:
+            cursor = conn.cursor()
+            if versione_attesa is None:
+                cursor.execute(self.SQL["salva"], (nome_stanza, testo, testo))
+                return True
+            cursor.execute(self.SQL["salva_se"], (testo, nome_stanza, versione_attesa))
+            return cursor.rowcount == 1
+
+    def _append(self, nome_stanza, testi, versione_attesa=None):
+        # Poche decine di byte per evento; il lock sulla riga della stanza ordina gli append rispetto alla compattazione
+        with self._connessione() as conn:
+            self._inizia(conn)
+            try:
+                cursor = conn.cursor()
+                if versione_attesa is None:
+                    cursor.execute(self.SQL["append"], (len(testi), nome_stanza))
+                else:
+                    cursor.execute(self.SQL["append_se"], (len(testi), nome_stanza, versione_attesa))
+                    if cursor.rowcount != 1:
+                        conn.rollback()
+                        return None
+                cursor.executemany(self.SQL["evento"], [(nome_stanza, t) for t in testi])
+                cursor.execute(self.SQL["pendenti"], (nome_stanza,))
+                riga = cursor.fetchone()
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return riga[0] if riga else 0
+
+    def _compatta(self, nome_stanza):
+        # Nuovo snapshot = vecchio snapshot + eventi, ricostruito sotto lock
+        with self._connessione() as conn:
+            self._inizia(conn)
+            try:
+                cursor = conn.cursor()
+                cursor.execute(self.SQL["blocca"], (nome_stanza,))
+                riga = cursor.fetchone()
+                if not riga:
+                    conn.rollback()
+                    return
+                cursor.execute(self.SQL["eventi_id"], (nome_stanza, riga[1]))
+                eventi = cursor.fetchall()
+                if eventi:
+                    dati = ricostruisci(decodifica_stanza(riga[0]), [testo for _, testo in eventi])
+                    cursor.execute(self.SQL["compatta"], (codifica_stanza(dati, self.formato), eventi[-1][0], nome_stanza))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _elimina(self, nome_stanza):
+        with self._connessione() as conn:
+            self._inizia(conn)
+            try:
+                cursor = conn.cursor()
+                cursor.execute(self.SQL["elimina"], (nome_stanza,))
+                cursor.execute(self.SQL["elimina_eventi"], (nome_stanza,))
+                cursor.execute(self.SQL["sala_svuota"], (nome_stanza,))
+                cursor.execute(self.SQL["sala_elimina"], (nome_stanza,))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _secondi(self, secondi):
+        return secondi
+
+    def _inattive(self, secondi, dopo, limite):
+        with self._connessione() as conn:
+            cursor = conn.cursor()
+            if dopo is None: cursor.execute(self.SQL["inattive"], (self._secondi(secondi), limite))
+            else: cursor.execute(self.SQL["inattive_dopo"], (self._secondi(secondi), dopo[0], dopo[0], dopo[1], limite))
+            return [(nome, versione, inattiva, (aggiornato_il, nome)) for nome, versione, inattiva, aggiornato_il in cursor.fetchall()]
+
+    def _archivia(self, voci):
+        # Un lotto, una transazione
+        rimosse = []
+        with self._connessione() as conn:
+            self._inizia(conn)
+            try:
+                cursor = conn.cursor()
+                for nome_stanza, versione, created_at, riassunto in voci:
+                    cursor.execute(self.SQL["elimina_se"], (nome_stanza, versione))
+                    if cursor.rowcount != 1: continue
+                    cursor.execute(self.SQL["elimina_eventi"], (nome_stanza,))
+                    cursor.execute(self.SQL["sala_svuota"], (nome_stanza,))
+                    cursor.execute(self.SQL["sala_elimina"], (nome_stanza,))
+                    if riassunto is not None: cursor.execute(self.SQL["archivia"], (nome_stanza, created_at, riassunto))
+                    rimosse.append(nome_stanza)
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        return rimosse
+
+    # --- SALA GRANDE ---
+    def _prepara_sala(self, nome_stanza, max_giocatori):
+        with self._connessione() as conn:
+            self._inizia(conn)
+            try:
+                cursor = conn.cursor()
+                cursor.execute(self.SQL["sala_svuota"], (nome_stanza,))
+                cursor.execute(self.SQL["sala_elimina"], (nome_stanza,))
+                if max_giocatori: cursor.execute(self.SQL["sala_crea"], (nome_stanza, max_giocatori))
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+
+    def _iscrivi(self, nome_stanza, nome_giocatore, testo_cartelle, n_cartelle):
+        with self._connessione() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.SQL["sala_presente"], (nome_stanza, nome_giocatore))
+            if cursor.fetchone(): return "presente"
+            # Il lock dura quanto un UPDATE e un INSERT, sulla sola riga contatore della sala
+            self._inizia(conn)
+            try:
+                cursor.execute(self.SQL["sala_posto"], (n_cartelle, nome_stanza))
+                if cursor.rowcount != 1:
+                    conn.rollback()
+                    return "piena"
+                cursor.execute(self.SQL["sala_ordine"], (nome_stanza,))
+                ordine = cursor.fetchone()[0]
+                cursor.execute(self.SQL["sala_iscrivi"], (nome_stanza, nome_giocatore, ordine, n_cartelle, testo_cartelle))
+                if cursor.rowcount != 1:
+                    conn.rollback()
+                    return "presente"
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+            return "ok"
+
+    def _chiudi_iscrizioni(self, nome_stanza):
+        with self._connessione() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.SQL["sala_chiudi"], (nome_stanza,))
+        return self.totali_sala(nome_stanza)
+
+    def totali_sala(self, nome_stanza):
+        with self._connessione() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.SQL["sala_totali"], (nome_stanza,))
+            riga = cursor.fetchone()
+        return {"giocatori": riga[0], "cartelle": riga[1], "posti_liberi": riga[2]} if riga else None
+
+    def _cartelle_giocatore(self, nome_stanza, nome_giocatore):
+        with self._connessione() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.SQL["sala_cartelle"], (nome_stanza, nome_giocatore))
+            riga = cursor.fetchone()
+        return riga[0] if riga else None
+
+    def _elenco_giocatori(self, nome_stanza, prefisso, da, quanti):
+        filtro = prefisso.replace("!", "!!").replace("%", "!%").replace("_", "!_") + "%"
+        with self._connessione() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.SQL["sala_elenco"], (nome_stanza, filtro, quanti, da))
+            righe = [tuple(r) for r in cursor.fetchall()]
+            cursor.execute(self.SQL["sala_conta"], (nome_stanza, filtro))
+            totale = cursor.fetchone()[0]
+        return righe, totale
+
+    def _giocatori_sala(self, nome_stanza):
+        with self._connessione() as conn:
+            cursor = conn.cursor()
+            cursor.execute(self.SQL["sala_tutti"], (nome_stanza,))
+            return cursor.fetchall()
+
+
+class StorageMySQL(_StorageSQL):
+    nome = "mysql"
+    SQL = {
+        "leggi": """
+            SELECT versione, CASE WHEN versione > %s THEN dati_partita END, ultimo_evento, eventi_pendenti
+            FROM stanze_tombola WHERE nome_stanza = %s""",
+        "versione": "SELECT versione FROM stanze_tombola WHERE nome_stanza = %s",
+        "salva": """
+            INSERT INTO stanze_tombola (nome_stanza, dati_partita, versione, ultimo_evento, eventi_pendenti, aggiornato_il)
+            VALUES (%s, %s, 1, (SELECT COALESCE(MAX(id), 0) FROM eventi_tombola), 0, CURRENT_TIMESTAMP)
+            ON DUPLICATE KEY UPDATE dati_partita = %s, versione = versione + 1, aggiornato_il = CURRENT_TIMESTAMP,
+                ultimo_evento = (SELECT COALESCE(MAX(id), 0) FROM eventi_tombola), eventi_pendenti = 0""",
+        "salva_se": """
+            UPDATE stanze_tombola SET dati_partita = %s, versione = versione + 1, aggiornato_il = CURRENT_TIMESTAMP,
+                ultimo_evento = (SELECT COALESCE(MAX(id), 0) FROM eventi_tombola), eventi_pendenti = 0
+            WHERE nome_stanza = %s AND versione = %s""",
+        "append": """
+            UPDATE stanze_tombola SET versione = versione + 1, eventi_pendenti = eventi_pendenti + %s, aggiornato_il = CURRENT_TIMESTAMP
+            WHERE nome_stanza = %s""",
+        "append_se": """
+            UPDATE stanze_tombola SET versione = versione + 1, eventi_pendenti = eventi_pendenti + %s, aggiornato_il = CURRENT_TIMESTAMP
+            WHERE nome_stanza = %s AND versione = %s""",
+        "evento": "INSERT INTO eventi_tombola (nome_stanza, evento) VALUES (%s, %s)",
+        "pendenti": "SELECT eventi_pendenti FROM stanze_tombola WHERE nome_stanza = %s",
+        "eventi": "SELECT evento FROM eventi_tombola WHERE nome_stanza = %s AND id > %s ORDER BY id",
+        "eventi_id": "SELECT id, evento FROM eventi_tombola WHERE nome_stanza = %s AND id > %s ORDER BY id",
+        "blocca": "SELECT dati_partita, ultimo_evento FROM stanze_tombola WHERE nome_stanza = %s FOR UPDATE",
+        "compatta": "UPDATE stanze_tombola SET dati_partita = %s, ultimo_evento = %s, eventi_pendenti = 0 WHERE nome_stanza = %s",
+        "elimina": "DELETE FROM stanze_tombola WHERE nome_stanza = %s",
+        "elimina_se": "DELETE FROM stanze_tombola WHERE nome_stanza = %s AND versione = %s",
+        "elimina_eventi": "DELETE FROM eventi_tombola WHERE nome_stanza = %s",
+        "inattive": """
+            SELECT nome_stanza, versione, TIMESTAMPDIFF(SECOND, aggiornato_il, NOW()), aggiornato_il FROM stanze_tombola
+            WHERE aggiornato_il < NOW() - INTERVAL %s SECOND
+            ORDER BY aggiornato_il, nome_stanza LIMIT %s""",
+        "inattive_dopo": """
+            SELECT nome_stanza, versione, TIMESTAMPDIFF(SECOND, aggiornato_il, NOW()), aggiornato_il FROM stanze_tombola
+            WHERE aggiornato_il < NOW() - INTERVAL %s SECOND
+                AND (aggiornato_il > %s OR (aggiornato_il = %s AND nome_stanza > %s))
+            ORDER BY aggiornato_il, nome_stanza LIMIT %s""",
+        "archivia": "INSERT IGNORE INTO archivio_tombola (nome_stanza, created_at, riassunto) VALUES (%s, %s, %s)",
+        "sala_svuota": "DELETE FROM giocatori_tombola WHERE nome_stanza = %s",
+        "sala_elimina": "DELETE FROM sale_tombola WHERE nome_stanza = %s",
+        "sala_crea": "INSERT INTO sale_tombola (nome_stanza, posti_liberi, giocatori, cartelle) VALUES (%s, %s, 0, 0)",
+        "sala_presente": "SELECT 1 FROM giocatori_tombola WHERE nome_stanza = %s AND nome_giocatore = %s",
+        "sala_posto": """
+            UPDATE sale_tombola SET posti_liberi = posti_liberi - 1, giocatori = giocatori + 1, cartelle = cartelle + %s
+            WHERE nome_stanza = %s AND posti_liberi > 0""",
+        "sala_ordine": "SELECT giocatori FROM sale_tombola WHERE nome_stanza = %s",
+        "sala_iscrivi": "INSERT IGNORE INTO giocatori_tombola (nome_stanza, nome_giocatore, ordine, n_cartelle, cartelle) VALUES (%s, %s, %s, %s, %s)",
+        "sala_chiudi": "UPDATE sale_tombola SET posti_liberi = 0 WHERE nome_stanza = %s",
+        "sala_totali": "SELECT giocatori, cartelle, posti_liberi FROM sale_tombola WHERE nome_stanza = %s",
+        "sala_cartelle": "SELECT cartelle FROM giocatori_tombola WHERE nome_stanza = %s AND nome_giocatore = %s",
+        "sala_elenco": """
+            SELECT nome_giocatore, n_cartelle FROM giocatori_tombola
+            WHERE nome_stanza = %s AND nome_giocatore LIKE %s ESCAPE '!' ORDER BY ordine LIMIT %s OFFSET %s""",
+        "sala_conta": "SELECT COUNT(*) FROM giocatori_tombola WHERE nome_stanza = %s AND nome_giocatore LIKE %s ESCAPE '!'",
+        "sala_tutti": "SELECT nome_giocatore, cartelle FROM giocatori_tombola WHERE nome_stanza = %s ORDER BY ordine",
+    }
+
+    def __init__(self, host, user, password, database, port=3306, pool_size=5, pool_timeout=10, pool_verifica=30, **opzioni):
+        super().__init__(**opzioni)
+        import mysql.connector
+        self._errori_driver = (mysql.connector.Error, PoolEsaurito)
+        parametri = dict(
+            host=host, user=user, password=password, database=database, port=port,
+            autocommit=True  # niente snapshot REPEATABLE READ "appesi" sulle connessioni riusate
+        )
+        self.pool = get_pool(
+            (host, port, user, database),
+            lambda: mysql.connector.connect(**parametri),
+            dimensione=pool_size, timeout_checkout=pool_timeout, intervallo_verifica=pool_verifica
+        )
+        self._schema_ok = False
+        self._schema_lock = threading.Lock()
+
+    @contextmanager
+    def _connessione(self):
+        try:
+            conn = self.pool.acquisisci()
+            try:
+                self._assicura_schema(conn)
+                yield conn
+            except self._errori_driver:
+                conn.scarta()  # stato della connessione incerto: meglio non rimetterla nel pool
+                raise
+            except BaseException:
+                # Errore nostro (decodifica, dati inattesi...): la connessione è sana, ma torna senza transazioni aperte
+                try:
+                    conn.rollback()
+                except self._errori_driver:
+                    conn.scarta()
+                raise
+            finally:
+                conn.close()   # su ogni uscita; dopo scarta() non fa nulla
+        except self._errori_driver as e:
+            raise ErroreStorage(str(e)) from e
+
+    def _inizia(self, conn):
+        conn.start_transaction()
+
+    def _assicura_schema(self, conn):
+        # Una volta per processo: colonne di versione/snapshot e tabella eventi per le installazioni esistenti
+        if self._schema_ok: return
+        with self._schema_lock:
+            if self._schema_ok: return
+            cursor = conn.cursor()
+            colonne = {
+                "versione": "BIGINT UNSIGNED NOT NULL DEFAULT 0",
+                "ultimo_evento": "BIGINT UNSIGNED NOT NULL DEFAULT 0",
+                "eventi_pendenti": "INT UNSIGNED NOT NULL DEFAULT 0",
+                "aggiornato_il": "TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP",
+            }
+            for colonna, tipo in colonne.items():
+                cursor.execute("""
+                SELECT COUNT(*) FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'stanze_tombola' AND COLUMN_NAME = %s
+                """, (colonna,))
+                if cursor.fetchone()[0] == 0:
+                    cursor.execute(f"ALTER TABLE stanze_tombola ADD COLUMN {colonna} {tipo}")
+            if self.formato == "binario":
+                # Il blob binario non è testo: la colonna diventa LONGBLOB, i JSON già scritti restano leggibili come byte
+                cursor.execute("""
+                SELECT DATA_TYPE FROM information_schema.COLUMNS
+                WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'stanze_tombola' AND COLUMN_NAME = 'dati_partita'
+                """)
+                riga = cursor.fetchone()
+                tipo = riga[0].decode() if riga and isinstance(riga[0], (bytes, bytearray)) else (riga[0] if riga else "")
+                if tipo.lower() not in ("blob", "mediumblob", "longblob"):
+                    cursor.execute("ALTER TABLE stanze_tombola MODIFY dati_partita LONGBLOB NOT NULL")
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS eventi_tombola (
+                id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                nome_stanza VARCHAR(64) NOT NULL,
+                evento VARCHAR(2048) NOT NULL,
+                creato_il TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                INDEX idx_stanza_evento (nome_stanza, id)
+            )
+            """)
+            cursor.execute("""
+            SELECT COUNT(*) FROM information_schema.STATISTICS
+            WHERE TABLE_SCHEMA = DATABASE() AND TABLE_NAME = 'stanze_tombola' AND INDEX_NAME = 'idx_attivita'
+            """)
+            if cursor.fetchone()[0] == 0:
+                cursor.execute("CREATE INDEX idx_attivita ON stanze_tombola (aggiornato_il, nome_stanza)")
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS archivio_tombola (
+                id BIGINT UNSIGNED NOT NULL AUTO_INCREMENT PRIMARY KEY,
+                nome_stanza VARCHAR(64) NOT NULL,
+                created_at VARCHAR(32) NOT NULL,
+                archiviata_il TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                riassunto TEXT NOT NULL,
+                UNIQUE KEY uq_partita (nome_stanza, created_at)
+            )
+            """)
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS sale_tombola (
+                nome_stanza VARCHAR(64) NOT NULL PRIMARY KEY,
+                posti_liberi INT NOT NULL,
+                giocatori INT NOT NULL DEFAULT 0,
+                cartelle INT NOT NULL DEFAULT 0
+            )
+            """)
+            cursor.execute("""
+            CREATE TABLE IF NOT EXISTS giocatori_tombola (
+                nome_stanza VARCHAR(64) NOT NULL,
+                nome_giocatore VARCHAR(64) NOT NULL,
+                ordine INT NOT NULL,
+                n_cartelle TINYINT UNSIGNED NOT NULL,
+                cartelle VARCHAR(4096) NOT NULL,
+                PRIMARY KEY (nome_stanza, nome_giocatore),
+                INDEX idx_ordine (nome_stanza, ordine)
+            )
+            """)
+            self._schema_ok = True
+
+    def statistiche(self):
+        s = super().statistiche()
+        s["pool"] = self.pool.statistiche()
+        return s
+
+
+class StorageSQLite(_StorageSQL):
+    nome = "sqlite"
+    SQL = {
+        "leggi": """
+            SELECT versione, CASE WHEN versione > ? THEN dati_partita END, ultimo_evento, eventi_pendenti
+            FROM stanze_tombola WHERE nome_stanza = ?""",
+        "versione": "SELECT versione FROM stanze_tombola WHERE nome_stanza = ?",
+        "salva": """
+            INSERT INTO stanze_tombola (nome_stanza, dati_partita, versione, ultimo_evento, eventi_pendenti, aggiornato_il)
+            VALUES (?1, ?2, 1, (SELECT COALESCE(MAX(id), 0) FROM eventi_tombola), 0, CURRENT_TIMESTAMP)
+            ON CONFLICT(nome_stanza) DO UPDATE SET dati_partita = ?3, versione = stanze_tombola.versione + 1,
+                aggiornato_il = CURRENT_TIMESTAMP, ultimo_evento = excluded.ultimo_evento, eventi_pendenti = 0""",
+        "salva_se": """
+            UPDATE stanze_tombola SET dati_partita = ?, versione = versione + 1, aggiornato_il = CURRENT_TIMESTAMP,
+                ultimo_evento = (SELECT COALESCE(MAX(id), 0) FROM eventi_tombola), eventi_pendenti = 0
+            WHERE nome_stanza = ? AND versione = ?""",
+        "append": """
+            UPDATE stanze_tombola SET versione = versione + 1, eventi_pendenti = eventi_pendenti + ?, aggiornato_il = CURRENT_TIMESTAMP
+            WHERE nome_stanza = ?""",
+        "append_se": """
+            UPDATE stanze_tombola SET versione = versione + 1, eventi_pendenti = eventi_pendenti + ?, aggiornato_il = CURRENT_TIMESTAMP
+            WHERE nome_stanza = ? AND versione = ?""",
+        "evento": "INSERT INTO eventi_tombola (nome_stanza, evento) VALUES (?, ?)",
+        "pendenti": "SELECT eventi_pendenti FROM stanze_tombola WHERE nome_stanza = ?",
+        "eventi": "SELECT evento FROM eventi_tombola WHERE nome_stanza = ? AND id > ? ORDER BY id",
+        "eventi_id": "SELECT id, evento FROM eventi_tombola WHERE nome_stanza = ? AND id > ? ORDER BY id",
+        "blocca": "SELECT dati_partita, ultimo_evento FROM stanze_tombola WHERE nome_stanza = ?",
+        "compatta": "UPDATE stanze_tombola SET dati_partita = ?, ultimo_evento = ?, eventi_pendenti = 0 WHERE nome_stanza = ?",
+        "elimina": "DELETE FROM stanze_tombola WHERE nome_stanza = ?",
+        "elimina_se": "DELETE FROM stanze_tombola WHERE nome_stanza = ? AND versione = ?",
+        "elimina_eventi": "DELETE FROM eventi_tombola WHERE nome_stanza = ?",
+        "inattive": """
+            SELECT nome_stanza, versione, CAST((julianday('now') - julianday(aggiornato_il)) * 86400 AS INTEGER), aggiornato_il
+            FROM stanze_tombola WHERE aggiornato_il < datetime('now', ?)
+            ORDER BY aggiornato_il, nome_stanza LIMIT ?""",
+        "inattive_dopo": """
+            SELECT nome_stanza, versione, CAST((julianday('now') - julianday(aggiornato_il)) * 86400 AS INTEGER), aggiornato_il
+            FROM stanze_tombola WHERE aggiornato_il < datetime('now', ?)
+                AND (aggiornato_il > ? OR (aggiornato_il = ? AND nome_stanza > ?))
+            ORDER BY aggiornato_il, nome_stanza LIMIT ?""",
+        "archivia": "INSERT OR IGNORE INTO archivio_tombola (nome_stanza, created_at, riassunto) VALUES (?, ?, ?)",
+        "sala_svuota": "DELETE FROM giocatori_tombola WHERE nome_stanza = ?",
+        "sala_elimina": "DELETE FROM sale_tombola WHERE nome_stanza = ?",
+        "sala_crea": "INSERT INTO sale_tombola (nome_stanza, posti_liberi, giocatori, cartelle) VALUES (?, ?, 0, 0)",
+        "sala_presente": "SELECT 1 FROM giocatori_tombola WHERE nome_stanza = ? AND nome_giocatore = ?",
+        "sala_posto": """
+            UPDATE sale_tombola SET posti_liberi = posti_liberi - 1, giocatori = giocatori + 1, cartelle = cartelle + ?
+            WHERE nome_stanza = ? AND posti_liberi > 0""",
+        "sala_ordine": "SELECT giocatori FROM sale_tombola WHERE nome_stanza = ?",
+        "sala_iscrivi": "INSERT OR IGNORE INTO giocatori_tombola (nome_stanza, nome_giocatore, ordine, n_cartelle, cartelle) VALUES (?, ?, ?, ?, ?)",
+        "sala_chiudi": "UPDATE sale_tombola SET posti_liberi = 0 WHERE nome_stanza = ?",
+        "sala_totali": "SELECT giocatori, cartelle, posti_liberi FROM sale_tombola WHERE nome_stanza = ?",
+        "sala_cartelle": "SELECT cartelle FROM giocatori_tombola WHERE nome_stanza = ? AND nome_giocatore = ?",
+        "sala_elenco": """
+            SELECT nome_giocatore, n_cartelle FROM giocatori_tombola
+            WHERE nome_stanza = ? AND nome_giocatore LIKE ? ESCAPE '!' ORDER BY ordine LIMIT ? OFFSET ?""",
+        "sala_conta": "SELECT COUNT(*) FROM giocatori_tombola WHERE nome_stanza = ? AND nome_giocatore LIKE ? ESCAPE '!'",
+        "sala_tutti": "SELECT nome_giocatore, cartelle FROM giocatori_tombola WHERE nome_stanza = ? ORDER BY ordine",
+    }
+    SCHEMA = """
+        CREATE TABLE IF NOT EXISTS stanze_tombola (
+            nome_stanza TEXT PRIMARY KEY,
+            dati_partita BLOB NOT NULL,
+            created_at TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            versione INTEGER NOT NULL DEFAULT 0,
+            ultimo_evento INTEGER NOT NULL DEFAULT 0,
+            eventi_pendenti INTEGER NOT NULL DEFAULT 0,
+            aggiornato_il TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE TABLE IF NOT EXISTS eventi_tombola (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome_stanza TEXT NOT NULL,
+            evento TEXT NOT NULL,
+            creato_il TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP
+        );
+        CREATE INDEX IF NOT EXISTS idx_stanza_evento ON eventi_tombola (nome_stanza, id);
+        CREATE TABLE IF NOT EXISTS archivio_tombola (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nome_stanza TEXT NOT NULL,
+            created_at TEXT NOT NULL,
+            archiviata_il TEXT NOT NULL DEFAULT CURRENT_TIMESTAMP,
+            riassunto TEXT NOT NULL,
+            UNIQUE (nome_stanza, created_at)
+        );
+        CREATE TABLE IF NOT EXISTS sale_tombola (
+            nome_stanza TEXT PRIMARY KEY,
+            posti_liberi INTEGER NOT NULL,
+            giocatori INTEGER NOT NULL DEFAULT 0,
+            cartelle INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE TABLE IF NOT EXISTS giocatori_tombola (
+            nome_stanza TEXT NOT NULL,
+            nome_giocatore TEXT NOT NULL,
+            ordine INTEGER NOT NULL,
+            n_cartelle INTEGER NOT NULL,
+            cartelle TEXT NOT NULL,
+            PRIMARY KEY (nome_stanza, nome_giocatore)
+        );
+        CREATE INDEX IF NOT EXISTS idx_ordine ON giocatori_tombola (nome_stanza, ordine);
+    """
+
+    def __init__(self, percorso="tombola.db", **opzioni):
+        super().__init__(**opzioni)
+        import sqlite3
+        self._sqlite3 = sqlite3
+        self.percorso = percorso
+        self._connessioni = {}     # thread -> connessione
+        self._connessioni_lock = threading.Lock()
+        with self._connessione() as conn:
+            conn.executescript(self.SCHEMA)
+            colonne = {riga[1] for riga in conn.execute("PRAGMA table_info(stanze_tombola)")}
+            if "aggiornato_il" not in colonne:
+                # File creati prima del ciclo di vita: SQLite non accetta CURRENT_TIMESTAMP come default in ALTER
+                conn.execute("ALTER TABLE stanze_tombola ADD COLUMN aggiornato_il TEXT NOT NULL DEFAULT ''")
+                conn.execute("UPDATE stanze_tombola SET aggiornato_il = CURRENT_TIMESTAMP")
+            conn.execute("CREATE INDEX IF NOT EXISTS idx_attivita ON stanze_tombola (aggiornato_il, nome_stanza)")
+
+    def _secondi(self, secondi):
+        return f"-{secondi} seconds"
+
+    @contextmanager
+    def _connessione(self):
+        # Una connessione per thread (sqlite3 non ama condividerle), in autocommit con transazioni esplicite
+        try:
+            conn = self._connessioni.get(threading.current_thread())
+            if conn is None: conn = self._nuova_connessione()
+            yield conn
+        except self._sqlite3.Error as e:
+            raise ErroreStorage(str(e)) from e
+
+    def _nuova_connessione(self):
+        # Streamlit esegue ogni rerun in un thread nuovo: le connessioni dei thread già finiti si chiudono qui,
+        # così ne restano aperte al più quanti sono i thread vivi che hanno usato lo storage
+        conn = self._sqlite3.connect(self.percorso, isolation_level=None, check_same_thread=False, timeout=10)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        with self._connessioni_lock:
+            finiti = [t for t in self._connessioni if not t.is_alive()]
+            vecchie = [self._connessioni.pop(t) for t in finiti]
+            self._connessioni[threading.current_thread()] = conn
+        for vecchia in vecchie: vecchia.close()
+        return conn
+
+    def statistiche(self):
+        s = super().statistiche()
+        with self._connessioni_lock: s["connessioni"] = len(self._connessioni)
+        return s
+
+    def _inizia(self, conn):
+        conn.execute("BEGIN IMMEDIATE")
+
+
+# --- MOTORE IN MEMORIA ---
+class StorageMemoria(StorageStanze):
+    nome = "memoria"
+
+    def __init__(self, **opzioni):
+        opzioni.pop("cache", None)  # i dati sono già in RAM
+        super().__init__(**opzioni)
+        self._stanze = {}
+        self._eventi_log = []     # (id, nome_stanza, testo)
+        self._ultimo_id = 0       # come un AUTO_INCREMENT: gli id non si riusano dopo le cancellazioni
+        self.archivio = {}        # (nome_stanza, created_at) -> riassunto
+        self._sale = {}           # nome_stanza -> {"posti_liberi", "giocatori", "cartelle", "iscritti": {nome: (n, testo)}}
+        self._cond = threading.Condition()
+
+    def _leggi(self, nome_stanza, versione_nota):
+        with self._cond:
+            r = self._stanze.get(nome_stanza)
+            if r is None: return None
+            testo = r["dati_partita"] if r["versione"] > versione_nota else None
+            return r["versione"], testo, r["ultimo_evento"], r["eventi_pendenti"]
+
+    def _eventi(self, nome_stanza, dopo_id):
+        with self._cond:
+            return [t for i, n, t in self._eventi_log if n == nome_stanza and i > dopo_id]
+
+    def leggi_versione(self, nome_stanza):
+        with metriche.misura("db_query", motore=self.nome, op="versione"), self._cond:
+            r = self._stanze.get(nome_stanza)
+            return r["versione"] if r else None
+
+    def _salva(self, nome_stanza, testo, versione_attesa=None):
+        with self._cond:
+            r = self._stanze.get(nome_stanza)
+            if versione_attesa is not None and (r is None or r["versione"] != versione_attesa): return False
+            ultimo = self._ultimo_id
+            if r is None:
+                self._stanze[nome_stanza] = {
+                    "dati_partita": testo, "created_at": time.time(), "aggiornato_il": time.time(),
+                    "versione": 1, "ultimo_evento": ultimo, "eventi_pendenti": 0
+                }
+            else:
+                r.update(dati_partita=testo, versione=r["versione"] + 1, ultimo_evento=ultimo, eventi_pendenti=0, aggiornato_il=time.time())
+            self._cond.notify_all()
+            return True
+
+    def _append(self, nome_stanza, testi, versione_attesa=None):
+        with self._cond:
+            r = self._stanze.get(nome_stanza)
+            if versione_attesa is not None and (r is None or r["versione"] != versione_attesa): return None
+            for testo in testi:
+                self._ultimo_id += 1
+                self._eventi_log.append((self._ultimo_id, nome_stanza, testo))
+            if r is None: return 0
+            r["versione"] += 1
+            r["eventi_pendenti"] += len(testi)
+            r["aggiornato_il"] = time.time()
+            self._cond.notify_all()
+            return r["eventi_pendenti"]
+
+    def _compatta(self, nome_stanza):
+        with self._cond:
+            r = self._stanze.get(nome_stanza)
+            if r is None or not r["eventi_pendenti"]: return
+            eventi = [(i, t) for i, n, t in self._eventi_log if n == nome_stanza and i > r["ultimo_evento"]]
+            dati = ricostruisci(decodifica_stanza(r["dati_partita"]), [t for _, t in eventi])
+            r.update(dati_partita=codifica_stanza(dati, self.formato), ultimo_evento=eventi[-1][0], eventi_pendenti=0)
+
+    def _elimina(self, nome_stanza):
+        with self._cond:
+            self._stanze.pop(nome_stanza, None)
+            self._sale.pop(nome_stanza, None)
+            self._eventi_log = [e for e in self._eventi_log if e[1] != nome_stanza]
+            self._cond.notify_all()
+
+    def _inattive(self, secondi, dopo, limite):
+        adesso = time.time()
+        with self._cond:
+            righe = sorted((r["aggiornato_il"], nome, r["versione"]) for nome, r in self._stanze.items() if r["aggiornato_il"] < adesso - secondi)
+        if dopo is not None: righe = [r for r in righe if (r[0], r[1]) > dopo]
+        return [(nome, versione, int(adesso - t), (t, nome)) for t, nome, versione in righe[:limite]]
+
+    def _archivia(self, voci):
+        rimosse = []
+        with self._cond:
+            for nome_stanza, versione, created_at, riassunto in voci:
+                r = self._stanze.get(nome_stanza)
+                if r is None or r["versione"] != versione: continue
+                del self._stanze[nome_stanza]
+                self._sale.pop(nome_stanza, None)
+                if riassunto is not None: self.archivio.setdefault((nome_stanza, created_at), riassunto)
+                rimosse.append(nome_stanza)
+            if rimosse:
+                via = set(rimosse)
+                self._eventi_log = [e for e in self._eventi_log if e[1] not in via]
+                self._cond.notify_all()
+        return rimosse
+
+    def _prepara_sala(self, nome_stanza, max_giocatori):
+        with self._cond:
+            self._sale.pop(nome_stanza, None)
+            if max_giocatori: self._sale[nome_stanza] = {"posti_liberi": max_giocatori, "giocatori": 0, "cartelle": 0, "iscritti": {}}
+
+    def _iscrivi(self, nome_stanza, nome_giocatore, testo_cartelle, n_cartelle):
+        with self._cond:
+            sala = self._sale.get(nome_stanza)
+            if sala is not None and nome_giocatore in sala["iscritti"]: return "presente"
+            if sala is None or sala["posti_liberi"] <= 0: return "piena"
+            sala["posti_liberi"] -= 1
+            sala["giocatori"] += 1
+            sala["cartelle"] += n_cartelle
+            sala["iscritti"][nome_giocatore] = (n_cartelle, testo_cartelle)   # dict: resta l'ordine di iscrizione
+            return "ok"
+
+    def _chiudi_iscrizioni(self, nome_stanza):
+        with self._cond:
+            sala = self._sale.get(nome_stanza)
+            if sala is not None: sala["posti_liberi"] = 0
+        return self.totali_sala(nome_stanza)
+
+    def totali_sala(self, nome_stanza):
+        with self._cond:
+            sala = self._sale.get(nome_stanza)
+            return {k: sala[k] for k in ("giocatori", "cartelle", "posti_liberi")} if sala else None
+
+    def _cartelle_giocatore(self, nome_stanza, nome_giocatore):
+        with self._cond:
+            voce = self._sale.get(nome_stanza, {}).get("iscritti", {}).get(nome_giocatore)
+            return voce[1] if voce else None
+
+    def _elenco_giocatori(self, nome_stanza, prefisso, da, quanti):
+        with self._cond:
+            iscritti = self._sale.get(nome_stanza, {}).get("iscritti", {})
+            trovati = [(nome, n) for nome, (n, _) in iscritti.items() if nome.startswith(prefisso)]
+        return trovati[da:da + quanti], len(trovati)
+
+    def _giocatori_sala(self, nome_stanza):
+        with self._cond:
+            return [(nome, testo) for nome, (_, testo) in self._sale.get(nome_stanza, {}).get("iscritti", {}).items()]
+
+    def attendi_cambio(self, nome_stanza, versione_nota, timeout=3.0, intervallo=None):
+        # Qui non serve il polling: chi scrive sveglia chi aspetta
+        scadenza = time.monotonic() + timeout
+        with self._cond:
+            while True:
+                r = self._stanze.get(nome_stanza)
+                versione = r["versione"] if r else None
+                restante = scadenza - time.monotonic()
+                if versione != versione_nota or restante <= 0: return versione
+                self._cond.wait(restante)
+
+
+# --- SCELTA DEL MOTORE DA CONFIGURAZIONE ---
+MOTORI = {"mysql": StorageMySQL, "sqlite": StorageSQLite, "memoria": StorageMemoria}
+
+_STORAGE = {}
+_STORAGE_LOCK = threading.Lock()
+
+def crea_storage(config):
+    # config: {"backend": "mysql" | "sqlite" | "memoria", opzioni comuni, più i parametri del motore}
+    config = dict(config)
+    motore = config.pop("backend", "mysql")
+    if motore not in MOTORI: raise ErroreStorage(f"Motore di storage sconosciuto: {motore}")
+    cache_ttl = config.pop("cache_ttl", 1.0)
+    cache_max = config.pop("cache_max_stanze", 256)
+    if motore != "memoria" and cache_ttl: config["cache"] = CacheStanze(cache_ttl, cache_max)
+    return MOTORI[motore](**config)
+
+def get_storage(config):
+    # Uno per configurazione e per processo: sopravvive ai rerun di Streamlit come pool e cache
+    chiave = json.dumps(config, sort_keys=True, default=str)
+    with _STORAGE_LOCK:
+        storage = _STORAGE.get(chiave)
+        if storage is None:
+            storage = crea_storage(config)
+            _STORAGE[chiave] = storage
+        return storage
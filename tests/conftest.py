@@ -0,0 +1,32 @@
+import os
+import sys
+
+import pytest
+
+# I moduli stanno tutti nella radice del repository (come li importa Streamlit)
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import partita
+from storage_tombola import crea_storage
+
+# --- STORAGE PER I TEST ---
+# Memoria e SQLite, blob ed eventi: MySQL serve un server e qui non c'è
+CONFIG_STORAGE = {
+    "memoria-blob": {"backend": "memoria"},
+    "memoria-eventi": {"backend": "memoria", "persistenza": "eventi", "compatta_ogni": 7},
+    "sqlite-blob": {"backend": "sqlite"},
+    "sqlite-eventi": {"backend": "sqlite", "persistenza": "eventi", "compatta_ogni": 7},
+}
+
+@pytest.fixture(params=list(CONFIG_STORAGE))
+def storage(request, tmp_path):
+    config = dict(CONFIG_STORAGE[request.param])
+    if config["backend"] == "sqlite": config["percorso"] = str(tmp_path / "tombola.db")
+    return crea_storage(config)
+
+@pytest.fixture
+def nome_stanza(request):
+    # Un nome per test: motore, classifica e indice sono stato di processo legato al nome
+    nome = "T_" + request.node.name
+    yield nome
+    partita.dimentica_stanza(nome)
@@ -0,0 +1,48 @@
+import threading
+
+from annunci import FRASI_FISSE, CacheAudio, CatalogoAnnunci, SintetizzatoreFinto
+from tombola_core import NOMI_PREMI, frase_premio
+
+
+def test_catalogo_fisso():
+    catalogo = CatalogoAnnunci()
+    assert catalogo.fissi == len(catalogo.fissi_tutti())
+    testi = {a.testo for a in catalogo.fissi_tutti()}
+    assert {str(n) for n in range(1, 91)} <= testi
+    assert set(FRASI_FISSE) <= testi and {frase_premio(t) for t in NOMI_PREMI} <= testi
+
+def test_premio_a_voce_in_italiano():
+    catalogo = CatalogoAnnunci()
+    parti = catalogo.parti(f"12 || Il soldato || {frase_premio(2)} || 50 totali per Anna, Bob!")
+    assert [a.testo for a in parti][2:] == ["Attenzione! AMBO!", "50 totali per Anna, Bob!"]
+    assert parti[2] is catalogo.annuncio("Attenzione! AMBO!")
+    assert [a.lingua for a in parti[2:]] == ["it-IT", "it-IT"]
+
+
+def test_sintetizzatore_finto_e_cache(tmp_path):
+    finto = SintetizzatoreFinto()
+    assert finto.sintetizza("Tex", "it-IT") == "FAKE-MP3|it-IT|Tex".encode("utf-8")
+    finto.chiamate = 0
+    catalogo = CatalogoAnnunci()
+    cache = CacheAudio(finto, str(tmp_path))
+    cache.precarica(catalogo)
+    assert finto.chiamate == catalogo.fissi
+    # Un premio costa una sola sintesi nuova: quota e vincitori
+    messaggio = f"7 || Rock n Roll || {frase_premio(15)} || 100 totali per Anna!"
+    clip = [cache.clip_annuncio(a) for a in catalogo.parti(messaggio)]
+    assert finto.chiamate == catalogo.fissi + 1
+    assert clip[-1] == b"FAKE-MP3|it-IT|100 totali per Anna!"
+    # Dopo un riavvio le clip si rileggono dal disco
+    nuovo = SintetizzatoreFinto()
+    riavvio = CacheAudio(nuovo, str(tmp_path))
+    riavvio.precarica(catalogo)
+    assert nuovo.chiamate == 0 and riavvio.statistiche()["disco"] == catalogo.fissi
+
+def test_sessioni_insieme_una_sintesi(tmp_path):
+    finto = SintetizzatoreFinto()
+    cache = CacheAudio(finto)
+    clip = []
+    thread = [threading.Thread(target=lambda: clip.append(cache.clip("Attenzione! TERNO!", "it-IT"))) for _ in range(8)]
+    for t in thread: t.start()
+    for t in thread: t.join()
+    assert finto.chiamate == 1 and len(set(clip)) == 1
@@ -0,0 +1,31 @@
+import partita
+from ciclo_vita_stanze import CicloVitaStanze
+from storage_tombola import crea_storage
+
+
+def crea(storage, nome, finita=False):
+    dati, _ = partita.crea_stanza(storage, nome, "pw")
+    if finita:
+        dati["gioco_finito"] = True
+        storage.salva(nome, dati)
+
+def test_archivia_le_partite_finite():
+    storage = crea_storage({"backend": "memoria"})
+    crea(storage, "in corso"); crea(storage, "finita", finita=True)
+    esito = CicloVitaStanze(storage, ttl=3600, finite_dopo=0).esegui_giro()
+    assert esito["archiviate"] == 1 and esito["scadute"] == 0
+    assert storage.carica("finita") == (None, None) and storage.carica("in corso")[1] is not None
+
+def test_il_giro_dopo_riparte_da_dove_si_era_fermato():
+    # Le stanze che restano (partite in corso) sono le più vecchie: con un limite di righe per giro
+    # le partite finite dopo di loro vanno comunque in archivio nei giri successivi
+    storage = crea_storage({"backend": "memoria"})
+    for i in range(30): crea(storage, f"in corso {i:02}")
+    for i in range(5): crea(storage, f"finita {i}", finita=True)
+    ciclo = CicloVitaStanze(storage, ttl=3600, finite_dopo=0, lotto=5, max_lotti=2)
+    giri = [ciclo.esegui_giro() for _ in range(4)]
+    assert [g["esaminate"] for g in giri] == [10, 10, 10, 5]
+    assert sum(g["archiviate"] for g in giri) == 5
+    assert [g["ripreso"] for g in giri] == [False, True, True, True]
+    # Scansione finita: si ricomincia dalle più vecchie
+    assert ciclo.esegui_giro()["ripreso"] is False
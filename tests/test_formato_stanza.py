@@ -0,0 +1,57 @@
+import json
+
+from formato_stanza import MAGIA, codifica_stanza, decodifica_stanza, decodifica_vista, proietta_vista, vista_giocatore
+from generatore_cartelle import GeneratoreCartelle
+from partita import nuova_stanza
+
+
+def stanza_con_giocatori(n_giocatori=5, cartelle=3):
+    dati = nuova_stanza("segreta")
+    carte = GeneratoreCartelle.genera_lotto(n_giocatori * cartelle, seed=1)
+    for g in range(n_giocatori):
+        dati["giocatori"][f"giocatore {g} è qui"] = carte[g * cartelle:(g + 1) * cartelle]
+        dati["classifica_vincite"][f"giocatore {g} è qui"] = g * 10
+    for n in dati["numeri_tabellone"][:12]:
+        dati["numeri_tabellone"].remove(n)
+        dati["numeri_estratti"].append(n)
+    return dati
+
+
+def test_binario_andata_e_ritorno():
+    dati = stanza_con_giocatori()
+    dato = codifica_stanza(dati)
+    assert dato[:3] == MAGIA
+    assert decodifica_stanza(dato) == dati
+    assert len(dato) < len(json.dumps(dati)) / 3
+
+def test_stanza_vuota_e_json():
+    dati = nuova_stanza("x")
+    assert decodifica_stanza(codifica_stanza(dati)) == dati
+    testo = codifica_stanza(dati, "json")
+    assert isinstance(testo, str) and decodifica_stanza(testo) == dati
+
+def test_fuori_schema_resta_json():
+    dati = stanza_con_giocatori(1, 1)
+    nome = next(iter(dati["giocatori"]))
+    dati["giocatori"][nome] = [[[300] * 9] * 3]
+    dato = codifica_stanza(dati)
+    assert isinstance(dato, str) and decodifica_stanza(dato) == dati
+
+def test_vista_binaria_come_vista_dai_dati():
+    dati = stanza_con_giocatori()
+    dato = codifica_stanza(dati)
+    for nome in list(dati["giocatori"]) + ["assente", None]:
+        vista = decodifica_vista(dato, nome)
+        assert vista == vista_giocatore(dati, nome)
+        assert "admin_pwd" not in vista and "giocatori" not in vista and "numeri_tabellone" not in vista
+        assert decodifica_vista(codifica_stanza(dati, "json"), nome) == vista
+
+def test_proiezione_cartelle_a_richiesta():
+    dati = stanza_con_giocatori()
+    for dato in (codifica_stanza(dati), codifica_stanza(dati, "json")):
+        comune, cartelle_di = proietta_vista(dato)
+        assert comune == vista_giocatore(dati, None)
+        for nome, cartelle in dati["giocatori"].items():
+            assert cartelle_di(nome) == cartelle
+            assert cartelle_di(nome) is not cartelle_di(nome)
+        assert cartelle_di("assente") == []
@@ -0,0 +1,34 @@
+import pytest
+
+from generatore_cartelle import RANGE_COLONNE, GeneratoreCartelle, impronta
+
+
+def controlla_cartella(c):
+    assert [sum(1 for n in riga if n) for riga in c] == [5, 5, 5]
+    for j, (inizio, fine) in enumerate(RANGE_COLONNE):
+        colonna = [c[r][j] for r in range(3) if c[r][j]]
+        assert all(inizio <= n < fine for n in colonna)
+        assert colonna == sorted(set(colonna))
+
+
+def test_matrice_e_array():
+    controlla_cartella(GeneratoreCartelle.genera_matrice_3x9())
+    for c in GeneratoreCartelle.genera_array(200, seed=3).tolist(): controlla_cartella(c)
+
+def test_serie_coprono_1_90():
+    carte = GeneratoreCartelle.genera_serie_array(300, seed=5)
+    assert carte.shape == (1800, 3, 9)
+    for c in carte.tolist(): controlla_cartella(c)
+    for serie in carte.reshape(-1, 6 * 27):
+        assert sorted(serie[serie > 0].tolist()) == list(range(1, 91))
+    assert (GeneratoreCartelle.genera_serie_array(4, seed=9) == GeneratoreCartelle.genera_serie_array(4, seed=9)).all()
+
+def test_lotto_senza_doppioni():
+    escluse = GeneratoreCartelle.genera_lotto(50, seed=1)
+    lotto = GeneratoreCartelle.genera_lotto(500, seed=1, escludi={impronta(c) for c in escluse})
+    impronte = {impronta(c) for c in lotto}
+    assert len(impronte) == 500 and not impronte & {impronta(c) for c in escluse}
+
+def test_serie_solo_multipli_di_6():
+    assert len(GeneratoreCartelle.genera_lotto(12, serie=True)) == 12
+    with pytest.raises(ValueError): GeneratoreCartelle.genera_lotto(10, serie=True)
@@ -0,0 +1,55 @@
+import pytest
+
+import indice_cartelle
+import partita
+import torneo
+from generatore_cartelle import GeneratoreCartelle, impronta
+from tombola_core import MossaNonValida
+
+
+def test_rendi_uniche_rigenera_solo_i_doppioni():
+    indice = indice_cartelle.IndiceCartelle()
+    lotto = GeneratoreCartelle.genera_lotto(4, seed=2)
+    indice.aggiungi("A", None, lotto[:2])
+    uniche = indice.rendi_uniche(lotto[1:] + lotto[3:])
+    assert uniche[:2] == lotto[2:] and len(uniche) == 4
+    assert len({impronta(c) for c in uniche} | {impronta(c) for c in lotto[:2]}) == 6
+    indice.togli_stanza("A")
+    assert len(indice) == 0
+
+def test_ingressi_senza_cartelle_ripetute(storage, nome_stanza, monkeypatch):
+    partita.crea_stanza(storage, nome_stanza, "pw")
+    partita.entra_in_stanza(storage, nome_stanza, "anna", 3)
+    presa = storage.carica_fresca(nome_stanza)[1]["giocatori"]["anna"][1]
+    originale = GeneratoreCartelle.genera_lotto
+    monkeypatch.setattr(GeneratoreCartelle, "genera_lotto", staticmethod(
+        lambda n, seed=None, serie=False, escludi=(): [presa] + originale(n - 1) if not escludi else originale(n, seed, serie, escludi)))
+    partita.entra_in_stanza(storage, nome_stanza, "bruno", 3)
+    giocatori = storage.carica_fresca(nome_stanza)[1]["giocatori"]
+    tutte = [impronta(c) for cartelle in giocatori.values() for c in cartelle]
+    assert len(tutte) == len(set(tutte)) == 6
+
+def test_torneo_a_indice_freddo(storage, monkeypatch):
+    # Un processo nuovo (nessun indice in memoria) non emette cartelle già date in un'altra stanza del torneo
+    torneo.crea_torneo(storage, "IT", "t")
+    for nome, sala in (("IA", False), ("IB", False), ("IS", True)):
+        partita.crea_stanza(storage, nome, "p", sala=sala, max_giocatori=50 if sala else None)
+        torneo.collega_stanza(storage, "IT", nome, "p")
+        for i in range(3): partita.entra_in_stanza(storage, nome, f"{nome}{i}", 2)
+    presa = storage.carica_fresca("IB")[1]["giocatori"]["IB1"][0]
+    monkeypatch.setattr(indice_cartelle, "_INDICI", {})
+    originale = GeneratoreCartelle.genera_lotto
+    monkeypatch.setattr(GeneratoreCartelle, "genera_lotto", staticmethod(
+        lambda n, seed=None, serie=False, escludi=(): [presa] + originale(n - 1) if not escludi else originale(n, seed, serie, escludi)))
+    partita.entra_in_stanza(storage, "IA", "nuovo", 2)
+    partita.entra_in_stanza(storage, "IS", "nuovo", 2)
+    tutte = [c for nome in ("IA", "IB") for cartelle in storage.carica_fresca(nome)[1]["giocatori"].values() for c in cartelle]
+    tutte += [c for cartelle in storage.giocatori_sala("IS").values() for c in cartelle]
+    impronte = [impronta(c) for c in tutte]
+    assert len(impronte) == len(set(impronte)) == 22
+    # Una sala con una cartella già del torneo non si collega
+    partita.crea_stanza(storage, "IS2", "p", sala=True, max_giocatori=50)
+    storage.iscrivi_giocatore("IS2", "copia", [presa])
+    with pytest.raises(MossaNonValida): torneo.collega_stanza(storage, "IT", "IS2", "p")
+    for nome in ("IA", "IB", "IS", "IS2"): partita.dimentica_stanza(nome)
+    torneo.dimentica_torneo("IT")
@@ -0,0 +1,56 @@
+import random
+
+import pytest
+
+from generatore_cartelle import GeneratoreCartelle
+from motore_vincite import MotoreVincite
+
+
+def vincitori_a_forza_bruta(giocatori, estratti, target):
+    usciti = set(estratti)
+    vincitori = []
+    for nome, cartelle in giocatori.items():
+        if target == 15: vince = any(all(n in usciti for riga in c for n in riga if n) for c in cartelle)
+        else: vince = any(sum(n in usciti for n in riga if n) >= target for c in cartelle for riga in c)
+        if vince: vincitori.append(nome)
+    return vincitori
+
+def attesa_a_forza_bruta(giocatori, estratti, target, distanza):
+    usciti = set(estratti)
+    quante = 0
+    for cartelle in giocatori.values():
+        for c in cartelle:
+            punti = max(sum(n in usciti for n in riga if n) for riga in c) if target <= 5 else sum(n in usciti for riga in c for n in riga if n)
+            quante += punti == target - distanza
+    return quante
+
+def giocatori_casuali(seed, n_giocatori=25):
+    carte = GeneratoreCartelle.genera_lotto(n_giocatori * 4, seed=seed)
+    return {f"g{g}": carte[g * 4:g * 4 + random.Random(seed + g).randint(1, 4)] for g in range(n_giocatori)}
+
+
+@pytest.mark.parametrize("seed", range(4))
+def test_motore_come_forza_bruta(seed):
+    giocatori = giocatori_casuali(seed)
+    sequenza = list(range(1, 91)); random.Random(seed).shuffle(sequenza)
+    motore = MotoreVincite(giocatori)
+    for i, n in enumerate(sequenza):
+        motore.applica(n)
+        estratti = sequenza[:i + 1]
+        for target in (2, 3, 4, 5, 15):
+            assert motore.vincitori(target) == vincitori_a_forza_bruta(giocatori, estratti, target)
+            assert motore.distribuzione(target) == [attesa_a_forza_bruta(giocatori, estratti, target, d) for d in (1, 2, 3)]
+
+@pytest.mark.parametrize("quanti", [0, 1, 30, 90])
+def test_motore_nuovo_su_partita_avviata(quanti):
+    # sincronizza su un motore vuoto ricalcola in blocco: stesso stato dell'avanzamento numero per numero
+    giocatori = giocatori_casuali(7)
+    sequenza = list(range(1, 91)); random.Random(7).shuffle(sequenza)
+    passo = MotoreVincite(giocatori)
+    for n in sequenza[:quanti]: passo.applica(n)
+    blocco = MotoreVincite(giocatori)
+    blocco.sincronizza(sequenza[:quanti])
+    for target in (2, 3, 4, 5, 15):
+        assert blocco.vincitori(target) == passo.vincitori(target)
+        assert blocco.distribuzione(target) == passo.distribuzione(target)
+        for nome in giocatori: assert blocco.distanza_giocatore(nome, target) == passo.distanza_giocatore(nome, target)
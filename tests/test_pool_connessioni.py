@@ -0,0 +1,62 @@
+import threading
+import time
+
+import pytest
+
+from pool_connessioni import PoolConnessioni, PoolEsaurito
+
+
+class Connessione:
+    def __init__(self):
+        self.aperta = True
+
+    def is_connected(self):
+        return self.aperta
+
+    def close(self):
+        self.aperta = False
+
+
+def test_riusa_le_connessioni():
+    create = []
+    pool = PoolConnessioni(lambda: create.append(Connessione()) or create[-1], dimensione=2)
+    for _ in range(5):
+        with pool.acquisisci(): pass
+    assert len(create) == 1 and create[0].aperta
+    s = pool.statistiche()
+    assert s["checkout"] == 5 and s["in_uso"] == 0 and s["libere"] == 1
+
+def test_timeout_a_pool_pieno():
+    pool = PoolConnessioni(Connessione, dimensione=1, timeout_checkout=0.05)
+    conn = pool.acquisisci()
+    with pytest.raises(PoolEsaurito): pool.acquisisci()
+    conn.close()
+    pool.acquisisci().close()
+    assert pool.statistiche()["timeout"] == 1
+
+def test_scarta_e_riconnessione():
+    pool = PoolConnessioni(Connessione, dimensione=1, intervallo_verifica=0)
+    conn = pool.acquisisci()
+    conn.scarta()
+    assert pool.statistiche()["aperte"] == 0
+    conn = pool.acquisisci()
+    conn._conn.aperta = False    # caduta mentre era libera
+    conn.close()
+    nuova = pool.acquisisci()
+    assert nuova._conn.aperta and pool.statistiche()["riconnessioni"] == 1
+
+def test_chiusura_sveglia_chi_aspetta():
+    pool = PoolConnessioni(Connessione, dimensione=1, timeout_checkout=10)
+    conn = pool.acquisisci()
+    esito = []
+    def aspetta():
+        try: pool.acquisisci()
+        except PoolEsaurito: esito.append(time.monotonic())
+    t = threading.Thread(target=aspetta); t.start()
+    time.sleep(0.05)
+    inizio = time.monotonic()
+    pool.chiudi_tutte()
+    t.join(2)
+    assert esito and esito[0] - inizio < 1
+    conn.close()
+    assert not conn._conn.aperta and pool.statistiche()["aperte"] == 0
@@ -0,0 +1,123 @@
+import copy
+import threading
+
+import pytest
+
+import partita
+import tombola_core
+from formato_stanza import vista_giocatore
+from motore_vincite import MotoreVincite
+from storage_tombola import ErroreStorage, crea_storage
+from tombola_core import MossaNonValida, applica_evento
+
+
+def test_aggiorna_concorrente_senza_perdite(storage, nome_stanza):
+    partita.crea_stanza(storage, nome_stanza, "pw")
+    def incrementa(dati):
+        dati["contatore"] = dati.get("contatore", 0) + 1
+        return [{"t": "set", "k": "contatore", "v": dati["contatore"]}]
+    storage.tentativi = 200
+    errori = []
+    def lavoro():
+        try:
+            for _ in range(25): storage.aggiorna(nome_stanza, incrementa)
+        except Exception as e:
+            errori.append(e)
+    thread = [threading.Thread(target=lavoro) for _ in range(8)]
+    for t in thread: t.start()
+    for t in thread: t.join()
+    assert not errori
+    assert storage.carica_fresca(nome_stanza)[1]["contatore"] == 200
+    assert storage.statistiche()["concorrenza"]["aggiornamenti"] == 200
+
+def test_ingressi_concorrenti_rispettano_i_posti(storage, nome_stanza, monkeypatch):
+    # Il limite si ricontrolla dentro la scrittura condizionata (tombola_core.evento_ingresso)
+    monkeypatch.setattr(partita, "MAX_GIOCATORI", 10)
+    monkeypatch.setattr(tombola_core, "MAX_GIOCATORI", 10)
+    partita.crea_stanza(storage, nome_stanza, "pw")
+    esiti = []
+    def entra(i):
+        try: esiti.append(partita.entra_in_stanza(storage, nome_stanza, f"g{i}", 2))
+        except MossaNonValida: esiti.append("piena")
+    thread = [threading.Thread(target=entra, args=(i,)) for i in range(16)]
+    for t in thread: t.start()
+    for t in thread: t.join()
+    dati = storage.carica_fresca(nome_stanza)[1]
+    assert esiti.count("ok") == len(dati["giocatori"]) == 10
+
+def test_sqlite_chiude_le_connessioni_dei_thread_finiti(tmp_path):
+    # Come i rerun di Streamlit: ogni lettura da un thread nuovo
+    storage = crea_storage({"backend": "sqlite", "percorso": str(tmp_path / "t.db"), "cache_ttl": 0})
+    partita.crea_stanza(storage, "S", "pw")
+    for _ in range(30):
+        t = threading.Thread(target=storage.carica, args=("S",)); t.start(); t.join()
+    assert storage.statistiche()["connessioni"] <= 2
+    assert storage.statistiche()["concorrenza"]["aggiornamenti"] == 0
+
+def test_aggiorna_stanza_assente(storage):
+    assert storage.aggiorna("non c'è", lambda dati: [{"t": "set", "k": "x", "v": 1}]) == (None, None)
+
+
+@pytest.mark.parametrize("sala", [False, True])
+def test_ricostruzione_come_motore(storage, nome_stanza, sala):
+    # A ogni estrazione lo stato riletto (snapshot + eventi, o blob) è quello che dà il motore vincite
+    partita.crea_stanza(storage, nome_stanza, "pw", sala=sala, max_giocatori=100 if sala else None)
+    for i in range(30): partita.entra_in_stanza(storage, nome_stanza, f"g{i}", 6)
+    partita.avvia_partita(storage, nome_stanza, storage.carica_fresca(nome_stanza)[1])
+    giocatori = storage.giocatori_sala(nome_stanza) if sala else None
+    while True:
+        prima = storage.carica_fresca(nome_stanza)[1]
+        if prima.get("gioco_finito"): break
+        atteso = copy.deepcopy(prima)
+        applica_evento(atteso, {"t": "estrazione", "n": atteso["numeri_tabellone"][0]}, MotoreVincite.da_stanza(atteso, giocatori))
+        assert partita.estrai_numero(storage, nome_stanza)[0]
+        assert storage.carica_fresca(nome_stanza)[1] == atteso
+    assert prima["pagamenti"] == 5
+
+def test_vista_giocatore(storage, nome_stanza):
+    partita.crea_stanza(storage, nome_stanza, "pw")
+    for nome in ("anna", "bruno"): partita.entra_in_stanza(storage, nome_stanza, nome, 2)
+    partita.avvia_partita(storage, nome_stanza, storage.carica_fresca(nome_stanza)[1])
+    for _ in range(5): partita.estrai_numero(storage, nome_stanza)
+    dati = storage.carica_fresca(nome_stanza)[1]
+    versione, vista = storage.carica_vista(nome_stanza, "anna")
+    assert vista["mie_cartelle"] == dati["giocatori"]["anna"]
+    assert vista["numeri_estratti"] == dati["numeri_estratti"] and vista["in_attesa"] == dati["in_attesa"]
+    assert "giocatori" not in vista and "admin_pwd" not in vista
+    assert storage.carica_vista(nome_stanza, "anna", versione) == (versione, None)
+
+
+# --- CACHE ---
+def test_cache_rivalida_e_invalida(tmp_path):
+    storage = crea_storage({"backend": "sqlite", "percorso": str(tmp_path / "c.db"), "cache_ttl": 60})
+    partita.crea_stanza(storage, "C", "pw")
+    versione, dati = storage.carica("C")
+    assert storage.carica("C")[0] == versione
+    assert storage.cache.statistiche()["hit"] >= 1
+    # La copia data al lettore è sua
+    dati["giocatori"]["intruso"] = []
+    assert "intruso" not in storage.carica("C")[1]["giocatori"]
+    # Una scrittura di questo processo invalida subito, senza aspettare il ttl
+    partita.entra_in_stanza(storage, "C", "anna", 1)
+    nuova, dati = storage.carica("C")
+    assert nuova > versione and "anna" in dati["giocatori"]
+    assert storage.carica("C", nuova) == (nuova, None)
+    partita.dimentica_stanza("C")
+
+def test_cache_viste_dal_blob(tmp_path):
+    storage = crea_storage({"backend": "sqlite", "percorso": str(tmp_path / "v.db"), "cache_ttl": 60})
+    partita.crea_stanza(storage, "V", "pw")
+    for nome in ("anna", "bruno", "carla"): partita.entra_in_stanza(storage, "V", nome, 3)
+    dati = storage.carica_fresca("V")[1]
+    storage.cache.invalida("V")
+    vista = storage.carica_vista("V", "bruno")[1]
+    assert vista == vista_giocatore(dati, "bruno")
+    # Le cartelle date a una vista sono sue, e i dati interi restano quelli dello storage
+    vista["mie_cartelle"][0][0][0] = 99
+    assert storage.carica_vista("V", "bruno")[1]["mie_cartelle"] == dati["giocatori"]["bruno"]
+    assert storage.carica("V")[1] == dati == storage.carica("V")[1]
+    assert storage.carica_vista("V", "nessuno")[1]["mie_cartelle"] == []
+    partita.dimentica_stanza("V")
+
+def test_formato_sconosciuto():
+    with pytest.raises(ErroreStorage): crea_storage({"backend": "memoria", "formato": "xml"})
@@ -0,0 +1,182 @@
+from motore_vincite import MotoreVincite
+import metriche
+
+# --- IMPORT SMORFIA DA FILE ESTERNO ---
+try:
+    from smorfia_dati import SMORFIA
+except ImportError:
+    SMORFIA = {} 
+
+# --- COSTANTI ECONOMICHE ---
+COSTO_CARTELLA = 5
+QUOTE = {
+    2: 0.12, 3: 0.18, 4: 0.20, 5: 0.20, 15: 0.30
+}
+MAX_GIOCATORI = 40
+
+class MossaNonValida(Exception):
+    pass
+
+# --- SMORFIA LOOKUP ---
+def get_smorfia_text(num):
+    return SMORFIA.get(int(num), "Rock n Roll")
+
+# --- CALCOLO MONTEPREMI ---
+# "totali" è un aggregato tenuto aggiornato dagli ingressi (e, in sala grande, dallo storage per giocatore):
+# niente ricalcolo su tutte le cartelle a ogni rerun. Le stanze create prima si ricontano come una volta.
+def nuovi_totali():
+    return {"giocatori": 0, "cartelle": 0}
+
+def conta_giocatori(dati_stanza):
+    totali = dati_stanza.get("totali")
+    return totali["giocatori"] if totali is not None else len(dati_stanza["giocatori"])
+
+def get_info_economiche(dati_stanza):
+    totali = dati_stanza.get("totali")
+    tot_cartelle = totali["cartelle"] if totali is not None else sum(len(c) for c in dati_stanza["giocatori"].values())
+    montepremi = tot_cartelle * COSTO_CARTELLA
+    premi_valore = {
+        2: round(montepremi * QUOTE[2]),
+        3: round(montepremi * QUOTE[3]),
+        4: round(montepremi * QUOTE[4]),
+        5: round(montepremi * QUOTE[5]),
+        15: round(montepremi * QUOTE[15])
+    }
+    return tot_cartelle, montepremi, premi_valore
+
+# --- CONTROLLO VINCITE ---
+NOMI_PREMI = {2: "AMBO", 3: "TERNO", 4: "QUATERNA", 5: "CINQUINA", 15: "TOMBOLA"}
+
+def frase_premio(target):
+    return f"Attenzione! {NOMI_PREMI.get(target, 'TOMBOLA')}!"
+
+def prossimo_obbiettivo(target):
+    # AMBO -> TERNO -> QUATERNA -> CINQUINA -> TOMBOLA -> fine (None)
+    if target < 5: return target + 1
+    return 15 if target == 5 else None
+
+def controlla_vincite(dati_stanza, motore=None):
+    with metriche.misura("controlla_vincite"):
+        return _controlla_vincite(dati_stanza, motore)
+
+def _controlla_vincite(dati_stanza, motore=None):
+    target = dati_stanza.get("obbiettivo_corrente", 2)
+    if motore is None: motore = MotoreVincite.da_stanza(dati_stanza)
+    # Avanzamento e letture sotto lo stesso lock: il motore è condiviso tra i thread.
+    # "in_attesa" (cartelle a 1, 2, 3 numeri dal prossimo premio) va nella parte comune della vista:
+    # le pagine dei giocatori la leggono dai dati invece di ricostruire il motore
+    with motore.lock:
+        motore.sincronizza(dati_stanza["numeri_estratti"])
+        vincitori_round = motore.vincitori(target)
+        prossimo = prossimo_obbiettivo(target) if vincitori_round else target
+        if prossimo is not None: dati_stanza["in_attesa"] = motore.distribuzione(prossimo, 3)
+        else: dati_stanza.pop("in_attesa", None)
+    return dati_stanza, _paga_vincita(dati_stanza, target, vincitori_round, prossimo)
+
+def _paga_vincita(dati_stanza, target, vincitori_round, prossimo):
+    # Premio, classifica e avanzamento dell'obbiettivo: -> True se c'è una vincita nuova da annunciare
+    nome_premio = NOMI_PREMI.get(target, "TOMBOLA")
+    
+    _, _, valori_premi = get_info_economiche(dati_stanza)
+    valore_totale_premio = valori_premi.get(target, 0)
+    
+    nuova_vincita_trovata = False
+
+    if vincitori_round:
+        quota_cadauno = int(valore_totale_premio / len(vincitori_round)) if len(vincitori_round) > 0 else 0
+        if "classifica_vincite" not in dati_stanza: dati_stanza["classifica_vincite"] = {}
+        for vincitore in vincitori_round:
+            vecchio_saldo = dati_stanza["classifica_vincite"].get(vincitore, 0)
+            dati_stanza["classifica_vincite"][vincitore] = vecchio_saldo + quota_cadauno
+        # Traccia del pagamento: la classifica ordinata (classifica.py) si aggiorna solo con questo
+        dati_stanza["pagamenti"] = dati_stanza.get("pagamenti", 0) + 1
+        dati_stanza["ultimo_pagamento"] = {"n": dati_stanza["pagamenti"], "g": vincitori_round, "q": quota_cadauno}
+
+        testo = ", ".join(vincitori_round)
+        msg = f"Attenzione! {nome_premio} ({valore_totale_premio} totali) per {testo}!"
+        # A voce in due parti: la frase del premio è fissa (annunci.FRASI_FISSE), solo i vincitori cambiano
+        annuncio = f"{frase_premio(target)} || {valore_totale_premio} totali per {testo}!"
+        
+        if annuncio not in dati_stanza.get("messaggio_audio", ""):
+            dati_stanza["messaggio_audio"] += f" || {annuncio}"
+            dati_stanza["messaggio_toast"] = f"🏆 {msg} (+{quota_cadauno} cad.)"
+            nuova_vincita_trovata = True
+        
+        if prossimo is not None: dati_stanza["obbiettivo_corrente"] = prossimo
+        else: 
+            dati_stanza["messaggio_audio"] += " || Gioco Finito!"
+            dati_stanza["gioco_finito"] = True
+            nuova_vincita_trovata = True
+
+    return nuova_vincita_trovata
+
+# --- EVENTI DI PARTITA ---
+def _estrai(dati_stanza, n):
+    dati_stanza["numeri_tabellone"].remove(n)
+    dati_stanza["numeri_estratti"].append(n)
+    dati_stanza["ultimo_numero"] = n
+    smorfia = get_smorfia_text(n)
+    dati_stanza["messaggio_audio"] = f"{n} || {smorfia}"
+    dati_stanza["messaggio_toast"] = ""
+
+def esegui_estrazione(dati_stanza, n, motore=None):
+    _estrai(dati_stanza, n)
+    _, win = controlla_vincite(dati_stanza, motore)
+    return win
+
+def applica_evento(dati_stanza, evento, motore=None):
+    # Reducer unico: usato sia per aggiornare la partita sia per ricostruirla dal log
+    tipo = evento["t"]
+    if tipo == "estrazione":
+        return esegui_estrazione(dati_stanza, evento["n"], motore)
+    if tipo == "ingresso":
+        totali = dati_stanza.get("totali")
+        if totali is not None:
+            precedenti = dati_stanza["giocatori"].get(evento["g"])
+            if precedenti is None: totali["giocatori"] += 1
+            totali["cartelle"] += len(evento["c"]) - len(precedenti or ())
+        dati_stanza["giocatori"][evento["g"]] = evento["c"]
+        if "classifica_vincite" not in dati_stanza: dati_stanza["classifica_vincite"] = {}
+        dati_stanza["classifica_vincite"][evento["g"]] = 0
+    elif tipo == "set":
+        dati_stanza[evento["k"]] = evento["v"]
+    # "creazione" e "vincita" servono solo come traccia di audit
+    return False
+
+def rigioca_evento(dati_stanza, evento):
+    # Reducer della ricostruzione dal log: le vincite non si ricalcolano (niente motore, niente cartelle
+    # della sala), si prendono dagli eventi. L'estrazione porta "in_attesa" di chi l'ha fatta ("a"),
+    # e ogni premio assegnato ha il suo evento "vincita" subito dopo
+    tipo = evento["t"]
+    if tipo == "estrazione":
+        _estrai(dati_stanza, evento["n"])
+        if evento.get("a") is not None: dati_stanza["in_attesa"] = evento["a"]
+        else: dati_stanza.pop("in_attesa", None)
+        return False
+    if tipo == "vincita":
+        return _paga_vincita(dati_stanza, evento["p"], evento["v"], prossimo_obbiettivo(evento["p"]))
+    return applica_evento(dati_stanza, evento)
+
+def evento_ingresso(dati_stanza, nome_giocatore, cartelle):
+    # Controlli fatti sullo stato appena riletto dallo storage: con la scrittura condizionata
+    # due ingressi simultanei non possono superare il limite di posti
+    if nome_giocatore in dati_stanza["giocatori"]: return None
+    if dati_stanza.get("stato", "LOBBY") != "LOBBY":
+        raise MossaNonValida("🚫 Concerto già iniziato! La biglietteria è chiusa.")
+    if len(dati_stanza["giocatori"]) >= MAX_GIOCATORI:
+        raise MossaNonValida("Stanza piena.")
+    return {"t": "ingresso", "g": nome_giocatore, "c": cartelle}
+
+# --- RIASSUNTO PER L'ARCHIVIO ---
+def riassunto_partita(dati_stanza):
+    # Poche centinaia di byte al posto del blob: niente cartelle, niente tabellone
+    tot_cartelle, montepremi, _ = get_info_economiche(dati_stanza)
+    return {
+        "created_at": dati_stanza.get("created_at"),
+        "giocatori": conta_giocatori(dati_stanza),
+        "cartelle": tot_cartelle,
+        "montepremi": montepremi,
+        "estrazioni": len(dati_stanza.get("numeri_estratti", [])),
+        "finita": bool(dati_stanza.get("gioco_finito")),
+        "vincite": {g: v for g, v in dati_stanza.get("classifica_vincite", {}).items() if v},
+    }
@@ -1,33 +1,23 @@
 import streamlit as st
-import random
 import time
-import json
-import os
+import base64
 from datetime import datetime
-import mysql.connector
-from mysql.connector import Error
-
-# --- LISTA LITFIBA (Per Audio Italiano) ---
-LITFIBA_HITS = [
-    "Eroi nel vento", "El Diablo", "Tex", "Lulù e Marlene", 
-    "Gioconda", "Cane", "Fata Morgana", "Maudit", 
-    "Il volo", "Re del silenzio", "Cangaceiro", "Spirito", 
-    "Regina di Cuori", "Lacio Drom", "La Paura", "Proibito", 
-    "Apapaia", "Paname", "Louisiana", "Vivere il mio tempo",
-    "Dimmi il nome", "Sotto il vulcano", "Ritmo 2", "Istanbul"
-]
-
-# --- IMPORT SMORFIA DA FILE ESTERNO ---
-try:
-    from smorfia_dati import SMORFIA
-except ImportError:
-    SMORFIA = {} 
-
-# --- COSTANTI ECONOMICHE ---
-COSTO_CARTELLA = 5
-QUOTE = {
-    2: 0.12, 3: 0.18, 4: 0.20, 5: 0.20, 15: 0.30
-}
+from storage_tombola import get_storage, ErroreStorage
+from motore_vincite import motore_per_stanza
+from tombola_core import COSTO_CARTELLA, MAX_GIOCATORI, MossaNonValida, get_smorfia_text, get_info_economiche, conta_giocatori
+from classifica import classifica_per_stanza
+from cartelle import maschera_numeri, distanza_dal_premio
+from render_html import html_tabellone, html_cartella
+import partita
+import torneo
+from regia_autoplay import get_regia
+from annunci import get_catalogo, get_cache_audio
+from ciclo_vita_stanze import get_ciclo_vita
+import metriche
+
+# --- CLIENT STREAMLIT ---
+# La logica di gioco sta in tombola_core / partita (importabili senza Streamlit):
+# qui restano la pagina, la sessione e la traduzione degli errori in messaggi.
 
 # --- CONFIGURAZIONE PAGINA E STILE ROCK ---
 st.set_page_config(page_title="TombolaRock", layout="wide", page_icon="🤟")
@@ -69,198 +59,170 @@ st.markdown("""
             font-size: 30px; font-weight: bold; color: #f1c40f; 
             margin-top: 10px; font-style: italic; text-shadow: 1px 1px 0 #000;
         }
+        
+        /* Tabellone e Cartelle */
+        .g{display:grid;grid-template-columns:repeat(10,1fr);gap:2px}.c{border:1px solid #ccc;text-align:center;padding:5px;font-size:12px;background:#eee}.Ex{background:#e74c3c;color:white;font-weight:bold}
+        .ct{width:100%;border-collapse:collapse;margin-bottom:10px;background:white}.cc{border:1px solid #333;width:11%;text-align:center;height:30px;font-weight:bold}.ch{background-color:#2ecc71;color:white}.ce{background-color:#bdc3c7}
     </style>
 """, unsafe_allow_html=True)
 
-# --- GESTIONE DATABASE MYSQL ---
-def get_connection():
-    if "mysql" not in st.secrets:
-        st.error("Manca la configurazione [mysql] in .streamlit/secrets.toml")
+# --- METRICHE (opzionali: [metriche] attive = true, log = true, porta = 9464) ---
+def configura_metriche():
+    config = st.secrets.get("metriche", {})
+    if not config.get("attive", False): return
+    if not metriche.attive(): metriche.attiva(log_strutturato=bool(config.get("log", False)))
+    if config.get("porta"):
+        try: metriche.avvia_endpoint(int(config["porta"]))
+        except OSError: pass  # porta già occupata da un altro processo: restano il pannello admin e i log
+
+configura_metriche()
+
+# --- GESTIONE STORAGE (MySQL / SQLite / memoria) ---
+def get_storage_stanze():
+    if "storage" not in st.secrets and "mysql" not in st.secrets:
+        st.error("Manca la configurazione [storage] o [mysql] in .streamlit/secrets.toml")
         st.stop()
-    return mysql.connector.connect(
-        host=st.secrets["mysql"]["host"],
-        user=st.secrets["mysql"]["user"],
-        password=st.secrets["mysql"]["password"],
-        database=st.secrets["mysql"]["database"],
-        port=st.secrets["mysql"].get("port", 3306)
+    config = dict(st.secrets["storage"]) if "storage" in st.secrets else {}
+    config.setdefault("backend", "mysql")
+    if config["backend"] == "mysql": config = {**dict(st.secrets["mysql"]), **config}
+    return get_storage(config)
+
+def dimentica_stanza(nome_stanza):
+    # Stato di processo legato alla stanza: motore vincite, classifica, indice delle cartelle e calendario della regia
+    partita.dimentica_stanza(nome_stanza)
+    get_regia().rimuovi(nome_stanza)
+
+def avvia_ciclo_vita():
+    # [ciclo_vita] attivo = true, ttl_ore = 24, finite_dopo_minuti = 60, intervallo_minuti = 10
+    config = st.secrets.get("ciclo_vita", {})
+    if not config.get("attivo", True): return None
+    return get_ciclo_vita(
+        get_storage_stanze(),
+        ttl=float(config.get("ttl_ore", 24)) * 3600,
+        finite_dopo=float(config.get("finite_dopo_minuti", 60)) * 60,
+        intervallo=float(config.get("intervallo_minuti", 10)) * 60,
+        alla_rimozione=dimentica_stanza,
     )
 
 def load_stanza_db(nome_stanza):
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor(dictionary=True)
-        query = "SELECT dati_partita FROM stanze_tombola WHERE nome_stanza = %s"
-        cursor.execute(query, (nome_stanza,))
-        result = cursor.fetchone()
-        if result: return json.loads(result['dati_partita'])
-        return None
-    except Error as e:
+        return get_storage_stanze().carica(nome_stanza)[1]
+    except ErroreStorage as e:
         st.error(f"Errore connessione DB: {e}")
         return None
-    finally:
-        if conn and conn.is_connected(): conn.close()
 
-def save_stanza_db(nome_stanza, dati_dizionario):
-    conn = None
+def load_stanza_se_nuova(nome_stanza, versione_nota):
+    # Il blob viaggia solo se la stanza è cambiata: (versione, dati | None), (None, None) se non esiste
+    try:
+        return get_storage_stanze().carica(nome_stanza, versione_nota)
+    except ErroreStorage as e:
+        st.error(f"Errore connessione DB: {e}")
+        return versione_nota, None
+
+def load_vista_se_nuova(nome_stanza, nome_giocatore, versione_nota):
+    # Pagina giocatore: solo la sua fetta della stanza (numeri, premi, classifica, le sue cartelle)
+    try:
+        return get_storage_stanze().carica_vista(nome_stanza, nome_giocatore, versione_nota)
+    except ErroreStorage as e:
+        st.error(f"Errore connessione DB: {e}")
+        return versione_nota, None
+
+def attendi_cambio_stanza(nome_stanza, versione_nota, timeout=3.0):
+    # Long-poll: ritorna appena la versione cambia (estrazione, ingresso...) o allo scadere del timeout
+    return get_storage_stanze().attendi_cambio(nome_stanza, versione_nota, timeout)
+
+def cartelle_di(nome_stanza, dati_stanza, nome_giocatore):
+    # In sala grande le cartelle non viaggiano col blob: una lettura per sessione, poi restano in session_state
+    if not dati_stanza.get("sala"):
+        if "mie_cartelle" in dati_stanza: return dati_stanza["mie_cartelle"]
+        return dati_stanza["giocatori"].get(nome_giocatore, [])
+    chiave = (nome_stanza, dati_stanza.get("created_at"), nome_giocatore)
+    if st.session_state.get("mie_cartelle_chiave") != chiave:
+        try:
+            st.session_state.mie_cartelle = get_storage_stanze().cartelle_giocatore(nome_stanza, nome_giocatore) or []
+        except ErroreStorage as e:
+            st.error(f"Errore connessione DB: {e}")
+            return []
+        st.session_state.mie_cartelle_chiave = chiave
+    return st.session_state.mie_cartelle
+
+def applica_a_stanza(nome_stanza, *eventi):
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        json_data = json.dumps(dati_dizionario)
-        query = """
-        INSERT INTO stanze_tombola (nome_stanza, dati_partita)
-        VALUES (%s, %s)
-        ON DUPLICATE KEY UPDATE dati_partita = %s
-        """
-        cursor.execute(query, (nome_stanza, json_data, json_data))
-        conn.commit()
-    except Error as e:
+        return partita.applica_a_stanza(get_storage_stanze(), nome_stanza, *eventi)
+    except ErroreStorage as e:
         st.error(f"Errore salvataggio DB: {e}")
-    finally:
-        if conn and conn.is_connected(): conn.close()
+        return None, None
 
 def delete_stanza_db(nome_stanza):
-    conn = None
     try:
-        conn = get_connection()
-        cursor = conn.cursor()
-        query = "DELETE FROM stanze_tombola WHERE nome_stanza = %s"
-        cursor.execute(query, (nome_stanza,))
-        conn.commit()
-    except Error as e:
+        get_storage_stanze().elimina(nome_stanza)
+    except ErroreStorage as e:
         st.error(f"Errore cancellazione DB: {e}")
-    finally:
-        if conn and conn.is_connected(): conn.close()
-
-# --- SMORFIA LOOKUP ---
-def get_smorfia_text(num):
-    return SMORFIA.get(int(num), "Rock n Roll")
 
 # --- AUDIO JS AVANZATO ---
+# Testi e lingue arrivano dal catalogo precompilato; con [audio] nei secrets le clip
+# si sintetizzano lato server una volta sola e si riprendono dalla cache.
+def get_cache_audio_config():
+    config = st.secrets.get("audio", {})
+    sintetizzatore = config.get("sintetizzatore", "browser")
+    if sintetizzatore == "browser": return None
+    return get_cache_audio(sintetizzatore, config.get("cartella", ".cache_audio"))
+
 def speak_js(text_sequence):
     if not text_sequence: return
-    
-    parts = text_sequence.split("||")
-    js_logic = "window.speechSynthesis.cancel();"
-    
-    for part in parts:
-        clean_text = part.replace("'", "\\'").strip()
-        if not clean_text: continue
-        
-        lang = 'en-GB' 
-        lower_txt = clean_text.lower()
-        
-        if clean_text.isdigit():
-            lang = 'it-IT'
-        elif any(x in lower_txt for x in ["attenzione", "ambo", "terno", "quaterna", "cinquina", "tombola", "vinto"]):
-            lang = 'it-IT'
-        elif any(hit.lower() in lower_txt for hit in LITFIBA_HITS):
-            lang = 'it-IT'
-            
-        js_logic += f"""
-        var u = new SpeechSynthesisUtterance('{clean_text}');
-        u.lang = '{lang}';
-        u.rate = 1.0;
-        window.speechSynthesis.speak(u);
-        """
-    
+    js_logic = get_catalogo().js(text_sequence)
     u_id = int(time.time() * 1000)
     js = f"""<div style="display:none" id="audio_{u_id}"></div><script>(function(){{{js_logic}}})();</script>"""
     st.components.v1.html(js, height=0, width=0)
 
-# --- GENERATORE CARTELLE ---
-class GeneratoreCartelle:
-    @staticmethod
-    def genera_matrice_3x9():
-        matrice = [[0] * 9 for _ in range(3)]
-        numeri_usati = set()
-        range_colonne = [(1, 10), (10, 20), (20, 30), (30, 40), (40, 50), (50, 60), (60, 70), (70, 80), (80, 91)]
-        for r in range(3):
-            colonne_scelte = random.sample(range(9), 5)
-            colonne_scelte.sort()
-            for c in colonne_scelte:
-                start, end = range_colonne[c]
-                while True:
-                    num = random.randint(start, end - 1)
-                    if num not in numeri_usati:
-                        matrice[r][c] = num
-                        numeri_usati.add(num)
-                        break
-        for c in range(9):
-            col_nums, row_indices = [], []
-            for r in range(3):
-                if matrice[r][c] != 0:
-                    col_nums.append(matrice[r][c])
-                    row_indices.append(r)
-            col_nums.sort()
-            for i, r_idx in enumerate(row_indices):
-                matrice[r_idx][c] = col_nums[i]
-        return matrice
-
-# --- CALCOLO MONTEPREMI ---
-def get_info_economiche(dati_stanza):
-    tot_cartelle = sum(len(c) for c in dati_stanza["giocatori"].values())
-    montepremi = tot_cartelle * COSTO_CARTELLA
-    premi_valore = {
-        2: round(montepremi * QUOTE[2]),
-        3: round(montepremi * QUOTE[3]),
-        4: round(montepremi * QUOTE[4]),
-        5: round(montepremi * QUOTE[5]),
-        15: round(montepremi * QUOTE[15])
-    }
-    return tot_cartelle, montepremi, premi_valore
-
-# --- CONTROLLO VINCITE ---
-def controlla_vincite(dati_stanza):
-    target = dati_stanza.get("obbiettivo_corrente", 2)
-    estratti = set(dati_stanza["numeri_estratti"])
-    nomi_premi = {2: "AMBO", 3: "TERNO", 4: "QUATERNA", 5: "CINQUINA", 15: "TOMBOLA"}
-    nome_premio = nomi_premi.get(target, "TOMBOLA")
-    
-    _, _, valori_premi = get_info_economiche(dati_stanza)
-    valore_totale_premio = valori_premi.get(target, 0)
-    
-    vincitori_round = []
-    nuova_vincita_trovata = False
-
-    for nome_g, cartelle in dati_stanza["giocatori"].items():
-        for cartella in cartelle:
-            punti_tot = 0
-            win = False
-            for riga in cartella:
-                punti_riga = sum(1 for n in riga if n > 0 and n in estratti)
-                punti_tot += punti_riga
-                if target <= 5 and punti_riga >= target: win = True
-            if target == 15 and punti_tot == 15: win = True
-            if win and nome_g not in vincitori_round: vincitori_round.append(nome_g)
-
-    if vincitori_round:
-        quota_cadauno = int(valore_totale_premio / len(vincitori_round)) if len(vincitori_round) > 0 else 0
-        if "classifica_vincite" not in dati_stanza: dati_stanza["classifica_vincite"] = {}
-        for vincitore in vincitori_round:
-            vecchio_saldo = dati_stanza["classifica_vincite"].get(vincitore, 0)
-            dati_stanza["classifica_vincite"][vincitore] = vecchio_saldo + quota_cadauno
-
-        testo = ", ".join(vincitori_round)
-        msg = f"Attenzione! {nome_premio} ({valore_totale_premio} totali) per {testo}!"
-        
-        if msg not in dati_stanza.get("messaggio_audio", ""):
-            dati_stanza["messaggio_audio"] += f" || {msg}"
-            dati_stanza["messaggio_toast"] = f"🏆 {msg} (+{quota_cadauno} cad.)"
-            nuova_vincita_trovata = True
-        
-        if target < 5: dati_stanza["obbiettivo_corrente"] += 1
-        elif target == 5: dati_stanza["obbiettivo_corrente"] = 15
-        else: 
-            dati_stanza["messaggio_audio"] += " || Gioco Finito!"
-            dati_stanza["gioco_finito"] = True
-            nuova_vincita_trovata = True
+def speak_audio(text_sequence, cache_audio):
+    if not text_sequence: return
+    try:
+        clip = [cache_audio.clip_annuncio(a) for a in get_catalogo().parti(text_sequence)]
+    except Exception:
+        # Sintesi non disponibile (es. niente rete per gTTS): si ripiega sulla voce del browser
+        speak_js(text_sequence)
+        return
+    sorgenti = ",".join(f"'data:audio/mpeg;base64,{base64.b64encode(c).decode()}'" for c in clip)
+    u_id = int(time.time() * 1000)
+    js = f"""<div style="display:none" id="audio_{u_id}"></div><script>(function(){{
+        var clip = [{sorgenti}], i = 0;
+        function prossima() {{ if (i < clip.length) {{ var a = new Audio(clip[i++]); a.onended = prossima; a.play(); }} }}
+        prossima();
+    }})();</script>"""
+    st.components.v1.html(js, height=0, width=0)
 
-    return dati_stanza, nuova_vincita_trovata
+# --- ESTRAZIONE (ADMIN E REGIA) ---
+# La regia chiama dal suo thread, fuori da Streamlit (niente st.secrets lì): lo storage glielo si passa
+# già risolto dal rerun che la avvia
+def estrai_numero(nome_stanza):
+    # Gli errori DB risalgono: la regia li conta e riprova, l'admin li mostra
+    return partita.estrai_numero(get_storage_stanze(), nome_stanza)
+
+def estrattore_stanza(storage):
+    return lambda nome_stanza: partita.estrai_numero(storage, nome_stanza)
+
+def estrattore_torneo(storage):
+    # Chiave "TORNEO:<nome>": in un torneo c'è quasi sempre una vincita da qualche parte,
+    # l'auto-play non si ferma e ogni stanza mostra le sue
+    def estrai(chiave):
+        estratto, _ = torneo.estrai_torneo(storage, chiave[len(torneo.PREFISSO_TORNEO):])
+        return estratto, False
+    return estrai
+
+# --- PULIZIA STANZE IN BACKGROUND (un job per processo) ---
+if "storage" in st.secrets or "mysql" in st.secrets:
+    try:
+        ciclo_vita = avvia_ciclo_vita()
+    except ErroreStorage as e:
+        ciclo_vita = None
+        st.error(f"Errore connessione DB: {e}")
+else:
+    ciclo_vita = None
 
 # --- INTERFACCIA ---
 st.markdown("<h1 class='rock-title'>🤟 TOMBOLA ROCK 🤟</h1>", unsafe_allow_html=True)
-menu = st.sidebar.radio("Menu", ["🏠 Home", "🆕 Crea Stanza (Admin)", "🎮 Entra in Stanza"])
+menu = st.sidebar.radio("Menu", ["🏠 Home", "🆕 Crea Stanza (Admin)", "🎮 Entra in Stanza", "🏟️ Torneo (Admin)"])
 
 if menu == "🏠 Home":
     st.markdown("### Benvenuti alla Tombola più Rock del Web! 🎸")
@@ -277,22 +239,17 @@ elif menu == "🆕 Crea Stanza (Admin)":
     with st.form("crea"):
         nome = st.text_input("Nome Stanza", max_chars=15).upper().strip()
         pwd = st.text_input("Password Admin", type="password")
+        sala_grande = st.checkbox(f"Modalità sala grande (oltre {MAX_GIOCATORI} giocatori)")
+        max_sala = st.number_input("Posti in sala", min_value=MAX_GIOCATORI, max_value=50000, value=2000, step=100)
         if st.form_submit_button("Crea Stanza 🎸"):
             if not nome or not pwd: st.error("Dati mancanti.")
+            elif nome.startswith(torneo.PREFISSO_TORNEO): st.error("Nome riservato ai tornei.")
             else:
-                exist = load_stanza_db(nome)
-                if exist: st.warning("Reset stanza eseguito.")
-                numeri = list(range(1, 91)); random.shuffle(numeri)
-                dati = {
-                    "admin_pwd": pwd, "created_at": str(datetime.now()),
-                    "stato": "LOBBY",
-                    "audio_attivo": True, # DEFAULT AUDIO ON
-                    "numeri_tabellone": numeri, "numeri_estratti": [],
-                    "ultimo_numero": None, "messaggio_audio": "", "messaggio_toast": "",
-                    "giocatori": {}, "classifica_vincite": {},
-                    "obbiettivo_corrente": 2, "gioco_finito": False
-                }
-                save_stanza_db(nome, dati)
+                try:
+                    _, esisteva = partita.crea_stanza(get_storage_stanze(), nome, pwd, sala_grande, max_sala)
+                    if esisteva: st.warning("Reset stanza eseguito.")
+                except ErroreStorage as e:
+                    st.error(f"Errore salvataggio DB: {e}"); st.stop()
                 st.session_state.admin_msg = f"Stanza '{nome}' creata! 🎸"
                 st.session_state.ruolo = "ADMIN"
                 st.session_state.stanza_corrente = nome
@@ -320,7 +277,7 @@ elif menu == "🎮 Entra in Stanza":
         
         if st.button("ENTRA 🤟"):
             d = load_stanza_db(inp_stanza)
-            if not d: st.error("Stanza non trovata.")
+            if not d or d.get("tipo") == "torneo": st.error("Stanza non trovata.")
             else:
                 if is_admin:
                     if pwd_in == d["admin_pwd"]:
@@ -331,38 +288,40 @@ elif menu == "🎮 Entra in Stanza":
                     else: st.error("Password errata.")
                 else:
                     if inp_nome:
-                        gia_presente = inp_nome in d["giocatori"]
-                        stato_partita = d.get("stato", "LOBBY")
-                        if not gia_presente and stato_partita != "LOBBY":
-                            st.error("🚫 Concerto già iniziato! La biglietteria è chiusa.")
-                        elif gia_presente:
-                            st.session_state.ruolo = "PLAYER"
-                            st.session_state.stanza_corrente = inp_stanza
-                            st.session_state.nome_giocatore = inp_nome
-                            st.rerun()
-                        elif inp_nome not in d["giocatori"]:
-                            if len(d["giocatori"]) >= 40: st.error("Stanza piena.")
-                            else:
-                                d["giocatori"][inp_nome] = [GeneratoreCartelle.genera_matrice_3x9() for _ in range(n_cart)]
-                                if "classifica_vincite" not in d: d["classifica_vincite"] = {}
-                                d["classifica_vincite"][inp_nome] = 0
-                                save_stanza_db(inp_stanza, d)
-                                st.session_state.ruolo = "PLAYER"
-                                st.session_state.stanza_corrente = inp_stanza
-                                st.session_state.nome_giocatore = inp_nome
-                                st.rerun()
+                        try:
+                            partita.entra_in_stanza(get_storage_stanze(), inp_stanza, inp_nome, n_cart)
+                        except MossaNonValida as e:
+                            st.error(str(e)); st.stop()
+                        except ErroreStorage as e:
+                            st.error(f"Errore salvataggio DB: {e}"); st.stop()
+                        st.session_state.ruolo = "PLAYER"
+                        st.session_state.stanza_corrente = inp_stanza
+                        st.session_state.nome_giocatore = inp_nome
+                        st.rerun()
                     else: st.error("Inserisci nome.")
     else:
         # --- GIOCO / LOBBY ---
         stanza = st.session_state.stanza_corrente
         ruolo = st.session_state.ruolo
         mio_nome = st.session_state.nome_giocatore
+        metriche.conta("rerun", stanza=stanza, ruolo=ruolo)
         
         if "admin_msg" in st.session_state:
             st.toast(st.session_state.admin_msg, icon="✅")
             del st.session_state.admin_msg
         
-        dati = load_stanza_db(stanza)
+        if ruolo == "ADMIN":
+            versione_stanza, dati = load_stanza_se_nuova(stanza, -1)
+        else:
+            # Il giocatore rilegge la sua vista solo quando la versione della stanza cambia
+            versione_nota = st.session_state.get("versione_stanza", 0) if "dati_stanza" in st.session_state else -1
+            versione, dati_nuovi = load_vista_se_nuova(stanza, mio_nome, versione_nota)
+            if versione is None:
+                st.session_state.pop("dati_stanza", None)
+            elif dati_nuovi is not None:
+                st.session_state.dati_stanza = dati_nuovi
+                st.session_state.versione_stanza = versione
+            dati = st.session_state.get("dati_stanza")
         
         if not dati:
             st.warning("⚠️ La stanza è stata chiusa dall'Admin.")
@@ -372,7 +331,16 @@ elif menu == "🎮 Entra in Stanza":
             st.stop()
 
         stato_partita = dati.get("stato", "LOBBY")
+        sala = dati.get("sala", False)
+        if sala and stato_partita == "LOBBY":
+            # In lobby gli iscritti crescono fuori dal blob: gli aggregati si leggono dal contatore della sala
+            try:
+                totali_vivi = get_storage_stanze().totali_sala(stanza)
+            except ErroreStorage:
+                totali_vivi = None
+            if totali_vivi: dati["totali"] = {"giocatori": totali_vivi["giocatori"], "cartelle": totali_vivi["cartelle"]}
         tot_c, montepremi, vals = get_info_economiche(dati)
+        mie = cartelle_di(stanza, dati, mio_nome)
         
         # --- SIDEBAR ---
         with st.sidebar:
@@ -395,21 +363,62 @@ elif menu == "🎮 Entra in Stanza":
                 st.markdown(f"<div class='prize-row'>{marker} <span style='{style_p}'>{lbl}: {val_p}</span></div>", unsafe_allow_html=True)
             
             st.divider()
-            num_p = len(dati["giocatori"])
+            num_p = conta_giocatori(dati)
             st.markdown(f"### 👥 {num_p} Presenti")
             leaderboard = dati.get("classifica_vincite", {})
-            lista_g = sorted(list(dati["giocatori"].keys()), key=lambda x: leaderboard.get(x, 0), reverse=True)
-            st.markdown("<div style='max-height: 400px; overflow-y: auto;'>", unsafe_allow_html=True)
-            for g in lista_g:
-                nc = len(dati["giocatori"][g])
-                vinto = leaderboard.get(g, 0)
-                icona = "🏆" if vinto > 0 else "👤"
-                badge = f" <span class='winner-badge'>+💰{vinto}</span>" if vinto > 0 else ""
-                style_nome = "font-weight: bold; color: #d63031;" if g == mio_nome else ""
-                st.markdown(f"<div class='player-row'>{icona} <span style='{style_nome}'>{g}</span> ({nc}) {badge}</div>", unsafe_allow_html=True)
-            st.markdown("</div>", unsafe_allow_html=True)
+            classifica = classifica_per_stanza(stanza, dati)
+            if not sala:
+                st.markdown(classifica.html(mio_nome), unsafe_allow_html=True)
+            else:
+                # Sala grande: solo i primi K, la propria posizione e un elenco a pagine su richiesta
+                top = classifica.top(10)
+                if top:
+                    st.markdown("#### 🥇 Top 10")
+                    for pos, (g, vinto) in enumerate(top, 1):
+                        style_nome = "font-weight: bold; color: #d63031;" if g == mio_nome else ""
+                        st.markdown(f"<div class='player-row'>{pos}. <span style='{style_nome}'>{g}</span> <span class='winner-badge'>+💰{vinto}</span></div>", unsafe_allow_html=True)
+                if ruolo == "PLAYER":
+                    pos, vinto = classifica.posizione(mio_nome)
+                    st.markdown(f"<div class='player-row'>📍 Tu: <b>{pos}°</b> su {num_p} ({len(mie)} cartelle) {'+💰' + str(vinto) if vinto else ''}</div>", unsafe_allow_html=True)
+                if st.toggle("🔎 Elenco giocatori", key="mostra_elenco"):
+                    cerca = st.text_input("Cerca nome", key="cerca_giocatore")
+                    pagina = st.number_input("Pagina", min_value=1, value=1, step=1, key="pagina_giocatori") - 1
+                    try:
+                        righe, trovati = get_storage_stanze().elenco_giocatori(stanza, cerca, pagina, 20)
+                    except ErroreStorage as e:
+                        st.error(f"Errore connessione DB: {e}"); righe, trovati = [], 0
+                    st.caption(f"{trovati} trovati · pagina {pagina + 1} di {max(1, -(-trovati // 20))}")
+                    for g, nc in righe:
+                        vinto = leaderboard.get(g, 0)
+                        icona = "🏆" if vinto > 0 else "👤"
+                        badge = f" <span class='winner-badge'>+💰{vinto}</span>" if vinto > 0 else ""
+                        style_nome = "font-weight: bold; color: #d63031;" if g == mio_nome else ""
+                        st.markdown(f"<div class='player-row'>{icona} <span style='{style_nome}'>{g}</span> ({nc}) {badge}</div>", unsafe_allow_html=True)
             st.divider()
 
+            if ruolo == "ADMIN":
+                stat_storage = get_storage_stanze().statistiche()
+                with st.expander(f"📊 Storage ({stat_storage['motore']})"):
+                    if "pool" in stat_storage:
+                        stat_pool = stat_storage["pool"]
+                        st.caption(f"Connessioni: {stat_pool['aperte']}/{stat_pool['dimensione']} (libere {stat_pool['libere']}, picco in uso {stat_pool['picco_in_uso']})")
+                        st.caption(f"Checkout: {stat_pool['checkout']} | Attese: {stat_pool['attese']} ({stat_pool['attesa_media_ms']} ms) | Timeout: {stat_pool['timeout']} | Riconnessioni: {stat_pool['riconnessioni']}")
+                    if "cache" in stat_storage:
+                        stat_cache = stat_storage["cache"]
+                        st.caption(f"Cache stanze: {stat_cache['stanze']} | Hit: {stat_cache['hit']} | Miss: {stat_cache['miss']} (rivalidate {stat_cache['rivalidate']}) | Hit ratio: {stat_cache['hit_ratio']}")
+                    stat_conc = stat_storage["concorrenza"]
+                    st.caption(f"Scritture condizionate: {stat_conc['aggiornamenti']} | Conflitti ritentati: {stat_conc['conflitti']} | Rinunce: {stat_conc['esauriti']}")
+                    if ciclo_vita is not None:
+                        stato_ciclo = ciclo_vita.stato()
+                        giro = stato_ciclo["ultimo_giro"]
+                        if giro:
+                            st.caption(f"Pulizia stanze: ultimo giro alle {datetime.fromtimestamp(giro['inizio']).strftime('%H:%M')} | archiviate {giro['archiviate']} | scadute {giro['scadute']} (totale {stato_ciclo['totali']['archiviate']} / {stato_ciclo['totali']['scadute']})")
+                        if stato_ciclo["totali"]["errori"]:
+                            st.caption(f"Pulizia stanze: {stato_ciclo['totali']['errori']} errori, l'ultimo: {(stato_ciclo['ultimo_errore'] or {}).get('errore', '')}")
+                if metriche.attive():
+                    with st.expander("📈 Metriche (Prometheus)"):
+                        st.code(metriche.testo_prometheus(), language="text")
+
         # --- HEADER ---
         c1, c2 = st.columns([3,1])
         c1.markdown(f"## Stanza: **{stanza}** | Utente: *{mio_nome}*")
@@ -417,6 +426,7 @@ elif menu == "🎮 Entra in Stanza":
         if ruolo == "ADMIN":
             if c2.button("🚫 CHIUDI STANZA"):
                 delete_stanza_db(stanza)
+                dimentica_stanza(stanza)
                 st.session_state.clear()
                 st.rerun()
         else:
@@ -436,7 +446,10 @@ elif menu == "🎮 Entra in Stanza":
             if 'last_audio_msg' not in st.session_state: st.session_state.last_audio_msg = ""
             if audio_attivo:
                 if msg_audio and msg_audio != st.session_state.last_audio_msg:
-                    speak_js(msg_audio); st.session_state.last_audio_msg = msg_audio
+                    cache_audio = get_cache_audio_config()
+                    if cache_audio is not None: speak_audio(msg_audio, cache_audio)
+                    else: speak_js(msg_audio)
+                    st.session_state.last_audio_msg = msg_audio
 
             # DISPLAY ULTIMO NUMERO
             if ultimo:
@@ -454,26 +467,34 @@ elif menu == "🎮 Entra in Stanza":
 
         # --- FASE 2: LOGICA ADMIN & AUTO-PLAY ---
         if stato_partita == "LOBBY":
-            if ruolo == "ADMIN":
+            if ruolo == "ADMIN" and dati.get("torneo"):
+                st.info(f"🏟️ Stanza nel torneo **{dati['torneo']}**: il via e le estrazioni li dà il torneo.")
+                st.markdown(f"<h1 style='text-align:center'>Biglietti venduti: {tot_c}</h1>", unsafe_allow_html=True)
+                attendi_cambio_stanza(stanza, versione_stanza, timeout=3)
+                st.rerun()
+            elif ruolo == "ADMIN":
                 st.info("🕒 Fase di attesa giocatori. Quando sei pronto, dai il via!")
                 st.markdown(f"<h1 style='text-align:center'>Biglietti venduti: {tot_c}</h1>", unsafe_allow_html=True)
                 if st.button("🎸 DAI IL VIA AL CONCERTO!", type="primary", use_container_width=True):
-                    dati["stato"] = "IN_CORSO"
-                    save_stanza_db(stanza, dati)
+                    try:
+                        partita.avvia_partita(get_storage_stanze(), stanza, dati)
+                    except ErroreStorage as e:
+                        st.error(f"Errore salvataggio DB: {e}"); st.stop()
                     st.rerun()
             else:
                 st.markdown(f"""
                 <div class='lobby-box'>
                     <h1>🎸 SOUNDCHECK IN CORSO...</h1>
                     <p>Attendi che l'Admin dia il via al concerto!</p>
-                    <p>Nel frattempo controlla di avere le tue {len(dati['giocatori'][mio_nome])} cartelle.</p>
+                    <p>Nel frattempo controlla di avere le tue {len(mie)} cartelle.</p>
                 </div>
                 """, unsafe_allow_html=True)
-                time.sleep(3)
+                attendi_cambio_stanza(stanza, st.session_state.versione_stanza, timeout=3)
                 st.rerun()
         
         elif stato_partita == "IN_CORSO":
             estratti = dati["numeri_estratti"]
+            maschera_estratti = maschera_numeri(estratti)
             curr_obj = dati.get("obbiettivo_corrente", 2)
             msg_toast = dati.get("messaggio_toast", "")
 
@@ -482,7 +503,34 @@ elif menu == "🎮 Entra in Stanza":
                     st.toast(msg_toast, icon="🎉"); st.session_state.last_toast = msg_toast
                     if dati.get("gioco_finito"): st.balloons()
 
-            if ruolo == "ADMIN":
+            # QUANTO MANCA AL PREMIO: i bucket li scrive chi estrae (dati["in_attesa"], parte comune della vista),
+            # la distanza del giocatore viene dalle sue cartelle: nessuna pagina giocatore ricostruisce il motore
+            if not dati.get("gioco_finito"):
+                in_attesa = dati.get("in_attesa")
+                if in_attesa is None and ruolo == "ADMIN":
+                    # Stanze estratte prima di "in_attesa": l'admin ha i dati pieni, il motore si fa da quelli
+                    try:
+                        motore = motore_per_stanza(stanza, dati, partita.carica_giocatori_di(get_storage_stanze(), stanza, dati), lettura=True)
+                    except ErroreStorage:
+                        motore = None
+                    if motore is not None: in_attesa = motore.distribuzione(curr_obj, 3)
+                testi_attesa = []
+                if in_attesa is not None:
+                    a_uno, a_due, a_tre = in_attesa
+                    testi_attesa.append(f"⏳ **{a_uno}** cartelle in attesa · {a_due} a due numeri · {a_tre} a tre")
+                if ruolo == "PLAYER":
+                    mancano = distanza_dal_premio(mie, maschera_estratti, curr_obj)
+                    if mancano: testi_attesa.append(f"la tua migliore: {'a un numero!' if mancano == 1 else f'a {mancano} numeri'}")
+                if testi_attesa: st.caption(" · ".join(testi_attesa))
+
+            usa_auto = False
+            if ruolo == "ADMIN" and dati.get("torneo"):
+                st.info(f"🏟️ Le estrazioni arrivano dal torneo **{dati['torneo']}**: premi e montepremi restano di questa stanza.")
+                audio_on = st.toggle("Audio Vocale 🔊", value=dati.get("audio_attivo", True))
+                if audio_on != dati.get("audio_attivo", True):
+                    applica_a_stanza(stanza, {"t": "set", "k": "audio_attivo", "v": audio_on})
+                    st.rerun()
+            elif ruolo == "ADMIN":
                 nomi_p = {2:"AMBO", 3:"TERNO", 4:"QUATERNA", 5:"CINQUINA", 15:"TOMBOLA"}
                 txt_obj = nomi_p.get(curr_obj, "FINE")
                 val_corr = vals.get(curr_obj, 0)
@@ -491,37 +539,35 @@ elif menu == "🎮 Entra in Stanza":
                 col_auto, col_man = st.columns(2)
                 
                 def estrai():
-                    if len(dati["numeri_tabellone"]) > 0 and not dati.get("gioco_finito"):
-                        n = dati["numeri_tabellone"].pop(0)
-                        dati["numeri_estratti"].append(n)
-                        dati["ultimo_numero"] = n
-                        smorfia = get_smorfia_text(n)
-                        dati["messaggio_audio"] = f"{n} || {smorfia}"
-                        dati["messaggio_toast"] = ""
-                        d_agg, win = controlla_vincite(dati)
-                        save_stanza_db(stanza, d_agg)
-                        return True, win
-                    return False, False
+                    try:
+                        return estrai_numero(stanza)
+                    except ErroreStorage as e:
+                        st.error(f"Errore salvataggio DB: {e}")
+                        return False, False
 
                 # LOGICA TOGGLE AUDIO
                 audio_on = st.toggle("Audio Vocale 🔊", value=dati.get("audio_attivo", True))
                 if audio_on != dati.get("audio_attivo", True):
-                    dati["audio_attivo"] = audio_on
-                    save_stanza_db(stanza, dati)
+                    applica_a_stanza(stanza, {"t": "set", "k": "audio_attivo", "v": audio_on})
                     st.rerun()
 
-                if "stato_autoplay" not in st.session_state:
-                    st.session_state.stato_autoplay = False
+                # LOGICA AUTO-PLAY: le estrazioni a tempo le fa la regia di processo, qui si mandano solo comandi
+                regia = get_regia()
+                stato_regia = regia.stato(stanza)
+                st.session_state.toggle_widget_key = stato_regia["attivo"]
+                if "slider_autoplay" not in st.session_state:
+                    st.session_state.slider_autoplay = int(stato_regia["intervallo"] or 6)
 
                 def callback_autoplay():
-                    st.session_state.stato_autoplay = st.session_state.toggle_widget_key
+                    if st.session_state.toggle_widget_key: regia.avvia(stanza, st.session_state.slider_autoplay, estrattore_stanza(get_storage_stanze()))
+                    else: regia.pausa(stanza)
+
+                def callback_intervallo():
+                    regia.imposta_intervallo(stanza, st.session_state.slider_autoplay)
 
                 with col_auto:
-                    usa_auto = st.toggle("Auto-Play 🚀", 
-                                       value=st.session_state.stato_autoplay,
-                                       key="toggle_widget_key",
-                                       on_change=callback_autoplay)
-                    tempo = st.slider("Secondi", 3, 20, 6)
+                    usa_auto = st.toggle("Auto-Play 🚀", key="toggle_widget_key", on_change=callback_autoplay)
+                    st.slider("Secondi", 3, 20, key="slider_autoplay", on_change=callback_intervallo)
                     p_bar = st.progress(0); stat = st.empty()
                 
                 with col_man:
@@ -529,39 +575,139 @@ elif menu == "🎮 Entra in Stanza":
                         succ, win = estrai()
                         if succ: st.rerun()
 
-                # LOGICA AUTO-PLAY
                 if usa_auto and not dati.get("gioco_finito"):
                     if len(dati["numeri_tabellone"]) > 0:
-                        stat.write(f"⏳ Estrazione tra {tempo} secondi...")
-                        my_bar = st.progress(0)
-                        for percent_complete in range(100):
-                            time.sleep(tempo / 100)
-                            my_bar.progress(percent_complete + 1)
-                        
-                        esito, vinta = estrai()
-                        if esito:
-                            if vinta: st.session_state.stato_autoplay = False
-                            st.rerun()
+                        restante = stato_regia["restante"]
+                        if restante is not None:
+                            stat.write(f"⏳ Estrazione tra {int(restante + 0.99)} secondi...")
+                            p_bar.progress(min(100, int(100 * (1 - restante / stato_regia["intervallo"]))))
                     else: st.warning("Fine numeri.")
+                elif stato_regia["motivo"] == "vincita":
+                    stat.write("🏆 Auto-Play in pausa dopo la vincita.")
+                elif stato_regia["motivo"].startswith("errore"):
+                    stat.write(f"⚠️ Auto-Play fermo ({stato_regia['motivo']})")
 
             # TABELLONE E CARTELLE
             with st.expander("Tabellone", expanded=True):
-                st.markdown("""<style>.g{display:grid;grid-template-columns:repeat(10,1fr);gap:2px}.c{border:1px solid #ccc;text-align:center;padding:5px;font-size:12px;background:#eee}.Ex{background:#e74c3c;color:white;font-weight:bold}</style>""", unsafe_allow_html=True)
-                h = '<div class="g">'
-                for i in range(1, 91): h+=f'<div class="c {"Ex" if i in estratti else ""}">{i}</div>'
-                st.markdown(h+'</div>', unsafe_allow_html=True)
+                st.markdown(html_tabellone(maschera_estratti), unsafe_allow_html=True)
 
             if ruolo == "PLAYER":
                 st.divider(); st.subheader("Le Tue Cartelle")
-                mie = dati["giocatori"].get(mio_nome, [])
                 cols = st.columns(3)
-                st.markdown("""<style>.ct{width:100%;border-collapse:collapse;margin-bottom:10px;background:white}.cc{border:1px solid #333;width:11%;text-align:center;height:30px;font-weight:bold}.ch{background-color:#2ecc71;color:white}.ce{background-color:#bdc3c7}</style>""", unsafe_allow_html=True)
                 for idx, m in enumerate(mie):
                     with cols[idx%3]:
-                        h = f"<b>C. {idx+1}</b><table class='ct'>"
-                        for r in m:
-                            h+="<tr>"
-                            for v in r: h+=f"<td class='cc {'ce' if v==0 else ('ch' if v in estratti else '')}'>{v if v!=0 else ''}</td>"
-                            h+="</tr>"
-                        st.markdown(h+"</table>", unsafe_allow_html=True)
-                time.sleep(3); st.rerun()
+                        st.markdown(html_cartella(m, idx, maschera_estratti), unsafe_allow_html=True)
+                attendi_cambio_stanza(stanza, st.session_state.versione_stanza, timeout=3); st.rerun()
+            elif ruolo == "ADMIN" and dati.get("torneo") and not dati.get("gioco_finito"):
+                attendi_cambio_stanza(stanza, versione_stanza, timeout=3); st.rerun()
+            elif ruolo == "ADMIN" and usa_auto:
+                # La regia estrae in background: si aggiorna la pagina appena la stanza cambia (o ogni secondo per la barra)
+                attendi_cambio_stanza(stanza, versione_stanza, timeout=1); st.rerun()
+
+elif menu == "🏟️ Torneo (Admin)":
+    # Un tabellone per tante stanze: il torneo estrae, ogni stanza paga i suoi premi
+    if "torneo_corrente" not in st.session_state:
+        st.header("Torneo (Admin)")
+        with st.form("torneo"):
+            nome = st.text_input("Nome Torneo", max_chars=15).upper().strip()
+            pwd = st.text_input("Password Admin", type="password")
+            nuovo = st.checkbox("Crea un nuovo torneo")
+            if st.form_submit_button("Vai 🏟️"):
+                if not nome or not pwd: st.error("Dati mancanti.")
+                else:
+                    try:
+                        if nuovo:
+                            _, esisteva = torneo.crea_torneo(get_storage_stanze(), nome, pwd)
+                            if esisteva: st.warning("Reset torneo eseguito.")
+                        elif torneo.carica_torneo(get_storage_stanze(), nome)["admin_pwd"] != pwd:
+                            st.error("Password errata."); st.stop()
+                    except MossaNonValida as e:
+                        st.error(str(e)); st.stop()
+                    except ErroreStorage as e:
+                        st.error(f"Errore salvataggio DB: {e}"); st.stop()
+                    st.session_state.torneo_corrente = nome
+                    st.rerun()
+    else:
+        nome_torneo = st.session_state.torneo_corrente
+        chiave = torneo.chiave_torneo(nome_torneo)
+        storage = get_storage_stanze()
+        try:
+            versione_torneo, dati_torneo = storage.carica(chiave)
+        except ErroreStorage as e:
+            st.error(f"Errore connessione DB: {e}"); st.stop()
+        c1, c2 = st.columns([3,1])
+        c1.markdown(f"## Torneo: **{nome_torneo}**")
+        if c2.button("🚪 Esci"):
+            del st.session_state.torneo_corrente
+            st.rerun()
+        if not dati_torneo:
+            st.warning("⚠️ Torneo non trovato.")
+            st.stop()
+
+        estratti = dati_torneo["numeri_estratti"]
+        regia = get_regia()
+        stato_regia = regia.stato(chiave)
+        if dati_torneo["stato"] == "LOBBY":
+            st.info("🕒 Collega le stanze (in LOBBY, senza estrazioni), poi dai il via: partono tutte insieme.")
+            with st.form("collega"):
+                nome_stanza = st.text_input("Nome Stanza").upper().strip()
+                pwd_stanza = st.text_input("Password Admin della stanza", type="password")
+                if st.form_submit_button("Collega 🔗") and nome_stanza:
+                    try:
+                        torneo.collega_stanza(storage, nome_torneo, nome_stanza, pwd_stanza)
+                    except MossaNonValida as e:
+                        st.error(str(e))
+                    except ErroreStorage as e:
+                        st.error(f"Errore salvataggio DB: {e}")
+                    else:
+                        st.rerun()
+            if st.button("🎸 DAI IL VIA AL TORNEO!", type="primary", disabled=not dati_torneo["stanze"], use_container_width=True):
+                try:
+                    torneo.avvia_torneo(storage, nome_torneo)
+                except (MossaNonValida, ErroreStorage) as e:
+                    st.error(str(e)); st.stop()
+                st.rerun()
+        else:
+            if estratti:
+                st.markdown(f"<h1 style='text-align:center'>{estratti[-1]}</h1>", unsafe_allow_html=True)
+            col_auto, col_man = st.columns(2)
+            def callback_autoplay_torneo():
+                if st.session_state.toggle_torneo: regia.avvia(chiave, st.session_state.slider_torneo, estrattore_torneo(storage))
+                else: regia.pausa(chiave)
+            st.session_state.toggle_torneo = stato_regia["attivo"]
+            if "slider_torneo" not in st.session_state:
+                st.session_state.slider_torneo = int(stato_regia["intervallo"] or 6)
+            finito = dati_torneo.get("finito") or not dati_torneo["numeri_tabellone"]
+            with col_auto:
+                usa_auto = st.toggle("Auto-Play 🚀", key="toggle_torneo", on_change=callback_autoplay_torneo, disabled=finito)
+                st.slider("Secondi", 3, 20, key="slider_torneo", on_change=lambda: regia.imposta_intervallo(chiave, st.session_state.slider_torneo))
+            with col_man:
+                if st.button("🎱 ESTRAI PER TUTTE", type="primary", disabled=usa_auto or finito):
+                    try:
+                        torneo.estrai_torneo(storage, nome_torneo)
+                    except (MossaNonValida, ErroreStorage) as e:
+                        st.error(str(e)); st.stop()
+                    st.rerun()
+                if st.button("🔁 Riallinea stanze"):
+                    torneo.allinea_torneo(storage, nome_torneo, torneo=dati_torneo)
+                    st.rerun()
+            giro = torneo.ultimo_giro(nome_torneo)
+            if giro:
+                st.caption(f"Ultimo giro: {giro['stanze']} stanze in {int(giro['durata_s'] * 1000)} ms · aggiornate {giro['aggiornate']} · "
+                           f"in ritardo {giro['in_ritardo'] + giro['saltate']} · vincite {giro['vincite']} · finite {giro['finite']} · errori {giro['errori']}")
+                if giro["ultimo_errore"]: st.caption(f"⚠️ {giro['ultimo_errore']}")
+            if finito: st.success("🏁 Torneo concluso.")
+            with st.expander("Tabellone", expanded=False):
+                st.markdown(html_tabellone(maschera_numeri(estratti)), unsafe_allow_html=True)
+
+        st.markdown(f"### 🔗 {len(dati_torneo['stanze'])} Stanze")
+        for nome_stanza in dati_torneo["stanze"]:
+            d = load_stanza_db(nome_stanza)
+            if not d:
+                st.markdown(f"<div class='player-row'>❌ {nome_stanza} (chiusa)</div>", unsafe_allow_html=True)
+                continue
+            tot_c, montepremi, _ = get_info_economiche(d)
+            stato_s = "🏁 finita" if d.get("gioco_finito") else f"{len(d['numeri_estratti'])}/{len(estratti)} estratti"
+            st.markdown(f"<div class='player-row'>🎸 <b>{nome_stanza}</b> · {conta_giocatori(d)} giocatori · {tot_c} cartelle · 💰 {montepremi} · {stato_s}</div>", unsafe_allow_html=True)
+        if dati_torneo["stato"] == "IN_CORSO" and usa_auto:
+            attendi_cambio_stanza(chiave, versione_torneo, timeout=1); st.rerun()
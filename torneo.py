@@ -0,0 +1,233 @@
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait
+from datetime import datetime
+
+from tombola_core import MossaNonValida, applica_evento
+from partita import avvia_partita, estrazione_stanza
+from indice_cartelle import allinea_stanza as allinea_indice, allinea_sala, unisci_al_torneo, indice_per, dimentica_ambito
+import metriche
+
+# --- TORNEO: UNA SEQUENZA DI ESTRAZIONI PER TANTE STANZE ---
+# Il torneo è una riga come le stanze (chiave "TORNEO:<nome>") che possiede il tabellone. Collegare una stanza
+# in LOBBY le copia quel tabellone: da lì le estrazioni le decide solo il torneo. A ogni numero il torneo
+# avanza con una scrittura condizionata, poi ogni stanza collegata viene riallineata in un pool di thread:
+# si applicano, con il suo motore vincite, tutti i numeri del torneo che ancora non ha. Ogni stanza tiene
+# montepremi e premi suoi (get_info_economiche sui suoi giocatori), come una partita normale.
+# Il giro aspetta le stanze al massimo SCADENZA_GIRO secondi: quelle più lente finiscono in background e
+# recuperano i numeri mancanti al giro dopo, così la latenza di un'estrazione non cresce col numero di stanze.
+# Thread e non processi: il motore vincite di ogni stanza vive nel registro di questo processo, e il
+# tempo di un riallineamento è quasi tutto attesa sul DB.
+
+PREFISSO_TORNEO = "TORNEO:"
+MAX_THREAD_TORNEO = 16
+SCADENZA_GIRO = 2.0
+RINFRESCO_INDICE = 2.0
+
+def chiave_torneo(nome_torneo):
+    return PREFISSO_TORNEO + nome_torneo
+
+def nuovo_torneo(admin_pwd):
+    numeri = list(range(1, 91)); random.shuffle(numeri)
+    # Niente "giocatori" né "gioco_finito": il ciclo di vita lo tratta come una stanza da far scadere
+    return {
+        "tipo": "torneo", "admin_pwd": admin_pwd, "created_at": str(datetime.now()),
+        "stato": "LOBBY", "numeri_tabellone": numeri, "numeri_estratti": [], "ultimo_numero": None,
+        "stanze": [], "finito": False
+    }
+
+def crea_torneo(storage, nome_torneo, admin_pwd):
+    # -> (dati, esisteva): un torneo con lo stesso nome viene azzerato (le stanze già collegate restano com'erano)
+    chiave = chiave_torneo(nome_torneo)
+    esisteva = storage.carica(chiave)[1] is not None
+    dati = nuovo_torneo(admin_pwd)
+    dimentica_torneo(nome_torneo)
+    if storage.persistenza_eventi:
+        storage.registra(chiave, dati, {"t": "creazione", "created_at": dati["created_at"], "tabellone": dati["numeri_tabellone"]})
+    storage.salva(chiave, dati)
+    return dati, esisteva
+
+def carica_torneo(storage, nome_torneo):
+    dati = storage.carica(chiave_torneo(nome_torneo))[1]
+    if not dati or dati.get("tipo") != "torneo": raise MossaNonValida("Torneo non trovato.")
+    return dati
+
+def _set(dati, **valori):
+    eventi = [{"t": "set", "k": k, "v": v} for k, v in valori.items()]
+    for evento in eventi: applica_evento(dati, evento)
+    return eventi
+
+def collega_stanza(storage, nome_torneo, nome_stanza, admin_pwd_stanza):
+    # La stanza deve essere in LOBBY e senza estrazioni; il torneo non ancora partito
+    torneo = carica_torneo(storage, nome_torneo)
+    if torneo["stato"] != "LOBBY": raise MossaNonValida("Il torneo è già iniziato.")
+    # Le cartelle delle altre stanze nell'indice del torneo: nessuna cartella uguale tra due stanze
+    allinea_indice_torneo(storage, nome_torneo, rinfresco=0, torneo=torneo)
+    def collega(dati):
+        if dati.get("tipo") == "torneo": raise MossaNonValida("Stanza non trovata.")
+        if dati["admin_pwd"] != admin_pwd_stanza: raise MossaNonValida("Password admin della stanza errata.")
+        if dati.get("torneo") not in (None, nome_torneo): raise MossaNonValida(f"Stanza già nel torneo {dati['torneo']}.")
+        if dati.get("stato") != "LOBBY" or dati["numeri_estratti"]: raise MossaNonValida("La stanza ha già iniziato a giocare.")
+        if dati.get("torneo") == nome_torneo and dati["numeri_tabellone"] == torneo["numeri_tabellone"]: return []
+        eventi = unisci_al_torneo(nome_torneo, nome_stanza, dati, storage)
+        for evento in eventi: applica_evento(dati, evento)
+        return eventi + _set(dati, torneo=nome_torneo, numeri_tabellone=list(torneo["numeri_tabellone"]))
+    if storage.aggiorna(nome_stanza, collega)[0] is None: raise MossaNonValida("Stanza non trovata.")
+    def aggiungi(dati):
+        if dati["stato"] != "LOBBY": raise MossaNonValida("Il torneo è già iniziato.")
+        if nome_stanza in dati["stanze"]: return []
+        return _set(dati, stanze=dati["stanze"] + [nome_stanza])
+    storage.aggiorna(chiave_torneo(nome_torneo), aggiungi)
+
+def allinea_indice_torneo(storage, nome_torneo, rinfresco=RINFRESCO_INDICE, torneo=None):
+    # Le cartelle di tutte le stanze collegate nell'indice del torneo: sempre a indice freddo,
+    # poi al più ogni `rinfresco` secondi. Ogni stanza si ricarica solo se la sua firma è cambiata
+    # (in sala grande anche se ha più cartelle iscritte di quelle che l'indice conosce)
+    indice = indice_per(("torneo", nome_torneo))
+    if not indice.da_rinfrescare(rinfresco): return indice
+    if torneo is None: torneo = storage.carica(chiave_torneo(nome_torneo))[1]
+    if not torneo or torneo.get("tipo") != "torneo": return indice
+    for nome_stanza in torneo["stanze"]:
+        dati = storage.carica(nome_stanza)[1]
+        if not dati or dati.get("torneo") != nome_torneo: continue
+        if dati.get("sala"): allinea_sala(storage, nome_stanza, dati, indice)
+        else: allinea_indice(nome_stanza, dati, indice)
+    indice.rinfrescato()
+    return indice
+
+def avvia_torneo(storage, nome_torneo):
+    def avvio(dati):
+        if dati["stato"] != "LOBBY": return []
+        return _set(dati, stato="IN_CORSO")
+    _, torneo = storage.aggiorna(chiave_torneo(nome_torneo), avvio)
+    if torneo is None: raise MossaNonValida("Torneo non trovato.")
+    # Le stanze partono insieme al torneo (in sala grande si chiude la biglietteria)
+    for nome_stanza in torneo["stanze"]:
+        dati = storage.carica(nome_stanza)[1]
+        if dati and dati.get("torneo") == nome_torneo and dati.get("stato") == "LOBBY":
+            avvia_partita(storage, nome_stanza, dati)
+    return torneo
+
+# --- RIALLINEAMENTO DELLE STANZE ---
+_IN_VOLO = {}            # (torneo, stanza) -> ultimo Future lanciato per la stanza
+_ULTIMO_GIRO = {}        # torneo -> esito dell'ultimo giro
+_ESTRATTI = {}           # torneo -> estrazioni più recenti viste in questo processo
+_LOCK = threading.RLock()    # add_done_callback può richiamare _concluso subito, con il lock già preso
+_ESECUTORE = None
+
+def _esecutore():
+    global _ESECUTORE
+    with _LOCK:
+        if _ESECUTORE is None:
+            _ESECUTORE = ThreadPoolExecutor(max_workers=MAX_THREAD_TORNEO, thread_name_prefix="torneo")
+        return _ESECUTORE
+
+def allinea_stanza(storage, nome_torneo, nome_stanza, estratti):
+    # Idempotente: applica solo i numeri del torneo che la stanza non ha ancora, nello stesso ordine
+    esito = {"applicati": 0, "vincite": 0, "finita": False, "mancante": False}
+    def allinea(dati):
+        esito.update(applicati=0, vincite=0, finita=bool(dati.get("gioco_finito")))
+        if dati.get("torneo") != nome_torneo or dati.get("stato") != "IN_CORSO" or dati.get("gioco_finito"): return []
+        fatti = len(dati["numeri_estratti"])
+        if dati["numeri_estratti"] != estratti[:fatti]:
+            raise MossaNonValida(f"La stanza {nome_stanza} ha estrazioni diverse dal torneo.")
+        eventi = []
+        for n in estratti[fatti:]:
+            nuovi, win = estrazione_stanza(storage, nome_stanza, dati, n)
+            eventi += nuovi
+            esito["applicati"] += 1
+            esito["vincite"] += win
+            if dati.get("gioco_finito"): break
+        esito["finita"] = bool(dati.get("gioco_finito"))
+        return eventi
+    if storage.aggiorna(nome_stanza, allinea)[0] is None: esito["mancante"] = True
+    if esito["applicati"]: metriche.conta("estrazioni", esito["applicati"], stanza=nome_stanza)
+    return esito
+
+def allinea_torneo(storage, nome_torneo, scadenza=SCADENZA_GIRO, torneo=None):
+    # Un giro su tutte le stanze collegate: -> esito del giro (anche in _ULTIMO_GIRO)
+    inizio = time.perf_counter()
+    if torneo is None: torneo = carica_torneo(storage, nome_torneo)
+    estratti = list(torneo["numeri_estratti"])
+    giro = {"numero": estratti[-1] if estratti else None, "estrazioni": len(estratti), "stanze": len(torneo["stanze"]),
+            "aggiornate": 0, "finite": 0, "vincite": 0, "in_ritardo": 0, "saltate": 0, "errori": 0, "ultimo_errore": ""}
+    lanciati = {}
+    with _LOCK:
+        noti = _ESTRATTI.get(nome_torneo, [])
+        if len(estratti) > len(noti) or noti[:len(estratti)] != estratti: _ESTRATTI[nome_torneo] = estratti
+        for nome_stanza in torneo["stanze"]:
+            in_volo = _IN_VOLO.get((nome_torneo, nome_stanza))
+            if in_volo is not None and not in_volo.done():
+                # Ancora al lavoro su un numero precedente: finito quello, riparte da sola con gli ultimi
+                giro["saltate"] += 1
+                continue
+            lanciati[_lancia(storage, nome_torneo, nome_stanza, estratti)] = nome_stanza
+    fatti, in_ritardo = wait(lanciati, timeout=max(0.0, scadenza - (time.perf_counter() - inizio)))
+    giro["in_ritardo"] = len(in_ritardo)
+    for futuro in fatti:
+        try:
+            esito = futuro.result()
+        except Exception as e:
+            giro["errori"] += 1
+            giro["ultimo_errore"] = f"{lanciati[futuro]}: {e}"
+            continue
+        giro["aggiornate"] += esito["applicati"] > 0
+        giro["finite"] += esito["finita"] or esito["mancante"]
+        giro["vincite"] += esito["vincite"]
+    giro["durata_s"] = round(time.perf_counter() - inizio, 4)
+    metriche.osserva("torneo_giro_secondi", giro["durata_s"], torneo=nome_torneo)
+    if giro["in_ritardo"]: metriche.conta("torneo_in_ritardo", giro["in_ritardo"], torneo=nome_torneo)
+    with _LOCK:
+        _ULTIMO_GIRO[nome_torneo] = giro
+    return giro
+
+def _lancia(storage, nome_torneo, nome_stanza, estratti):
+    chiave = (nome_torneo, nome_stanza)
+    futuro = _esecutore().submit(allinea_stanza, storage, nome_torneo, nome_stanza, estratti)
+    _IN_VOLO[chiave] = futuro
+    futuro.add_done_callback(lambda f: _concluso(f, storage, chiave, estratti))
+    return futuro
+
+def _concluso(futuro, storage, chiave, estratti):
+    # Se nel frattempo il torneo è andato avanti, la stanza si rimette subito in coda: nessun numero resta indietro
+    # anche se era l'ultimo del torneo
+    with _LOCK:
+        if _IN_VOLO.get(chiave) is not futuro: return    # già sostituito da un giro successivo
+        del _IN_VOLO[chiave]
+        ultimi = _ESTRATTI.get(chiave[0], ())
+        if futuro.cancelled() or futuro.exception() is not None: return
+        if len(ultimi) <= len(estratti) or ultimi[:len(estratti)] != estratti: return
+        esito = futuro.result()
+        if not (esito["finita"] or esito["mancante"]): _lancia(storage, chiave[0], chiave[1], ultimi)
+
+def ultimo_giro(nome_torneo):
+    with _LOCK:
+        return _ULTIMO_GIRO.get(nome_torneo)
+
+# --- ESTRAZIONE ---
+def estrai_torneo(storage, nome_torneo, scadenza=SCADENZA_GIRO):
+    # -> (estratto, giro). Il torneo avanza di un numero, poi un giro di riallineamento su tutte le stanze
+    estratto = [False]
+    def estrazione(dati):
+        estratto[0] = False
+        if dati.get("stato") != "IN_CORSO" or dati.get("finito") or not dati["numeri_tabellone"]: return []
+        n = dati["numeri_tabellone"][0]
+        estratto[0] = True
+        return _set(dati, numeri_tabellone=dati["numeri_tabellone"][1:], numeri_estratti=dati["numeri_estratti"] + [n], ultimo_numero=n)
+    _, torneo = storage.aggiorna(chiave_torneo(nome_torneo), estrazione)
+    if torneo is None: raise MossaNonValida("Torneo non trovato.")
+    if not estratto[0]: return False, None
+    metriche.conta("estrazioni_torneo", torneo=nome_torneo)
+    giro = allinea_torneo(storage, nome_torneo, scadenza, torneo)
+    if giro["stanze"] and giro["finite"] == giro["stanze"] or not torneo["numeri_tabellone"]:
+        def chiudi(dati):
+            return [] if dati.get("finito") else _set(dati, finito=True)
+        storage.aggiorna(chiave_torneo(nome_torneo), chiudi)
+    return True, giro
+
+def dimentica_torneo(nome_torneo):
+    with _LOCK:
+        _ULTIMO_GIRO.pop(nome_torneo, None)
+        _ESTRATTI.pop(nome_torneo, None)
+    dimentica_ambito(("torneo", nome_torneo))